@@ -1,71 +1,443 @@
-import cv2
-import numpy as np
+#!/usr/bin/env python3
+"""
+Synthetic OMR forms with ground truth
+Draws forms of any template in omr_config.json, either one clean form (test-image.jpg)
+or a corpus of random sheets with scan-like augmentations, written in parallel.
+
+    python generate_test_form.py                                   # clean YKS_STANDARD test-image.jpg
+    python generate_test_form.py --count 2000 --output ./corpus [--template YKS_STANDARD,LGS_STANDARD]
+                                 [--augment clean|scan|hard] [--workers 4] [--seed 0]
+
+A corpus directory gets one JPEG per sheet, truth.json (the expected reading of every
+sheet and the augmentations drawn for it) and manifest.jsonl for `standard_omr.py --batch`.
+"""
+
+import argparse
+import functools
 import json
 import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from omr_templates import config_hash
+
+
+# Blank white A4-ish canvas
+PAGE_HEIGHT, PAGE_WIDTH = 3500, 2500
+# Corner markers are black squares of 2 * MARKER_HALF px around their configured position
+MARKER_HALF = 40
+
+# Mark styles drawn instead of a solid fill: faint and light pencil, a half-filled bubble,
+# an undersized off-centre dot
+HARD_MARKS = ("faint", "light", "partial", "small")
+
+# Scan augmentations; each value is the upper bound of a per-sheet random draw:
+#   rotation     skew in degrees, either way
+#   perspective  displacement of each page corner, a share of the page width
+#   blur         Gaussian sigma (px)
+#   noise        sensor noise standard deviation (grey levels)
+#   shading      darkening ramp across the page (grey levels)
+# and per-mark rates:
+#   hard         share of marks drawn in one of HARD_MARKS
+#   multiple     share of questions and student number columns given a second mark
+#   residue      share of empty bubbles with erasure residue
+#   stray        stray pencil strokes per page, clear of the bubbles and markers
+AUGMENTATIONS = {
+    "clean": {"rotation": 0.0, "perspective": 0.0, "blur": 0.0, "noise": 0.0, "shading": 0.0,
+              "hard": 0.0, "multiple": 0.0, "residue": 0.0, "stray": 0},
+    "scan": {"rotation": 1.5, "perspective": 0.003, "blur": 1.2, "noise": 6.0, "shading": 30.0,
+             "hard": 0.03, "multiple": 0.01, "residue": 0.02, "stray": 3},
+    "hard": {"rotation": 3.0, "perspective": 0.01, "blur": 2.0, "noise": 10.0, "shading": 50.0,
+             "hard": 0.2, "multiple": 0.03, "residue": 0.05, "stray": 10}
+}
+DEFAULT_AUGMENT = "scan"
+# A rotated or skewed page is shrunk to stay this far inside the canvas
+WARP_MARGIN = 5
+
+
+def draw_mark(image: np.ndarray, cx: int, cy: int, radius: int, style: str, rng: random.Random) -> None:
+    """Draw one mark of a HARD_MARKS style into the bubble at (cx, cy)"""
+    if style == "faint":
+        level = rng.randrange(140, 175)
+        cv2.circle(image, (cx, cy), radius - 2, (level, level, level), -1)
+    elif style == "light":
+        level = rng.randrange(100, 140)
+        cv2.circle(image, (cx, cy), radius - 2, (level, level, level), -1)
+    elif style == "partial":
+        cv2.ellipse(image, (cx, cy), (radius - 2, radius - 2), rng.randrange(360), 0, rng.randrange(170, 230), (0, 0, 0), -1)
+    else:
+        # Undersized, slightly off-centre
+        cv2.circle(image, (cx + rng.randrange(-3, 4), cy + rng.randrange(-3, 4)), int(radius * 0.6), (0, 0, 0), -1)
+
+
+@functools.lru_cache(maxsize=None)
+def _disc(radius: int, thickness: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(dy, dx) offsets of the pixels cv2.circle draws around an integer centre"""
+    size = radius + max(thickness, 1) + 2
+    canvas = np.zeros((2 * size + 1, 2 * size + 1), np.uint8)
+    cv2.circle(canvas, (size, size), radius, 255, thickness)
+    dy, dx = np.nonzero(canvas)
+    return dy - size, dx - size
+
+
+def _stamp(image: np.ndarray, centres: np.ndarray, disc: Tuple[np.ndarray, np.ndarray], value=0) -> None:
+    """Draw the same disc at every (x, y) centre at once; `value` is a level or one level per centre"""
+    if not len(centres):
+        return
+    dy, dx = disc
+    ys = centres[:, 1, None] + dy
+    xs = centres[:, 0, None] + dx
+    if np.ndim(value):
+        image[ys, xs] = np.minimum(image[ys, xs], np.asarray(value, np.uint8)[:, None])
+    else:
+        image[ys, xs] = value
+
+
+class FormRenderer:
+    """
+    Sheets of one template. The printed form (border, markers, bubble rings) is drawn once;
+    a sheet stamps its marks onto a copy, a whole grid per numpy assignment.
+    """
+
+    def __init__(self, template_name: str, template: Dict):
+        self.name = template_name
+        self.template = template
+        self.markers = np.array([(m['x'], m['y']) for m in template['alignment_markers']['positions']])
+        offset = self.markers[0]
+
+        def lattice(region: Dict, rows: int, columns: int) -> np.ndarray:
+            grid = region['grid']
+            radius = grid['bubble_radius']
+            x = region['x'] + np.arange(columns) * grid['col_spacing'] + radius + offset[0]
+            y = region['y'] + np.arange(rows) * grid['row_spacing'] + radius + offset[1]
+            return np.stack(np.broadcast_arrays(x[None, :], y[:, None]), axis=-1).astype(np.intp)
+
+        # One (lines x bubbles x 2) centre array per grid, a line being one decision:
+        # a student number column, or an answer question over the grid's columns
+        number = template['regions']['student_number']
+        grid = number['grid']
+        self.grids: List[Tuple[Optional[Dict], np.ndarray, int]] = [
+            (None, lattice(number, grid['rows'], grid['columns']).swapaxes(0, 1), grid['bubble_radius'])
+        ]
+        for section in template['regions']['answers']['sections']:
+            grid = section['grid']
+            self.grids.append((section, lattice(section, section['question_count'], grid['columns']), grid['bubble_radius']))
+        self.centres = np.concatenate([centres.reshape(-1, 2) for _, centres, _ in self.grids])
+
+        image = np.full((PAGE_HEIGHT, PAGE_WIDTH), 255, np.uint8)
+        # A thin border around the entire form to help Strategy 2 (outline detection)
+        cv2.rectangle(image, (10, 10), (PAGE_WIDTH - 10, PAGE_HEIGHT - 10), 0, 2)
+        for x, y in self.markers:
+            cv2.rectangle(image, (int(x) - MARKER_HALF, int(y) - MARKER_HALF),
+                          (int(x) + MARKER_HALF, int(y) + MARKER_HALF), 0, -1)
+        for section, centres, radius in self.grids:
+            _stamp(image, centres.reshape(-1, 2), _disc(radius, 1 if section else 2))
+        self.printed = image
+
+    def fills(self, student_number: str, answers: Dict[str, List[str]]) -> List[np.ndarray]:
+        """Mark matrices (lines x bubbles, bool) of a given student number and answers"""
+        fills = [np.zeros(centres.shape[:2], bool) for _, centres, _ in self.grids]
+        for col, digit in enumerate(student_number[:len(fills[0])]):
+            fills[0][col, int(digit)] = True
+        for (section, _, _), fill in zip(self.grids[1:], fills[1:]):
+            options = section['options']
+            for row, answer in enumerate(answers[section['subject']][:len(fill)]):
+                if answer in options[:fill.shape[1]]:
+                    fill[row, options.index(answer)] = True
+        return fills
+
+    def random_fills(self, gen: np.random.Generator, blank_rate: float, multiple_rate: float) -> List[np.ndarray]:
+        """
+        Random mark matrices: one digit per student number column and one option per question,
+        a share `blank_rate` of the questions left blank and a share `multiple_rate` of all
+        lines given a second mark
+        """
+        fills = []
+        for section, centres, _ in self.grids:
+            lines, bubbles = centres.shape[:2]
+            choices = len(section['options']) if section else bubbles
+            fill = np.zeros((lines, bubbles), bool)
+            lines_index = np.arange(lines)
+            fill[lines_index, gen.integers(0, choices, lines)] = True
+            if multiple_rate:
+                doubled = lines_index[gen.random(lines) < multiple_rate]
+                fill[doubled, (fill[doubled].argmax(1) + gen.integers(1, choices, len(doubled))) % choices] = True
+            if section and blank_rate:
+                fill[gen.random(lines) < blank_rate] = False
+            fills.append(fill)
+        return fills
+
+    def truth(self, fills: List[np.ndarray]) -> Dict:
+        """
+        Expected reading of a sheet, as standard_omr.py reports it: a student number column
+        with several marks reads "?", a question with several marks reads "" like a blank one
+        """
+        def decode(fill: np.ndarray, symbols: List[str], multiple: str) -> List[str]:
+            counts = fill.sum(axis=1)
+            return [symbols[i] if n == 1 else ("" if n == 0 else multiple) for i, n in zip(fill.argmax(axis=1), counts)]
 
-def generate_synthetic_form(config_path, output_path):
+        digits = [str(d) for d in range(fills[0].shape[1])]
+        truth = {"template": self.name, "student_number": "".join(decode(fills[0], digits, "?")), "answers": {}}
+        for (section, _, _), fill in zip(self.grids[1:], fills[1:]):
+            truth["answers"][section['subject']] = decode(fill, section['options'], "")
+        return truth
+
+    def render(self, fills: List[np.ndarray], rng: Optional[random.Random] = None,
+               gen: Optional[np.random.Generator] = None, augment: Optional[Dict] = None) -> Tuple[np.ndarray, Dict]:
+        """
+        Grayscale sheet with the given marks. With `augment` (see AUGMENTATIONS), marks,
+        residue and stray strokes are drawn at the sheet's rates and the page is warped,
+        blurred, shaded and noised; returns the image and the values drawn for this sheet
+        """
+        image = self.printed.copy()
+        augment = augment or AUGMENTATIONS["clean"]
+        applied = {"hard_marks": 0, "residue": 0}
+        for (section, centres, radius), fill in zip(self.grids, fills):
+            marked = centres[fill]
+            if augment["hard"]:
+                hard = gen.random(len(marked)) < augment["hard"]
+                for cx, cy in marked[hard]:
+                    draw_mark(image, int(cx), int(cy), radius, rng.choice(HARD_MARKS), rng)
+                applied["hard_marks"] += int(hard.sum())
+                marked = marked[~hard]
+            _stamp(image, marked, _disc(radius - 2, -1))
+            if augment["residue"]:
+                empty = centres[~fill]
+                empty = empty[gen.random(len(empty)) < augment["residue"]]
+                _stamp(image, empty, _disc(radius - 2, -1), gen.integers(185, 215, len(empty)))
+                applied["residue"] += len(empty)
+        if augment["multiple"]:
+            applied["multiple"] = int(sum((fill.sum(axis=1) > 1).sum() for fill in fills))
+        if augment["stray"]:
+            applied["stray"] = self._stray_strokes(image, gen, int(gen.integers(0, augment["stray"] + 1)))
+
+        if augment["rotation"] or augment["perspective"]:
+            image, applied["rotation"], applied["perspective"] = self._warp(image, gen, augment)
+        if augment["blur"]:
+            applied["blur"] = round(float(gen.uniform(0.3, 1.0)) * augment["blur"], 2)
+            image = cv2.GaussianBlur(image, (0, 0), applied["blur"])
+        if augment["noise"] or augment["shading"]:
+            # Shading and noise in one saturating int16 add
+            applied["noise"] = round(float(gen.uniform(0.3, 1.0)) * augment["noise"], 2)
+            applied["shading"] = int(gen.integers(0, int(augment["shading"]) + 1))
+            noise = np.zeros(image.shape, np.int16)
+            if applied["noise"]:
+                cv2.setRNGSeed(int(gen.integers(1 << 31)))
+                cv2.randn(noise, 0, applied["noise"])
+            axis = int(gen.integers(2))
+            ramp = np.linspace(0, applied["shading"], image.shape[axis]).astype(np.int16)
+            noise -= ramp[:, None] if axis == 0 else ramp[None, :]
+            image = cv2.add(image, noise, dtype=cv2.CV_8U)
+        return image, applied
+
+    def _stray_strokes(self, image: np.ndarray, gen: np.random.Generator, count: int) -> int:
+        """Short pencil strokes at random points clear of every bubble and marker; returns how many"""
+        radius = max(r for _, _, r in self.grids)
+        points = np.column_stack([gen.integers(100, PAGE_WIDTH - 100, count * 4),
+                                  gen.integers(100, PAGE_HEIGHT - 100, count * 4)])
+        lengths = gen.integers(10, 60, len(points))
+        to_bubble = np.linalg.norm(points[:, None] - self.centres[None], axis=-1).min(axis=1)
+        to_marker = np.abs(points[:, None] - self.markers[None]).max(axis=-1).min(axis=1)
+        clear = (to_bubble > 2 * radius + lengths) & (to_marker > 2 * MARKER_HALF + lengths)
+        drawn = 0
+        for (x, y), length in zip(points[clear][:count], lengths[clear][:count]):
+            angle = gen.uniform(0, np.pi)
+            end = (int(x + length * np.cos(angle)), int(y + length * np.sin(angle)))
+            level = int(gen.integers(40, 120))
+            cv2.line(image, (int(x), int(y)), end, level, int(gen.integers(2, 5)))
+            drawn += 1
+        return drawn
+
+    @staticmethod
+    def _warp(image: np.ndarray, gen: np.random.Generator, augment: Dict) -> Tuple[np.ndarray, float, float]:
+        """Skew and perspective as one warp; the page is shrunk if it would leave the canvas"""
+        angle = float(gen.uniform(-1.0, 1.0)) * augment["rotation"]
+        shift = augment["perspective"] * PAGE_WIDTH
+        corners = np.float32([(0, 0), (PAGE_WIDTH, 0), (PAGE_WIDTH, PAGE_HEIGHT), (0, PAGE_HEIGHT)])
+        centre = corners.mean(axis=0)
+        theta = np.deg2rad(angle)
+        rotation = np.float32([[np.cos(theta), -np.sin(theta)], [np.sin(theta), np.cos(theta)]])
+        jitter = gen.uniform(-shift, shift, (4, 2)).astype(np.float32)
+        target = (corners - centre) @ rotation.T + jitter
+        extent = np.abs(target).max(axis=0)
+        target = target * min(1.0, *((centre - WARP_MARGIN) / extent)) + centre
+        warp = cv2.getPerspectiveTransform(corners, target.astype(np.float32))
+        image = cv2.warpPerspective(image, warp, (PAGE_WIDTH, PAGE_HEIGHT), borderValue=255)
+        return image, round(angle, 2), round(float(np.abs(jitter).max()), 1) if shift else 0.0
+
+
+class SheetGenerator:
+    """
+    Random augmented sheets of the given templates (in turn). Sheet `index` is drawn from
+    its own (seed, index) stream, so a corpus is the same whatever the number of workers.
+    """
+
+    def __init__(self, config: Dict, template_names: List[str], seed: int = 0, augment: str = DEFAULT_AUGMENT,
+                 blank_rate: float = 0.1, quality: int = 90):
+        self.renderers = [FormRenderer(name, config['templates'][name]) for name in template_names]
+        self.seed = seed
+        self.augment = AUGMENTATIONS[augment]
+        self.blank_rate = blank_rate
+        self.quality = quality
+
+    def sheet(self, index: int) -> Tuple[np.ndarray, Dict]:
+        renderer = self.renderers[index % len(self.renderers)]
+        gen = np.random.default_rng((self.seed, index))
+        rng = random.Random(int(gen.integers(1 << 62)))
+        fills = renderer.random_fills(gen, self.blank_rate, self.augment["multiple"])
+        image, applied = renderer.render(fills, rng, gen, self.augment)
+        truth = renderer.truth(fills)
+        truth["augment"] = applied
+        return image, truth
+
+    def write(self, index: int, output_dir: str) -> Dict:
+        image, truth = self.sheet(index)
+        name = f"{truth['template']}_{index:06d}.jpg"
+        if not cv2.imwrite(os.path.join(output_dir, name), image, [cv2.IMWRITE_JPEG_QUALITY, self.quality]):
+            raise OSError(f"Could not write {name}")
+        truth["image"] = name
+        return truth
+
+
+_worker_generator: Optional[SheetGenerator] = None
+_worker_output_dir = ""
+
+
+def _init_corpus_worker(config: Dict, template_names: List[str], options: Dict, output_dir: str) -> None:
+    """Pool initializer: one generator (printed forms drawn once) per worker process"""
+    global _worker_generator, _worker_output_dir
+    # One OpenCV thread per process; the pool provides the parallelism
+    cv2.setNumThreads(1)
+    _worker_generator = SheetGenerator(config, template_names, **options)
+    _worker_output_dir = output_dir
+
+
+def _write_sheet(index: int) -> Dict:
+    return _worker_generator.write(index, _worker_output_dir)
+
+
+def generate_corpus(
+    config_path: str,
+    output_dir: str,
+    count: int,
+    template_names: Optional[List[str]] = None,
+    seed: int = 0,
+    augment: str = DEFAULT_AUGMENT,
+    blank_rate: float = 0.1,
+    workers: Optional[int] = None,
+    quality: int = 90,
+    reuse: bool = False
+) -> Dict:
+    """
+    Write `count` random sheets (templates in turn, all of the config by default) to
+    `output_dir` with truth.json and manifest.jsonl, on `workers` processes (default: CPU count).
+    With `reuse`, a corpus already there with the same parameters and config is kept.
+    Returns a summary with the time taken.
+    """
+    with open(config_path, 'rb') as f:
+        raw = f.read()
+    config = json.loads(raw)
+    template_names = template_names or sorted(config['templates'])
+    unknown = sorted(set(template_names) - set(config['templates']))
+    if unknown:
+        raise ValueError(f"Unknown template(s): {', '.join(unknown)}")
+    if augment not in AUGMENTATIONS:
+        raise ValueError(f"Unknown augmentation preset: {augment}")
+    options = {"seed": seed, "augment": augment, "blank_rate": blank_rate, "quality": quality}
+    params = {"config_hash": config_hash(raw), "count": count, "templates": template_names, **options}
+    truth_path = os.path.join(output_dir, "truth.json")
+    if reuse and os.path.exists(truth_path):
+        with open(truth_path, 'r', encoding='utf-8') as f:
+            if json.load(f).get("params") == params:
+                return {"output_dir": output_dir, "forms": count, "reused": True}
+    os.makedirs(output_dir, exist_ok=True)
+
+    workers = max(1, min(workers or os.cpu_count() or 1, count))
+    started = time.perf_counter()
+    if workers == 1:
+        generator = SheetGenerator(config, template_names, **options)
+        forms = [generator.write(index, output_dir) for index in range(count)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_corpus_worker,
+                                 initargs=(config, template_names, options, output_dir)) as pool:
+            forms = list(pool.map(_write_sheet, range(count), chunksize=max(1, min(16, count // (workers * 4)))))
+    elapsed = time.perf_counter() - started
+
+    with open(os.path.join(output_dir, "manifest.jsonl"), 'w', encoding='utf-8') as f:
+        for form in forms:
+            f.write(json.dumps({"image_path": form["image"], "template_name": form["template"]}) + "\n")
+    with open(truth_path, 'w', encoding='utf-8') as f:
+        json.dump({"params": params, "forms": forms}, f, ensure_ascii=False)
+    return {
+        "output_dir": output_dir,
+        "forms": count,
+        "workers": workers,
+        "elapsed_s": round(elapsed, 3),
+        "forms_per_second": round(count / elapsed, 2) if elapsed > 0 else None
+    }
+
+
+def generate_synthetic_form(config_path, output_path, template_name='YKS_STANDARD', student_number="12345678", answers=None):
+    """
+    Draw a clean synthetic form for `template_name` and write it to `output_path`.
+    `answers` maps subject -> list of option letters ("" leaves a question blank);
+    subjects not given are filled with the first option.
+    Returns the ground truth: {"template", "student_number", "answers"}.
+    """
     with open(config_path, 'r', encoding='utf-8') as f:
         config = json.load(f)
-    
-    template = config['templates']['YKS_STANDARD']
-    
-    # Create a blank white A4-ish canvas (2500x3500)
-    height, width = 3500, 2500
-    image = np.ones((height, width, 3), dtype=np.uint8) * 255
-    
-    # Draw a thin border around the entire form to help Strategy 2 (outline detection)
-    cv2.rectangle(image, (10, 10), (width-10, height-10), (0, 0, 0), 2)
-    
-    # Draw alignment markers (black squares at corners)
-    # Increased size for better detection
-    markers = template['alignment_markers']['positions']
-    for m in markers:
-        cv2.rectangle(image, (m['x']-40, m['y']-40), (m['x']+40, m['y']+40), (0, 0, 0), -1)
-    
-    # Draw Student Number region
-    sn = template['regions']['student_number']
-    grid = sn['grid']
-    
-    # Example Student Number: 12345678
-    target_number = "12345678"
-    
-    # Calculate offset based on top-left marker
-    offset_x = markers[0]['x']
-    offset_y = markers[0]['y']
-    
-    for col in range(grid['columns']):
-        digit_to_fill = int(target_number[col]) if col < len(target_number) else -1
-        for row in range(grid['rows']):
-            cx = sn['x'] + col * grid['col_spacing'] + grid['bubble_radius'] + offset_x
-            cy = sn['y'] + row * grid['row_spacing'] + grid['bubble_radius'] + offset_y
-            
-            # Draw bubble outline
-            cv2.circle(image, (int(cx), int(cy)), grid['bubble_radius'], (0, 0, 0), 2)
-            
-            # Fill if it's our digit
-            if row == digit_to_fill:
-                cv2.circle(image, (int(cx), int(cy)), grid['bubble_radius'] - 2, (0, 0, 0), -1)
-
-    # Draw Answers region (Example: All 'A' for simplicity)
-    ans_region = template['regions']['answers']
-    for section in ans_region['sections']:
-        grid = section['grid']
-        for row in range(section['question_count']):
-            for col in range(grid['columns']):
-                cx = section['x'] + col * grid['col_spacing'] + grid['bubble_radius'] + offset_x
-                cy = section['y'] + row * grid['row_spacing'] + grid['bubble_radius'] + offset_y
-                
-                # Draw bubble
-                cv2.circle(image, (int(cx), int(cy)), grid['bubble_radius'], (0, 0, 0), 1)
-                
-                # Fill first column ('A')
-                if col == 0:
-                    cv2.circle(image, (int(cx), int(cy)), grid['bubble_radius'] - 2, (0, 0, 0), -1)
-
-    cv2.imwrite(output_path, image)
+
+    renderer = FormRenderer(template_name, config['templates'][template_name])
+    answers = answers or {}
+    truth = {}
+    for section in renderer.template['regions']['answers']['sections']:
+        marked = answers.get(section['subject'], [section['options'][0]] * section['question_count'])
+        truth[section['subject']] = list(marked)
+
+    image, _ = renderer.render(renderer.fills(student_number, truth))
+    cv2.imwrite(output_path, cv2.cvtColor(image, cv2.COLOR_GRAY2BGR))
     print(f"Synthetic form created: {output_path}")
+    return {"template": template_name, "student_number": student_number, "answers": truth}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic OMR forms with ground truth")
+    parser.add_argument("--config", default="omr_config.json")
+    parser.add_argument("--count", type=int, default=None,
+                        help="Write a corpus of COUNT random sheets (default: one clean form)")
+    parser.add_argument("--output", default=None,
+                        help="Form image (default: test-image.jpg) or corpus directory (default: ./synthetic-corpus)")
+    parser.add_argument("--template", default=None,
+                        help="Template, or comma-separated templates of a corpus (default: all of the config)")
+    parser.add_argument("--augment", choices=sorted(AUGMENTATIONS), default=DEFAULT_AUGMENT)
+    parser.add_argument("--blank-rate", type=float, default=0.1, help="Share of questions left blank")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--quality", type=int, default=90, help="JPEG quality of corpus sheets")
+    options = parser.parse_args()
+
+    if options.count is None:
+        generate_synthetic_form(options.config, options.output or "test-image.jpg", options.template or "YKS_STANDARD")
+        return 0
+
+    templates = [name.strip() for name in options.template.split(",")] if options.template else None
+    try:
+        summary = generate_corpus(
+            options.config, options.output or "synthetic-corpus", options.count, templates,
+            options.seed, options.augment, options.blank_rate, options.workers, options.quality
+        )
+    except (OSError, ValueError) as e:
+        print(json.dumps({"success": False, "error": str(e)}))
+        return 1
+    print(json.dumps({"success": True, **summary}, ensure_ascii=False))
+    return 0
+
 
 if __name__ == "__main__":
-    config_p = "omr_config.json"
-    output_p = "test-image.jpg"
-    generate_synthetic_form(config_p, output_p)
+    sys.exit(main())
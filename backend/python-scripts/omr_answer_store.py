@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped OMR answer store and item analysis
+Decoded answer sheets are appended to one flat uint8 file per subject
+(one row per sheet, one byte per question, codes as in omr_grading), so a
+whole cohort can be memory-mapped and analysed in fixed-size row chunks
+without loading the results as Python objects.
+
+    <store>/<template>/meta.json        subjects, question counts and options
+    <store>/<template>/<subject>.u8     rows x questions answer codes
+    <store>/<template>/rows.ndjson      source, page and student number per row
+
+    python omr_answer_store.py analyze <store>/YKS_STANDARD --key answer_key.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from omr_grading import BLANK, INVALID, AnswerKey, encode_answers, encode_key, iter_pages
+
+
+logger = logging.getLogger("omr")
+
+STORE_VERSION = 1
+DEFAULT_CHUNK_ROWS = 65536
+
+
+def template_layout(template) -> List[Dict]:
+    """Subjects of a CompiledTemplate in config order: name, question count and options"""
+    return [
+        {"name": section.name, "questions": section.question_count, "options": "".join(section.options)}
+        for section in template.sections
+    ]
+
+
+def _subject_file(name: str) -> str:
+    # Subject names come from the config; keep them usable as file names
+    safe = "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in name)
+    return f"{safe}.u8"
+
+
+def _count_lines(path: str) -> int:
+    """Complete (newline-terminated) lines in a file, read in chunks"""
+    if not os.path.exists(path):
+        return 0
+    count = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            count += chunk.count(b"\n")
+    return count
+
+
+def _ends_with_newline(path: str) -> bool:
+    size = os.path.getsize(path)
+    if size == 0:
+        return True
+    with open(path, 'rb') as f:
+        f.seek(size - 1)
+        return f.read(1) == b"\n"
+
+
+def _line_offset(path: str, lines: int) -> int:
+    """Byte offset just past the given number of lines"""
+    offset = 0
+    with open(path, 'rb') as f:
+        for _ in range(lines):
+            offset += len(f.readline())
+    return offset
+
+
+class AnswerStore:
+    """
+    Append-only answer matrix for one template. Opening an existing store
+    with a different layout (subjects, question counts or options) is an error,
+    since rows of different shapes cannot share a file. A sheet is stored once:
+    a page whose (source, page_index) already has a row (a batch run again, a
+    re-uploaded scan) is skipped, so it does not skew the item statistics.
+    """
+
+    def __init__(self, path: str, layout: Optional[List[Dict]] = None, template_name: Optional[str] = None):
+        self.path = path
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if layout is not None and meta["subjects"] != layout:
+                raise ValueError(f"Answer store {path} was created for a different subject layout")
+        else:
+            if layout is None:
+                raise ValueError(f"Answer store not found: {path}")
+            meta = {"version": STORE_VERSION, "template": template_name, "subjects": layout}
+            os.makedirs(path, exist_ok=True)
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False, indent=2)
+        self.meta = meta
+        self.subjects: List[Dict] = meta["subjects"]
+        self._files: Dict[str, object] = {}
+        self._rows_file = None
+        self.rows = self._recover()
+        self.skipped = 0
+        self._sheets = self._stored_sheets()
+
+    def _recover(self) -> int:
+        """
+        Row count shared by every subject file and the row index; rows
+        half-written by an interrupted append are cut off
+        """
+        counts = []
+        for subject in self.subjects:
+            path = os.path.join(self.path, _subject_file(subject["name"]))
+            counts.append(os.path.getsize(path) // subject["questions"] if os.path.exists(path) else 0)
+        index_path = os.path.join(self.path, "rows.ndjson")
+        # A last line without its newline was not finished and does not count
+        lines = _count_lines(index_path)
+        rows = min(counts + [lines])
+        for subject in self.subjects:
+            path = os.path.join(self.path, _subject_file(subject["name"]))
+            if os.path.exists(path) and os.path.getsize(path) != rows * subject["questions"]:
+                with open(path, 'r+b') as f:
+                    f.truncate(rows * subject["questions"])
+        if os.path.exists(index_path) and (lines != rows or not _ends_with_newline(index_path)):
+            end = _line_offset(index_path, rows)
+            with open(index_path, 'r+b') as f:
+                f.truncate(end)
+        if rows != max(counts + [lines]):
+            logger.warning("Answer store %s: dropped incomplete rows beyond %d", self.path, rows)
+        return rows
+
+    def _stored_sheets(self) -> Set[Tuple[str, Optional[int]]]:
+        """(source, page_index) of every row with a known source"""
+        sheets = set()
+        index_path = os.path.join(self.path, "rows.ndjson")
+        if os.path.exists(index_path):
+            with open(index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    row = json.loads(line)
+                    if row.get("source") is not None:
+                        sheets.add((row["source"], row.get("page_index")))
+        return sheets
+
+    def append(self, result: Dict, source: Optional[str] = None) -> int:
+        """
+        Append the answers of a successful result (each page of a multi-page one) that the
+        store does not hold yet; returns rows added
+        """
+        if not self._files:
+            for subject in self.subjects:
+                self._files[subject["name"]] = open(os.path.join(self.path, _subject_file(subject["name"])), 'ab')
+            self._rows_file = open(os.path.join(self.path, "rows.ndjson"), 'ab')
+        added = 0
+        for page in iter_pages([result]):
+            if not page.get("success") or not isinstance(page.get("answers"), dict):
+                continue
+            sheet = (page.get("source") or source, page.get("page_index"))
+            if sheet[0] is not None:
+                if sheet in self._sheets:
+                    self.skipped += 1
+                    logger.debug("Answer store %s already holds %s page %s", self.path, *sheet)
+                    continue
+                self._sheets.add(sheet)
+            for subject in self.subjects:
+                codes = encode_answers([page["answers"].get(subject["name"], ())], subject["questions"], subject["options"])
+                self._files[subject["name"]].write(codes.tobytes())
+            row = {
+                "source": sheet[0],
+                "page_index": sheet[1],
+                "student_number": page.get("student_number_detected")
+            }
+            # The index line is written last: it marks the row as complete
+            for f in self._files.values():
+                f.flush()
+            self._rows_file.write((json.dumps(row, ensure_ascii=False) + "\n").encode("utf-8"))
+            self._rows_file.flush()
+            self.rows += 1
+            added += 1
+        return added
+
+    def close(self) -> None:
+        for f in self._files.values():
+            f.close()
+        if self._rows_file is not None:
+            self._rows_file.close()
+        self._files = {}
+        self._rows_file = None
+
+    def matrix(self, subject: str) -> np.ndarray:
+        """Read-only memory map of one subject's (rows x questions) answer codes"""
+        spec = next((s for s in self.subjects if s["name"] == subject), None)
+        if spec is None:
+            raise ValueError(f"Unknown subject: {subject}")
+        if self.rows == 0:
+            return np.zeros((0, spec["questions"]), dtype=np.uint8)
+        return np.memmap(os.path.join(self.path, _subject_file(subject)), dtype=np.uint8, mode='r',
+                         shape=(self.rows, spec["questions"]))
+
+    def iter_chunks(self, subject: str, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[np.ndarray]:
+        matrix = self.matrix(subject)
+        for start in range(0, self.rows, chunk_rows):
+            yield np.asarray(matrix[start:start + chunk_rows])
+
+
+def item_analysis(store: AnswerStore, answer_key: Optional[AnswerKey] = None,
+                  chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Dict:
+    """
+    Per-question statistics over every sheet in the store, in one pass per subject
+    over memory-mapped row chunks (memory use is bounded by chunk_rows).
+
+    Always: option (distractor) frequencies, blank and invalid (not an option) rates.
+    With an answer key for the subject:
+      difficulty      share of sheets answering correctly (the item's p-value)
+      discrimination  point-biserial correlation between answering the item correctly
+                      and the rest of the subject score (correct answers on the other items)
+    """
+    report = {"template": store.meta.get("template"), "sheets": store.rows, "subjects": {}}
+    for subject in store.subjects:
+        name, questions, options = subject["name"], subject["questions"], subject["options"]
+        key = None
+        if answer_key and name in answer_key:
+            key = encode_key(answer_key[name], options)
+            if len(key) != questions:
+                raise ValueError(f"Answer key for {name} has {len(key)} answers, the store has {questions} questions")
+
+        # Per-code counts: 0 = blank, 1..len(options), and the invalid code folded into the last column
+        frequencies = np.zeros((questions, len(options) + 2), dtype=np.int64)
+        n = 0
+        sum_x = np.zeros(questions, dtype=np.float64)
+        sum_xt = np.zeros(questions, dtype=np.float64)
+        sum_t = 0.0
+        sum_t2 = 0.0
+        for chunk in store.iter_chunks(name, chunk_rows):
+            folded = np.where(chunk == INVALID, len(options) + 1, chunk).astype(np.intp)
+            offsets = folded + np.arange(questions)[None, :] * (len(options) + 2)
+            frequencies += np.bincount(offsets.ravel(), minlength=frequencies.size).reshape(frequencies.shape)
+            n += len(chunk)
+            if key is not None:
+                correct = ((chunk == key) & (key != BLANK)).astype(np.float64)
+                totals = correct.sum(axis=1)
+                sum_x += correct.sum(axis=0)
+                sum_xt += totals @ correct
+                sum_t += totals.sum()
+                sum_t2 += (totals * totals).sum()
+
+        items = []
+        for q in range(questions):
+            counts = frequencies[q]
+            item = {
+                "question": q + 1,
+                "blank_rate": round(int(counts[BLANK]) / n, 4) if n else None,
+                "invalid_rate": round(int(counts[-1]) / n, 4) if n else None,
+                "options": {option: round(int(counts[i + 1]) / n, 4) if n else None for i, option in enumerate(options)}
+            }
+            if key is not None:
+                item["key"] = options[key[q] - 1] if key[q] != BLANK else None
+                item.update(_item_statistics(n, sum_x[q], sum_xt[q], sum_t, sum_t2) if key[q] != BLANK
+                            else {"difficulty": None, "discrimination": None})
+            items.append(item)
+        report["subjects"][name] = {"questions": questions, "items": items}
+    return report
+
+
+def _item_statistics(n: int, sum_x: float, sum_xt: float, sum_t: float, sum_t2: float) -> Dict:
+    """Difficulty and corrected point-biserial from running sums (x = item 0/1, t = subject total)"""
+    if n == 0:
+        return {"difficulty": None, "discrimination": None}
+    p = sum_x / n
+    # Rest score r = t - x; x * x == x for a 0/1 item
+    sum_r = sum_t - sum_x
+    sum_r2 = sum_t2 - 2 * sum_xt + sum_x
+    sum_xr = sum_xt - sum_x
+    cov = sum_xr / n - p * (sum_r / n)
+    var_x = p * (1 - p)
+    var_r = sum_r2 / n - (sum_r / n) ** 2
+    discrimination = None
+    if var_x > 0 and var_r > 1e-12:
+        discrimination = round(float(cov / np.sqrt(var_x * var_r)), 4)
+    return {"difficulty": round(float(p), 4), "discrimination": discrimination}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OMR answer store tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    analyze = sub.add_parser("analyze", help="Item statistics for one template's store")
+    analyze.add_argument("store", help="Store directory of one template, e.g. answers/YKS_STANDARD")
+    analyze.add_argument("--key", default=None, help="Answer key JSON (difficulty and discrimination need it)")
+    analyze.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    info = sub.add_parser("info", help="Layout and row count of a store")
+    info.add_argument("store")
+    options = parser.parse_args()
+
+    try:
+        store = AnswerStore(options.store)
+        if options.command == "info":
+            print(json.dumps({"success": True, "rows": store.rows, **store.meta}, ensure_ascii=False))
+            return
+        answer_key = None
+        if options.key:
+            with open(options.key, 'r', encoding='utf-8') as f:
+                answer_key = json.load(f)
+        report = item_analysis(store, answer_key, options.chunk_rows)
+    except (OSError, ValueError) as e:
+        print(json.dumps({"success": False, "error": str(e)}))
+        sys.exit(1)
+    print(json.dumps({"success": True, **report}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
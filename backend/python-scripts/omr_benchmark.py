@@ -0,0 +1,819 @@
+#!/usr/bin/env python3
+"""
+OMR benchmarks
+Measures standard_omr.py stages on real or synthetic scans and prints
+machine-readable JSON so runs can be compared across commits.
+
+    python omr_benchmark.py alignment [images...] [--repeat N]
+    python omr_benchmark.py detect [--forms-per-template N] [--repeat N]
+    python omr_benchmark.py memory [--forms-per-template N] [--output-policy none|full|...]
+    python omr_benchmark.py suite [--forms-per-template N] [--modes inprocess,single,worker,batch] [--save baseline.json]
+    python omr_benchmark.py compare baseline.json current.json [--tolerance 0.1]
+    python omr_benchmark.py cascade [--forms-per-template N] [--augment hard]
+    python omr_benchmark.py video [--forms-per-template N] [--template YKS_STANDARD]
+"""
+
+import argparse
+import dataclasses
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from generate_test_form import AUGMENTATIONS, generate_corpus
+from omr_output import OUTPUT_POLICIES, OutputWriter
+from omr_templates import config_hash
+from omr_video import VideoReader
+from standard_omr import DEFAULT_CONFIG_PATH, OMRProcessor
+
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+OMR_SCRIPT = os.path.join(SCRIPT_DIR, "standard_omr.py")
+
+# Bump when the suite report layout changes
+SUITE_FORMAT = 1
+SUITE_MODES = ("inprocess", "single", "worker", "batch")
+# Child process RSS high-water marks are read from /proc this often
+RSS_SAMPLE_INTERVAL = 0.01
+
+
+def _time_ms(fn, repeat: int):
+    """Run fn `repeat` times; return (last result, list of durations in ms)"""
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        durations.append((time.perf_counter() - start) * 1000.0)
+    return result, durations
+
+
+def _untruncated_centres(processor: OMRProcessor, blurred: np.ndarray, corners: np.ndarray) -> np.ndarray:
+    """Float centroids of the full-resolution marker contours nearest the given corners"""
+    thresh = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)[1]
+    thresh = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5)))
+    centres = np.array([(x, y) for x, y, _ in processor.marker_candidates(thresh, 50, 10000)], dtype=np.float32)
+    nearest = [centres[np.argmin(np.linalg.norm(centres - c, axis=1))] for c in corners]
+    return np.array(nearest, dtype=np.float32)
+
+
+def bench_alignment(processor: OMRProcessor, images: List[str], template_name: str, repeat: int) -> Dict:
+    """
+    Compare the coarse-to-fine marker search with the full-resolution contour search:
+    median time per scan and per-corner deviation between the two results.
+    """
+    template = processor.get_template(template_name)
+    rows = []
+    for path in images:
+        image = cv2.imread(path)
+        if image is None:
+            rows.append({"image": path, "error": "Failed to load image"})
+            continue
+        blurred = processor.blur_page(image, template)
+
+        full, full_ms = _time_ms(lambda: processor.find_markers_full(blurred), repeat)
+        pyramid, pyramid_ms = _time_ms(lambda: processor.find_markers_pyramid(blurred, template), repeat)
+
+        row = {
+            "image": path,
+            "full_method": full[1],
+            "full_ms": round(statistics.median(full_ms), 3),
+            "pyramid_ms": round(statistics.median(pyramid_ms), 3),
+            "pyramid_found": pyramid is not None
+        }
+        if full[0] is not None and pyramid is not None:
+            # The full-resolution search truncates centres to whole pixels; compare against
+            # the un-truncated centroid of the same contours
+            reference = processor.order_points(full[0])
+            if full[1] == "contours":
+                reference = _untruncated_centres(processor, blurred, reference)
+            deviation = np.linalg.norm(reference - processor.order_points(pyramid), axis=1)
+            row["speedup"] = round(row["full_ms"] / row["pyramid_ms"], 2) if row["pyramid_ms"] else None
+            row["max_deviation_px"] = round(float(deviation.max()), 3)
+            row["mean_deviation_px"] = round(float(deviation.mean()), 3)
+        rows.append(row)
+
+    timed = [r for r in rows if "speedup" in r]
+    return {
+        "benchmark": "alignment",
+        "template": template_name,
+        "repeat": repeat,
+        "images": rows,
+        "summary": {
+            "median_speedup": round(statistics.median(r["speedup"] for r in timed), 2) if timed else None,
+            "max_deviation_px": max((r["max_deviation_px"] for r in timed), default=None)
+        }
+    }
+
+
+def bench_detect(processor: OMRProcessor, corpus_dir: str, forms: List[Dict], repeat: int) -> Dict:
+    """
+    Template recognition on a synthetic corpus of every template: share of pages
+    recognised as the template they were generated from, median time per page,
+    and the score margin between the chosen and the runner-up template.
+    """
+    first = next(iter(processor.templates.values()))
+    rows = []
+    for form in forms:
+        image = cv2.imread(os.path.join(corpus_dir, form["image"]))
+        if image is None:
+            rows.append({"image": form["image"], "error": "Failed to load image"})
+            continue
+        blurred = processor.blur_page(image, first)
+        (name, detection, _), durations = _time_ms(lambda: processor.detect_template(image, blurred), repeat)
+        ranked = sorted(detection["scores"].values(), reverse=True)
+        rows.append({
+            "image": form["image"],
+            "expected": form["template"],
+            "detected": name,
+            "correct": name == form["template"],
+            "margin": round(ranked[0] - ranked[1], 4) if len(ranked) > 1 else None,
+            "ms": round(statistics.median(durations), 3)
+        })
+
+    timed = [r for r in rows if "ms" in r]
+    margins = [r["margin"] for r in timed if r["margin"] is not None]
+    return {
+        "benchmark": "detect",
+        "repeat": repeat,
+        "images": rows,
+        "summary": {
+            "pages": len(timed),
+            "accuracy": round(sum(r["correct"] for r in timed) / len(timed), 4) if timed else None,
+            "median_ms": round(statistics.median(r["ms"] for r in timed), 3) if timed else None,
+            "min_margin": min(margins, default=None)
+        }
+    }
+
+
+def _percentiles(values: List[float]) -> Optional[Dict[str, float]]:
+    if not values:
+        return None
+    p50, p95, p99 = np.percentile(np.asarray(values, dtype=np.float64), [50, 95, 99])
+    return {"p50": round(float(p50), 3), "p95": round(float(p95), 3), "p99": round(float(p99), 3), "max": round(max(values), 3)}
+
+
+def _rss_mb(kilobytes: float) -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return round(kilobytes / (1024.0 * 1024.0 if sys.platform == "darwin" else 1024.0), 1)
+
+
+def _vm_hwm_kb(pid) -> Optional[int]:
+    """Peak RSS of a live process in kB (VmHWM); None once it has exited or without /proc"""
+    try:
+        with open(f"/proc/{pid}/status", 'r') as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _reset_self_peak_rss() -> None:
+    """Restart this process's VmHWM (Linux), so the corpus build and earlier modes are not counted"""
+    try:
+        with open("/proc/self/clear_refs", 'w') as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _self_peak_rss_mb() -> Optional[float]:
+    kilobytes = _vm_hwm_kb("self")
+    if kilobytes is not None:
+        return round(kilobytes / 1024.0, 1)
+    if resource is None:
+        return None
+    return _rss_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+class PeakRssSampler:
+    """
+    Peak RSS of a child process tree (its largest process), from the VmHWM of the child and
+    its descendants polled in /proc while it runs. ru_maxrss from wait4() is no use here:
+    a child forked from the benchmark keeps the benchmark's own peak across exec. Growth in
+    the last RSS_SAMPLE_INTERVAL of a process's life is missed; None without /proc.
+    """
+
+    def __init__(self, pid: int, interval: float = RSS_SAMPLE_INTERVAL):
+        self.pid = pid
+        self.interval = interval
+        self.peaks: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _tree(self) -> List[int]:
+        pids = [self.pid]
+        for pid in pids:
+            try:
+                tasks = os.listdir(f"/proc/{pid}/task")
+            except OSError:
+                continue
+            for task in tasks:
+                try:
+                    with open(f"/proc/{pid}/task/{task}/children", 'r') as f:
+                        pids.extend(int(child) for child in f.read().split())
+                except OSError:
+                    pass
+        return pids
+
+    def sample(self) -> None:
+        for pid in self._tree():
+            kilobytes = _vm_hwm_kb(pid)
+            if kilobytes is not None:
+                with self._lock:
+                    self.peaks[pid] = max(self.peaks.get(pid, 0), kilobytes)
+
+    def _run(self) -> None:
+        self.sample()
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+    def stop(self) -> Optional[float]:
+        """Stop polling and return the peak in MB"""
+        self._stopped.set()
+        self._thread.join()
+        return round(max(self.peaks.values()) / 1024.0, 1) if self.peaks else None
+
+
+def build_corpus(config_path: str, corpus_dir: str, per_template: int, seed: int, blank_rate: float = 0.1,
+                 augment: str = "clean") -> List[Dict]:
+    """
+    `per_template` random forms of every template in the config, drawn with an augmentation
+    preset by generate_test_form.generate_corpus (ground truth in <corpus_dir>/truth.json,
+    manifest.jsonl for batch mode). An existing corpus with the same parameters and config is reused.
+    """
+    with open(config_path, 'r', encoding='utf-8') as f:
+        templates = sorted(json.load(f)['templates'])
+    generate_corpus(config_path, corpus_dir, per_template * len(templates), templates, seed, augment, blank_rate,
+                    reuse=True)
+    with open(os.path.join(corpus_dir, "truth.json"), 'r', encoding='utf-8') as f:
+        return json.load(f)["forms"]
+
+
+def score_form(truth: Dict, result: Dict, config: Dict) -> Dict[str, int]:
+    """
+    Compare a result with its ground truth.
+    Bubble counts are derived from the decoded marks: a wrong answer costs two bubbles
+    (the missed one and the false one), a missed or spurious mark one.
+    """
+    template = config['templates'][truth["template"]]
+    counts = {"bubbles": 0, "bubble_errors": 0, "questions": 0, "question_errors": 0, "forms": 1, "student_number_errors": 0}
+    if not result.get("success"):
+        result = {}
+
+    def compare(expected: List[str], detected: List[str], options: int) -> None:
+        for i, want in enumerate(expected):
+            got = detected[i] if i < len(detected) else ""
+            counts["bubbles"] += options
+            if got != want:
+                counts["bubble_errors"] += (want != "") + (got not in ("", "?"))
+
+    grid = template['regions']['student_number']['grid']
+    number = result.get("student_number_detected") or ""
+    compare(list(truth["student_number"]), list(number), grid['rows'])
+    if number != truth["student_number"]:
+        counts["student_number_errors"] = 1
+
+    for section in template['regions']['answers']['sections']:
+        expected = truth["answers"][section['subject']]
+        detected = result.get("answers", {}).get(section['subject'], [])
+        compare(expected, detected, len(section['options']))
+        counts["questions"] += len(expected)
+        counts["question_errors"] += sum(1 for i, want in enumerate(expected) if (detected[i] if i < len(detected) else None) != want)
+    return counts
+
+
+def _accuracy(scores: List[Dict[str, int]]) -> Dict:
+    total = {key: sum(s[key] for s in scores) for key in scores[0]} if scores else {}
+    if not total:
+        return {}
+    return {
+        "bubble_accuracy": round(1.0 - total["bubble_errors"] / total["bubbles"], 6) if total["bubbles"] else None,
+        "question_accuracy": round(1.0 - total["question_errors"] / total["questions"], 6) if total["questions"] else None,
+        "student_number_accuracy": round(1.0 - total["student_number_errors"] / total["forms"], 6),
+        "bubble_errors": total["bubble_errors"],
+        "bubbles": total["bubbles"]
+    }
+
+
+def _summarize(forms: List[Dict], results: List[Dict], config: Dict, elapsed: float,
+               latencies: List[float], peak_rss_mb: Optional[float], **extra) -> Dict:
+    scores = [score_form(form, result, config) for form, result in zip(forms, results)]
+    stages: Dict[str, List[float]] = {}
+    for result in results:
+        for stage, ms in result.get("timings", {}).items():
+            stages.setdefault(stage, []).append(ms)
+    summary = {
+        "forms": len(results),
+        "failed": sum(1 for r in results if not r.get("success")),
+        "elapsed_s": round(elapsed, 3),
+        "forms_per_second": round(len(results) / elapsed, 3) if elapsed > 0 else None,
+        "latency_ms": _percentiles(latencies),
+        "stages_ms": {stage: _percentiles(values) for stage, values in stages.items()},
+        "peak_rss_mb": peak_rss_mb,
+        "accuracy": _accuracy(scores)
+    }
+    summary.update(extra)
+    return summary
+
+
+def run_inprocess(config_path: str, corpus_dir: str, forms: List[Dict], output_dir: str, output_policy: str) -> Dict:
+    """One warm processor in this process, no IPC"""
+    _reset_self_peak_rss()
+    processor = OMRProcessor(config_path)
+    processor.writer = OutputWriter()
+    results, latencies = [], []
+    started = time.perf_counter()
+    for form in forms:
+        path = os.path.join(corpus_dir, form["image"])
+        start = time.perf_counter()
+        image = cv2.imread(path)
+        timings = {"decode": (time.perf_counter() - start) * 1000.0}
+        result = processor.process_image(
+            image, form["template"], output_dir, Path(path).stem,
+            output_policy=output_policy, timings=True, stage_ms=timings
+        )
+        latencies.append((time.perf_counter() - start) * 1000.0)
+        results.append(result)
+    processor.writer.close()
+    elapsed = time.perf_counter() - started
+    return _summarize(forms, results, processor.config, elapsed, latencies, _self_peak_rss_mb())
+
+
+def run_single(config_path: str, corpus_dir: str, forms: List[Dict], output_dir: str, output_policy: str, config: Dict) -> Dict:
+    """One standard_omr.py process per form (how the backend calls it today)"""
+    results, latencies = [], []
+    peak = None
+    started = time.perf_counter()
+    for form in forms:
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, OMR_SCRIPT, os.path.join(corpus_dir, form["image"]), form["template"],
+             config_path, output_dir, "--output-policy", output_policy, "--timings", "--no-cache"],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        sampler = PeakRssSampler(proc.pid)
+        out = proc.stdout.read()
+        proc.wait()
+        rss = sampler.stop()
+        latencies.append((time.perf_counter() - start) * 1000.0)
+        peak = max(peak or 0.0, rss) if rss is not None else peak
+        try:
+            results.append(json.loads(out))
+        except ValueError:
+            results.append({"success": False, "error": "Invalid output"})
+    return _summarize(forms, results, config, time.perf_counter() - started, latencies, peak)
+
+
+def run_worker(config_path: str, corpus_dir: str, forms: List[Dict], output_dir: str, output_policy: str, config: Dict) -> Dict:
+    """One warm --serve worker, requests sent one at a time"""
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, OMR_SCRIPT, "--serve", "--config", config_path, "--output", output_dir,
+         "--output-policy", output_policy, "--timings", "--no-cache"],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    )
+    sampler = PeakRssSampler(proc.pid)
+
+    def request(payload: Dict) -> Dict:
+        proc.stdin.write(json.dumps(payload) + "\n")
+        proc.stdin.flush()
+        return json.loads(proc.stdout.readline())
+
+    request({"cmd": "health"})
+    startup_ms = (time.perf_counter() - started) * 1000.0
+
+    results, latencies = [], []
+    started = time.perf_counter()
+    for form in forms:
+        start = time.perf_counter()
+        results.append(request({"image_path": os.path.join(corpus_dir, form["image"]), "template_name": form["template"]}))
+        latencies.append((time.perf_counter() - start) * 1000.0)
+    request({"cmd": "flush"})
+    elapsed = time.perf_counter() - started
+    # The idle worker's high-water mark covers the whole run
+    sampler.sample()
+    request({"cmd": "shutdown"})
+    proc.stdin.close()
+    proc.wait()
+    peak = sampler.stop()
+    return _summarize(forms, results, config, elapsed, latencies, peak, startup_ms=round(startup_ms, 3))
+
+
+def run_batch_mode(corpus_dir: str, config_path: str, forms: List[Dict], output_dir: str, output_policy: str,
+                   config: Dict, workers: Optional[int]) -> Dict:
+    """--batch over the corpus manifest; results arrive in completion order"""
+    command = [sys.executable, OMR_SCRIPT, "--batch", os.path.join(corpus_dir, "manifest.jsonl"), "--config", config_path,
+               "--output", output_dir, "--output-policy", output_policy, "--timings", "--no-cache"]
+    if workers:
+        command += ["--workers", str(workers)]
+    started = time.perf_counter()
+    proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    sampler = PeakRssSampler(proc.pid)
+    by_index = {}
+    for line in proc.stdout:
+        result = json.loads(line)
+        by_index[result["index"]] = result
+    proc.wait()
+    peak = sampler.stop()
+    elapsed = time.perf_counter() - started
+    results = [by_index.get(i, {"success": False, "error": "No result"}) for i in range(len(forms))]
+    return _summarize(forms, results, config, elapsed, [], peak, workers=workers or os.cpu_count())
+
+
+def bench_memory(config_path: str, corpus_dir: str, forms: List[Dict], output_policy: str) -> Dict:
+    """
+    Memory per form: the peak of image and array allocations while one form is processed
+    (traced, so interpreter and library baseline are excluded), what stays allocated
+    between forms, and the peak RSS of a warm --serve worker over the same corpus.
+    """
+    processor = OMRProcessor(config_path)
+    peaks = []
+    with tempfile.TemporaryDirectory(prefix="omr-bench-") as output_dir:
+        # Untraced warm-up so one-off allocations (template load, first-use buffers) are not counted
+        processor.process_form(os.path.join(corpus_dir, forms[0]["image"]), forms[0]["template"], output_dir,
+                               output_policy=output_policy)
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        for form in forms:
+            tracemalloc.reset_peak()
+            start = tracemalloc.get_traced_memory()[0]
+            processor.process_form(os.path.join(corpus_dir, form["image"]), form["template"], output_dir,
+                                   output_policy=output_policy)
+            peaks.append((tracemalloc.get_traced_memory()[1] - start) / (1024.0 * 1024.0))
+        retained = (tracemalloc.get_traced_memory()[0] - baseline) / (1024.0 * 1024.0)
+        tracemalloc.stop()
+
+        with open(config_path, 'rb') as f:
+            config = json.loads(f.read())
+        worker = run_worker(config_path, corpus_dir, forms, output_dir, output_policy, config)
+
+    return {
+        "benchmark": "memory",
+        "output_policy": output_policy,
+        "forms": len(forms),
+        "form_peak_mb": _percentiles(peaks),
+        "retained_mb": round(retained, 2),
+        "worker_peak_rss_mb": worker["peak_rss_mb"],
+        "worker_accuracy": worker["accuracy"]
+    }
+
+
+def bench_cascade(config_path: str, corpus_dir: str, forms: List[Dict]) -> Dict:
+    """
+    Accuracy bought by the re-read cascade on a degraded corpus: every form is read with the
+    cascade off (reread_margin 0) and with each template's configured reread_margin; reports
+    accuracy, the median bubbles + reread time per form and the accuracy gained per ms added.
+    """
+    processor = OMRProcessor(config_path)
+    processor.writer = OutputWriter()
+    configured = dict(processor.templates)
+    runs = {}
+    with tempfile.TemporaryDirectory(prefix="omr-bench-") as output_dir:
+        for run in ("off", "cascade"):
+            if run == "off":
+                processor.templates = {name: dataclasses.replace(t, reread_margin=0.0) for name, t in configured.items()}
+            else:
+                processor.templates = configured
+            results, read_ms, lines = [], [], []
+            for form in forms:
+                path = os.path.join(corpus_dir, form["image"])
+                result = processor.process_image(cv2.imread(path), form["template"], output_dir, Path(path).stem,
+                                                 output_policy="none", timings=True)
+                results.append(result)
+                timings = result.get("timings", {})
+                read_ms.append(timings.get("bubbles", 0.0) + timings.get("reread", 0.0))
+                lines.append(sum(result.get("reread", {}).values()))
+            scores = [score_form(form, result, processor.config) for form, result in zip(forms, results)]
+            runs[run] = {
+                "accuracy": _accuracy(scores),
+                "question_errors": sum(s["question_errors"] for s in scores),
+                "read_ms": _percentiles(read_ms),
+                "reread_lines_per_form": round(statistics.mean(lines), 2)
+            }
+    processor.writer.close()
+
+    added_ms = runs["cascade"]["read_ms"]["p50"] - runs["off"]["read_ms"]["p50"]
+    gained = runs["cascade"]["accuracy"]["question_accuracy"] - runs["off"]["accuracy"]["question_accuracy"]
+    return {
+        "benchmark": "cascade",
+        "forms": len(forms),
+        "runs": runs,
+        "summary": {
+            "questions_fixed": runs["off"]["question_errors"] - runs["cascade"]["question_errors"],
+            "added_ms_per_form": round(added_ms, 3),
+            "question_accuracy_gain": round(gained, 6),
+            "accuracy_gain_per_ms": round(gained / added_ms, 6) if added_ms > 0 else None
+        }
+    }
+
+
+def filmed_stack(sheets: List[np.ndarray], seed: int, size: Tuple[int, int] = (1080, 1920),
+                 still_frames: int = 30, slide_frames: int = 8) -> Iterator[np.ndarray]:
+    """
+    Grayscale frames of a phone held over a stack of sheets on a dark desk: each sheet is
+    shown for `still_frames` frames with hand shake (the first few motion-blurred), then slid
+    off to the right over `slide_frames` frames, uncovering the next one at the same place
+    """
+    rng = np.random.default_rng(seed)
+    width, height = size
+    desk = np.tile(np.linspace(70, 90, width).astype(np.uint8), (height, 1))
+    # The sheet fills most of the frame, seen slightly off square
+    sheet_w, sheet_h = int(width * 0.92), int(width * 0.92 * 1.4)
+    x0, y0 = (width - sheet_w) / 2.0, (height - sheet_h) / 2.0
+    place = np.float32([[x0, y0], [x0 + sheet_w, y0], [x0 + sheet_w, y0 + sheet_h], [x0, y0 + sheet_h]])
+    place += rng.uniform(-25, 25, (4, 2)).astype(np.float32)
+    # Sheets are reduced to their on-screen size once; the warp then only resamples
+    scaled = [cv2.resize(s, (sheet_w, sheet_h), interpolation=cv2.INTER_AREA) for s in sheets]
+    corners = np.float32([[0, 0], [sheet_w, 0], [sheet_w, sheet_h], [0, sheet_h]])
+
+    def render(layers: List[Tuple[np.ndarray, np.ndarray]], blur: int) -> np.ndarray:
+        frame = desk.copy()
+        for sheet, quad in layers:
+            cv2.warpPerspective(sheet, cv2.getPerspectiveTransform(corners, quad), size, dst=frame,
+                                borderMode=cv2.BORDER_TRANSPARENT)
+        if blur:
+            kernel = np.zeros((blur, blur), np.float32)
+            kernel[blur // 2, :] = 1.0 / blur
+            frame = cv2.filter2D(frame, -1, kernel)
+        noise = rng.normal(0, 3, frame.shape)
+        return np.clip(frame + noise, 0, 255).astype(np.uint8)
+
+    shake = np.zeros(2, np.float32)
+    for i, sheet in enumerate(scaled):
+        below = scaled[i + 1:i + 2]
+        for k in range(still_frames):
+            shake = 0.8 * shake + rng.normal(0, 0.8, 2).astype(np.float32)
+            yield render([(s, place + shake) for s in below] + [(sheet, place + shake)], 9 if k < 4 else 0)
+        for k in range(1, slide_frames + 1):
+            moved = place + shake + np.float32([k * sheet_w / 7.0, k * 10])
+            yield render([(s, place + shake) for s in below] + [(sheet, moved)], 15)
+
+
+def bench_video(config_path: str, corpus_dir: str, forms: List[Dict], template_name: str, seed: int) -> Dict:
+    """
+    Video capture mode on a filmed synthetic stack (see filmed_stack): time per frame, the
+    frame rate it keeps up with, and whether every sheet was emitted exactly once and read right.
+    Only feeding frames to the reader is timed, not rendering them.
+    """
+    forms = [form for form in forms if form["template"] == template_name]
+    processor = OMRProcessor(config_path)
+    processor.writer = OutputWriter()
+    sheets = [cv2.imread(os.path.join(corpus_dir, form["image"]), cv2.IMREAD_GRAYSCALE) for form in forms]
+    frame_ms, read_ms, results = [], [], []
+    with tempfile.TemporaryDirectory(prefix="omr-bench-") as output_dir:
+        reader = VideoReader(processor, template_name, output_dir, form_options={"output_policy": "none"})
+        for index, frame in enumerate(filmed_stack(sheets, seed)):
+            reads = reader.stats["reads"]
+            start = time.perf_counter()
+            result = reader.feed(frame, index, index * 1000.0 / 30.0)
+            elapsed = (time.perf_counter() - start) * 1000.0
+            (read_ms if reader.stats["reads"] > reads else frame_ms).append(elapsed)
+            if result is not None:
+                results.append(result)
+        result = reader.flush()
+        if result is not None:
+            results.append(result)
+    processor.writer.close()
+
+    emitted = [(r["student_number_detected"], r["answers"]) for r in results]
+    correct = sum(1 for form in forms if (form["student_number"], form["answers"]) in emitted)
+    total_ms = sum(frame_ms) + sum(read_ms)
+    frames = len(frame_ms) + len(read_ms)
+    return {
+        "benchmark": "video",
+        "template": template_name,
+        "sheets": len(forms),
+        "frames": frames,
+        "stats": reader.stats,
+        "frame_ms": _percentiles(frame_ms),
+        "read_ms": _percentiles(read_ms),
+        "summary": {
+            "sheets_emitted": len(results),
+            "sheets_correct": correct,
+            "frames_per_second": round(frames / total_ms * 1000.0, 1) if total_ms else None
+        }
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=SCRIPT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_suite(config_path: str, corpus_dir: str, per_template: int, seed: int, modes: List[str],
+                output_policy: str, workers: Optional[int]) -> Dict:
+    """
+    Run the synthetic corpus through each pipeline configuration and report
+    throughput, latency percentiles, peak RSS and accuracy against ground truth.
+    """
+    forms = build_corpus(config_path, corpus_dir, per_template, seed)
+    with open(config_path, 'rb') as f:
+        raw = f.read()
+    config = json.loads(raw)
+
+    report_modes = {}
+    with tempfile.TemporaryDirectory(prefix="omr-bench-") as output_dir:
+        for mode in modes:
+            mode_output = os.path.join(output_dir, mode)
+            if mode == "inprocess":
+                report_modes[mode] = run_inprocess(config_path, corpus_dir, forms, mode_output, output_policy)
+            elif mode == "single":
+                report_modes[mode] = run_single(config_path, corpus_dir, forms, mode_output, output_policy, config)
+            elif mode == "worker":
+                report_modes[mode] = run_worker(config_path, corpus_dir, forms, mode_output, output_policy, config)
+            elif mode == "batch":
+                report_modes[mode] = run_batch_mode(corpus_dir, config_path, forms, mode_output, output_policy, config, workers)
+
+    return {
+        "benchmark": "suite",
+        "format": SUITE_FORMAT,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "config_hash": config_hash(raw),
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "cpu_count": os.cpu_count()
+        },
+        "corpus": {"dir": os.path.abspath(corpus_dir), "forms": len(forms), "per_template": per_template, "seed": seed},
+        "output_policy": output_policy,
+        "modes": report_modes
+    }
+
+
+# (metric path, True when higher is better)
+COMPARED_METRICS = [
+    (("forms_per_second",), True),
+    (("latency_ms", "p50"), False),
+    (("latency_ms", "p95"), False),
+    (("latency_ms", "p99"), False),
+    (("peak_rss_mb",), False),
+    (("accuracy", "bubble_accuracy"), True)
+]
+
+
+def _lookup(data: Dict, path: Tuple[str, ...]):
+    for key in path:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+def compare_reports(baseline: Dict, current: Dict, tolerance: float) -> Dict:
+    """
+    Diff two suite reports mode by mode. Timing and memory changes beyond `tolerance`
+    (relative) are regressions; any drop in accuracy is.
+    """
+    rows, regressions = [], []
+    for mode, current_mode in current.get("modes", {}).items():
+        base_mode = baseline.get("modes", {}).get(mode)
+        if base_mode is None:
+            continue
+        metrics = list(COMPARED_METRICS)
+        metrics += [(("stages_ms", stage, "p50"), False) for stage in current_mode.get("stages_ms", {})]
+        for path, higher_is_better in metrics:
+            old, new = _lookup(base_mode, path), _lookup(current_mode, path)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            worse = -change if higher_is_better else change
+            limit = 0.0 if path[0] == "accuracy" else tolerance
+            row = {"mode": mode, "metric": ".".join(path), "baseline": old, "current": new, "change": round(change, 4)}
+            rows.append(row)
+            if worse > limit:
+                regressions.append(row)
+    return {
+        "benchmark": "compare",
+        "baseline_commit": baseline.get("git_commit"),
+        "current_commit": current.get("git_commit"),
+        "tolerance": tolerance,
+        "metrics": rows,
+        "regressions": regressions
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OMR benchmarks")
+    parser.add_argument("--config", default=DEFAULT_CONFIG_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    alignment = sub.add_parser("alignment", help="Coarse-to-fine vs full-resolution marker search")
+    alignment.add_argument("images", nargs="*", default=[os.path.join(SCRIPT_DIR, "test-image.jpg")])
+    alignment.add_argument("--template", default="YKS_STANDARD")
+    alignment.add_argument("--repeat", type=int, default=5)
+
+    detect = sub.add_parser("detect", help="Template recognition accuracy and time on a synthetic corpus")
+    detect.add_argument("--corpus", default=os.path.join(SCRIPT_DIR, ".omr_cache", "bench-corpus"))
+    detect.add_argument("--forms-per-template", type=int, default=10)
+    detect.add_argument("--seed", type=int, default=0)
+    detect.add_argument("--repeat", type=int, default=3)
+
+    memory = sub.add_parser("memory", help="Per-form allocation peak and worker peak RSS on a synthetic corpus")
+    memory.add_argument("--corpus", default=os.path.join(SCRIPT_DIR, ".omr_cache", "bench-corpus"))
+    memory.add_argument("--forms-per-template", type=int, default=10)
+    memory.add_argument("--seed", type=int, default=0)
+    memory.add_argument("--output-policy", choices=OUTPUT_POLICIES, default="none")
+
+    suite = sub.add_parser("suite", help="Throughput, latency, memory and accuracy on a synthetic corpus")
+    suite.add_argument("--corpus", default=os.path.join(SCRIPT_DIR, ".omr_cache", "bench-corpus"),
+                       help="Corpus directory (generated on first use, reused while parameters match)")
+    suite.add_argument("--forms-per-template", type=int, default=10)
+    suite.add_argument("--seed", type=int, default=0)
+    suite.add_argument("--modes", default=",".join(SUITE_MODES), help="Comma-separated subset of " + ", ".join(SUITE_MODES))
+    suite.add_argument("--output-policy", choices=OUTPUT_POLICIES, default="none",
+                       help="Output images written during the run (default: none, so disk speed does not skew timings)")
+    suite.add_argument("--workers", type=int, default=None, help="Batch pool size (default: CPU count)")
+    suite.add_argument("--save", metavar="FILE", help="Also write the report to FILE (e.g. a baseline)")
+
+    compare = sub.add_parser("compare", help="Diff two suite reports; exits 1 on regressions")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative slowdown (default: 0.10)")
+
+    cascade = sub.add_parser("cascade", help="Accuracy and time of the ambiguous-row re-read on a degraded corpus")
+    cascade.add_argument("--corpus", default=os.path.join(SCRIPT_DIR, ".omr_cache", "cascade-corpus"))
+    cascade.add_argument("--forms-per-template", type=int, default=10)
+    cascade.add_argument("--seed", type=int, default=0)
+    cascade.add_argument("--augment", choices=sorted(AUGMENTATIONS), default="hard",
+                         help="Augmentation preset of the corpus (see generate_test_form.py)")
+
+    video = sub.add_parser("video", help="Video capture mode on a filmed synthetic stack: time per frame and sheets read")
+    video.add_argument("--corpus", default=os.path.join(SCRIPT_DIR, ".omr_cache", "bench-corpus"))
+    video.add_argument("--forms-per-template", type=int, default=10)
+    video.add_argument("--seed", type=int, default=0)
+    video.add_argument("--template", default="YKS_STANDARD")
+
+    options = parser.parse_args()
+    exit_code = 0
+
+    if options.command == "alignment":
+        processor = OMRProcessor(options.config)
+        report = bench_alignment(processor, options.images, options.template, options.repeat)
+    elif options.command == "detect":
+        forms = build_corpus(options.config, options.corpus, options.forms_per_template, options.seed)
+        report = bench_detect(OMRProcessor(options.config), options.corpus, forms, options.repeat)
+    elif options.command == "memory":
+        forms = build_corpus(options.config, options.corpus, options.forms_per_template, options.seed)
+        report = bench_memory(options.config, options.corpus, forms, options.output_policy)
+    elif options.command == "cascade":
+        forms = build_corpus(options.config, options.corpus, options.forms_per_template, options.seed,
+                             augment=options.augment)
+        report = bench_cascade(options.config, options.corpus, forms)
+    elif options.command == "video":
+        forms = build_corpus(options.config, options.corpus, options.forms_per_template, options.seed)
+        report = bench_video(options.config, options.corpus, forms, options.template, options.seed)
+    elif options.command == "suite":
+        modes = [mode.strip() for mode in options.modes.split(",") if mode.strip()]
+        unknown = sorted(set(modes) - set(SUITE_MODES))
+        if unknown:
+            parser.error(f"unknown mode(s): {', '.join(unknown)}")
+        report = bench_suite(
+            options.config, options.corpus, options.forms_per_template, options.seed,
+            modes, options.output_policy, options.workers
+        )
+        if options.save:
+            with open(options.save, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        with open(options.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        with open(options.current, 'r', encoding='utf-8') as f:
+            current = json.load(f)
+        report = compare_reports(baseline, current, options.tolerance)
+        exit_code = 1 if report["regressions"] else 0
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+OMR batch grading
+Grades a whole cohort of OMR results against an answer key at once: answers
+are encoded as a uint8 matrix per subject (0 = blank, 1.. = option index + 1)
+and correct / wrong / empty / net counts, scores, ranks and percentiles are
+computed with NumPy over all students together.
+
+    python omr_grading.py results.ndjson --key answer_key.json > graded.json
+"""
+
+import argparse
+import json
+import sys
+from typing import Dict, Iterable, Iterator, List, Sequence, Union
+
+import numpy as np
+
+
+DEFAULT_OPTIONS = "ABCDE"
+# Standard YKS/LGS marking: four wrong answers cancel one correct answer
+WRONG_PENALTY = 0.25
+POINTS_PER_NET = 5.0
+
+# Answer codes: 0 = blank, 1.. = position in the options string
+BLANK = 0
+INVALID = 255   # an answer that is not one of the options; graded as wrong
+
+AnswerKey = Dict[str, Union[str, Sequence[str]]]
+
+
+def option_lut(options: str = DEFAULT_OPTIONS) -> np.ndarray:
+    """Character code (< 256) -> answer code; NUL (an empty string) is blank, anything else INVALID"""
+    if len(options) >= INVALID or any(ord(option) >= 256 for option in options):
+        raise ValueError(f"Options must be at most {INVALID - 1} Latin-1 characters")
+    lut = np.full(256, INVALID, dtype=np.uint8)
+    lut[0] = BLANK
+    for code, option in enumerate(options, start=1):
+        lut[ord(option)] = code
+    return lut
+
+
+def encode_answers(
+    answer_lists: Iterable[Sequence[str]],
+    question_count: int,
+    options: str = DEFAULT_OPTIONS
+) -> np.ndarray:
+    """
+    Encode one subject's answers for every student as a (students x questions) uint8 matrix.
+    Lists are padded with blanks / truncated to question_count.
+    """
+    rows = [
+        answers if len(answers) == question_count else (list(answers[:question_count]) + [""] * question_count)[:question_count]
+        for answers in answer_lists
+    ]
+    if not rows:
+        return np.zeros((0, question_count), dtype=np.uint8)
+    # Two UCS-4 characters per cell: a non-NUL second character means a multi-character (invalid) answer
+    chars = np.array(rows, dtype="U2").view(np.uint32).reshape(len(rows), question_count, 2)
+    first = chars[..., 0]
+    codes = option_lut(options)[first & 0xFF]
+    codes[(first >= 256) | (chars[..., 1] != 0)] = INVALID
+    return codes
+
+
+def encode_key(key: Union[str, Sequence[str]], options: str = DEFAULT_OPTIONS) -> np.ndarray:
+    """
+    Encode one subject's key; a blank entry ("" in a list, "." or " " in a string)
+    marks a cancelled question, which is not graded
+    """
+    answers = ["" if answer in (".", " ", None) else answer for answer in key]
+    codes = encode_answers([answers], len(answers), options)[0]
+    if (codes == INVALID).any():
+        bad = sorted({answers[i] for i in np.flatnonzero(codes == INVALID)})
+        raise ValueError(f"Answer key contains values that are not options ({options}): {bad}")
+    return codes
+
+
+def grade_matrix(answers: np.ndarray, key: np.ndarray) -> Dict[str, np.ndarray]:
+    """Correct / wrong / empty counts per student for one subject"""
+    graded = key != BLANK
+    answered = answers != BLANK
+    correct = ((answers == key) & graded).sum(axis=1, dtype=np.int32)
+    empty = (~answered & graded).sum(axis=1, dtype=np.int32)
+    wrong = int(graded.sum()) - correct - empty
+    return {"correct": correct, "wrong": wrong, "empty": empty}
+
+
+def percentile_ranks(values: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Competition rank (1 = best, ties share a rank) and percentile rank
+    (share of the cohort scoring lower, ties counted half) for every value
+    """
+    ordered = np.sort(values)
+    below = np.searchsorted(ordered, values, side="left")
+    at_or_below = np.searchsorted(ordered, values, side="right")
+    count = len(values)
+    return {
+        "rank": count - at_or_below + 1,
+        "percentile": 100.0 * (below + 0.5 * (at_or_below - below)) / max(count, 1)
+    }
+
+
+def iter_pages(results: Iterable[Dict]) -> Iterator[Dict]:
+    """Flatten multi-page results into one entry per answer sheet"""
+    for result in results:
+        if "pages" in result:
+            for page in result["pages"]:
+                yield {**page, "source": result.get("source"), "page_index": page.get("page_index")}
+        else:
+            yield result
+
+
+def _distribution(values: np.ndarray) -> Dict:
+    if not len(values):
+        return {"count": 0}
+    p25, p50, p75, p90 = np.percentile(values, [25, 50, 75, 90])
+    return {
+        "count": int(len(values)),
+        "mean": round(float(values.mean()), 3),
+        "std": round(float(values.std()), 3),
+        "min": round(float(values.min()), 3),
+        "p25": round(float(p25), 3),
+        "median": round(float(p50), 3),
+        "p75": round(float(p75), 3),
+        "p90": round(float(p90), 3),
+        "max": round(float(values.max()), 3)
+    }
+
+
+def grade_batch(
+    results: Iterable[Dict],
+    answer_key: AnswerKey,
+    options: str = DEFAULT_OPTIONS,
+    wrong_penalty: float = WRONG_PENALTY,
+    points_per_net: float = POINTS_PER_NET
+) -> Dict:
+    """
+    Grade a batch of OMRProcessor results (single-form, multi-page or batch NDJSON records).
+    `answer_key` maps subject name -> correct options ("ABDC..." or a list).
+    Failed results are not graded and are listed in "skipped".
+    Returns {"students": [...], "summary": {...}}; students keep the input order.
+    """
+    keys = {subject: encode_key(key, options) for subject, key in answer_key.items()}
+    graded: List[Dict] = []
+    skipped: List[Dict] = []
+    for index, page in enumerate(iter_pages(results)):
+        if page.get("success") and isinstance(page.get("answers"), dict):
+            graded.append(page)
+        else:
+            skipped.append({"index": page.get("index", index), "source": page.get("source"), "error": page.get("error")})
+
+    count = len(graded)
+    total_net = np.zeros(count, dtype=np.float64)
+    subjects: Dict[str, Dict[str, np.ndarray]] = {}
+    for subject, key in keys.items():
+        matrix = encode_answers((page["answers"].get(subject, ()) for page in graded), len(key), options)
+        counts = grade_matrix(matrix, key)
+        counts["net"] = counts["correct"] - wrong_penalty * counts["wrong"]
+        counts.update(percentile_ranks(counts["net"]))
+        total_net += counts["net"]
+        subjects[subject] = counts
+
+    score = total_net * points_per_net
+    standing = percentile_ranks(score)
+
+    # Plain Python lists (rounded in bulk) keep the per-student loop free of NumPy scalar access
+    columns = {
+        subject: {
+            "correct": counts["correct"].tolist(),
+            "wrong": counts["wrong"].tolist(),
+            "empty": counts["empty"].tolist(),
+            "net": np.round(counts["net"], 2).tolist(),
+            "score": np.round(counts["net"] * points_per_net, 2).tolist(),
+            "rank": counts["rank"].tolist(),
+            "percentile": np.round(counts["percentile"], 2).tolist()
+        }
+        for subject, counts in subjects.items()
+    }
+    total_nets = np.round(total_net, 2).tolist()
+    scores = np.round(score, 2).tolist()
+    ranks = standing["rank"].tolist()
+    percentiles = np.round(standing["percentile"], 2).tolist()
+
+    students = []
+    for row, page in enumerate(graded):
+        students.append({
+            "index": page.get("index", row),
+            "source": page.get("source") or page.get("image_path"),
+            "page_index": page.get("page_index"),
+            "student_number": page.get("student_number_detected"),
+            "subjects": {
+                subject: {field: values[row] for field, values in column.items()}
+                for subject, column in columns.items()
+            },
+            "total_net": total_nets[row],
+            "score": scores[row],
+            "rank": ranks[row],
+            "percentile": percentiles[row]
+        })
+
+    return {
+        "students": students,
+        "skipped": skipped,
+        "summary": {
+            "graded": count,
+            "skipped": len(skipped),
+            "score": _distribution(score),
+            "total_net": _distribution(total_net),
+            "subjects": {subject: _distribution(counts["net"]) for subject, counts in subjects.items()}
+        }
+    }
+
+
+def load_results(path: str) -> List[Dict]:
+    """Results from a JSON file (one result or a list) or NDJSON (e.g. --batch output)"""
+    with open(path, 'r', encoding='utf-8') if path != "-" else sys.stdin as f:
+        text = f.read()
+    stripped = text.lstrip()
+    if stripped.startswith("["):
+        return json.loads(stripped)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grade OMR results against an answer key")
+    parser.add_argument("results", help="Result JSON / NDJSON file (- for stdin)")
+    parser.add_argument("--key", required=True, help='Answer key JSON: {"<subject>": "ABCD..." or ["A", "B", ...]}')
+    parser.add_argument("--options", default=DEFAULT_OPTIONS, help=f"Answer options (default: {DEFAULT_OPTIONS})")
+    parser.add_argument("--wrong-penalty", type=float, default=WRONG_PENALTY)
+    parser.add_argument("--points-per-net", type=float, default=POINTS_PER_NET)
+    options = parser.parse_args()
+
+    try:
+        with open(options.key, 'r', encoding='utf-8') as f:
+            answer_key = json.load(f)
+        report = grade_batch(load_results(options.results), answer_key, options.options,
+                             options.wrong_penalty, options.points_per_net)
+    except (OSError, ValueError) as e:
+        print(json.dumps({"success": False, "error": str(e)}))
+        sys.exit(1)
+    print(json.dumps({"success": True, **report}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+OMR runtime metrics
+Cumulative counters and fixed-bucket latency histograms for worker and
+batch mode, fed from the per-form results (their "timings" and
+"alignment_method"), and the cProfile hook shared by every entry point.
+"""
+
+import bisect
+import contextlib
+import cProfile
+import os
+import pstats
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+
+# Upper bounds (ms) of the histogram buckets; anything slower lands in the overflow bucket
+HISTOGRAM_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Values of result["alignment_method"]: "border" is the Strategy 2 (form outline) fallback
+ALIGNMENT_METHODS = ("pyramid", "contours", "border", "none")
+
+# Values of result["quality_gate"]["fired"] (None when the page passed unchanged)
+QUALITY_GATES = ("blank", "blur", "rotation")
+
+
+class Histogram:
+    """Latency histogram with fixed bucket bounds; cheap enough to update per form"""
+
+    def __init__(self, bounds=HISTOGRAM_BUCKETS_MS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (the observed max for the overflow bucket)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return float(self.bounds[index]) if index < len(self.bounds) else self.max
+        return self.max
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "sum_ms": round(self.total, 3),
+            "mean_ms": round(self.total / self.count, 3) if self.count else None,
+            "min_ms": round(self.min, 3) if self.min is not None else None,
+            "max_ms": round(self.max, 3) if self.max is not None else None,
+            "p50_ms": self.quantile(0.50),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "buckets": {
+                **{f"le_{bound}": count for bound, count in zip(self.bounds, self.counts)},
+                "overflow": self.counts[-1]
+            }
+        }
+
+
+class Metrics:
+    """
+    Counters and per-stage histograms accumulated over a worker's or batch's lifetime.
+    Thread-safe: the output writer thread reports write times concurrently.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.counters: Dict[str, int] = {"forms": 0, "failed": 0, "cache_hits": 0}
+        self.counters.update({f"alignment_{method}": 0 for method in ALIGNMENT_METHODS})
+        self.counters.update({f"gate_{gate}": 0 for gate in QUALITY_GATES})
+        self.histograms: Dict[str, Histogram] = {}
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name: str, value_ms: float) -> None:
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value_ms)
+
+    def record_result(self, result: Dict) -> None:
+        """Account for one result (a multi-page result counts each page)"""
+        for page in result.get("pages", [result]):
+            self.increment("forms")
+            gate = (page.get("quality_gate") or {}).get("fired")
+            if gate is not None and not page.get("cached"):
+                self.increment(f"gate_{gate}")
+            if not page.get("success"):
+                self.increment("failed")
+                continue
+            if page.get("cached"):
+                # Answered from the result cache: no alignment ran
+                self.increment("cache_hits")
+                self.observe("cache", page.get("timings", {}).get("cache", 0.0))
+                continue
+            method = page.get("alignment_method")
+            if method is not None:
+                self.increment(f"alignment_{method}")
+            for stage, ms in page.get("timings", {}).items():
+                self.observe(stage, ms)
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return {
+                "uptime_seconds": round(time.time() - self.started_at, 3),
+                "counters": dict(self.counters),
+                "histograms": {name: histogram.to_dict() for name, histogram in self.histograms.items()}
+            }
+
+
+class Profiler:
+    """
+    cProfile hook for the worker, batch and single-form entry points.
+    per="form": one pstats file per form, <path>/<form name>.prof
+    per="run":  forms accumulate into one profile, written to `path` by close()
+    With path None every method is a no-op, so call sites need no branching.
+    """
+
+    def __init__(self, path: Optional[str], per: str = "run"):
+        if per not in ("form", "run"):
+            raise ValueError(f"Unknown profile granularity: {per}")
+        self.path = path
+        self.per = per
+        self.profile = cProfile.Profile() if path is not None and per == "run" else None
+
+    @contextlib.contextmanager
+    def form(self, name: str) -> Iterator[None]:
+        if self.path is None:
+            yield
+            return
+        profile = self.profile or cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            if self.per == "form":
+                _dump(profile, os.path.join(self.path, f"{name}.prof"))
+
+    def close(self) -> None:
+        if self.profile is not None:
+            _dump(self.profile, self.path)
+            self.profile = None
+
+
+def _dump(profile: cProfile.Profile, path: str) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    profile.dump_stats(path)
+
+
+def merge_profiles(paths: List[str], output_path: str) -> None:
+    """Combine several pstats dumps (e.g. one per pool worker) into one file"""
+    stats = None
+    for path in paths:
+        if stats is None:
+            stats = pstats.Stats(path)
+        else:
+            stats.add(path)
+    if stats is not None:
+        stats.dump_stats(output_path)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+OMR output writing
+Annotated images are rendered, JPEG-encoded and written on a background
+thread so recognition results can be returned as soon as they are ready.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+import cv2
+import numpy as np
+
+
+logger = logging.getLogger("omr")
+
+# Supported artefact policies (template "output.policy" or per-request "output_policy")
+#   none      - write nothing
+#   thumbnail - annotated page scaled down to the template's thumbnail_width
+#   roi       - one annotated crop per read region (student number and answer sections)
+#   full      - annotated full-resolution page
+OUTPUT_POLICIES = ("none", "thumbnail", "roi", "full")
+
+_STOP = object()
+
+
+def write_jpeg(path: str, image: np.ndarray, quality: int) -> None:
+    """Encode and write a JPEG atomically, so readers never see a partial file"""
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not ok:
+        raise ValueError(f"JPEG encoding failed for {path}")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(encoded.tobytes())
+    os.replace(tmp_path, path)
+
+
+class OutputWriter:
+    """
+    Single background thread running output jobs in submission order.
+    The queue is bounded: when the disk cannot keep up, submit() blocks,
+    which keeps at most `max_pending` page images alive.
+    `observe` (if given) is called with each job's duration in ms.
+    """
+
+    def __init__(self, max_pending: int = 4, observe: Optional[Callable[[float], None]] = None):
+        self.jobs: "queue.Queue" = queue.Queue(maxsize=max_pending)
+        self.observe = observe
+        self.written = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self.thread = threading.Thread(target=self._run, name="omr-output", daemon=True)
+        self.thread.start()
+
+    @property
+    def pending(self) -> int:
+        return self.jobs.unfinished_tasks
+
+    def submit(self, job: Callable[[], None]) -> None:
+        self.jobs.put(job)
+
+    def _run(self) -> None:
+        while True:
+            job = self.jobs.get()
+            try:
+                if job is _STOP:
+                    return
+                start = time.perf_counter()
+                job()
+                self.written += 1
+                if self.observe is not None:
+                    self.observe((time.perf_counter() - start) * 1000.0)
+            except Exception as e:
+                # A failed write must not take down the worker; it is counted and logged
+                self.errors += 1
+                self.last_error = str(e)
+                logger.error("Output write failed: %s", e)
+            finally:
+                self.jobs.task_done()
+
+    def flush(self) -> None:
+        """Block until every submitted job has finished"""
+        self.jobs.join()
+
+    def close(self) -> None:
+        """Finish outstanding jobs and stop the thread"""
+        if self.thread.is_alive():
+            self.jobs.put(_STOP)
+            self.thread.join()
@@ -0,0 +1,577 @@
+#!/usr/bin/env python3
+"""
+Durable OMR job queue
+Jobs live in a SQLite file, so they survive restarts, and are consumed by a
+fixed pool of warm worker processes (one OMRWorker each). Higher priority
+jobs are claimed first, a job whose worker crashed or hung is retried, and
+submissions are refused once the backlog reaches its cap, so a burst of
+uploads queues up instead of starting one process per file.
+
+    python omr_queue.py serve --workers 2            # pool + JSON-lines control on stdin/stdout
+    python omr_queue.py submit scans/ --priority 0   # enqueue a directory, manifest or images
+    python omr_queue.py status <job_id>
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Set, TextIO
+
+import cv2
+
+from omr_roster import RosterIndex
+from standard_omr import DEFAULT_CONFIG_PATH, IMAGE_EXTENSIONS, OMRWorker, _iter_batch_sources, configure_logging
+
+
+logger = logging.getLogger("omr")
+
+DEFAULT_QUEUE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".omr_cache", "jobs.sqlite")
+JOB_STATES = ("queued", "running", "done", "failed", "cancelled")
+
+# Higher runs first; a re-check of one sheet should not wait behind a scanned stack
+PRIORITY_BATCH = 0
+PRIORITY_INTERACTIVE = 10
+
+DEFAULT_MAX_QUEUED = 10000     # submissions beyond this many queued jobs are refused
+DEFAULT_MAX_ATTEMPTS = 3       # claims per job before a crashing / hanging job is marked failed
+DEFAULT_JOB_TIMEOUT = 120.0    # seconds a worker may hold a job before it is killed and the job retried
+RETRY_BACKOFF_SECONDS = 2.0    # doubled on every further attempt
+POLL_INTERVAL = 0.2            # idle workers look for new jobs this often
+SUPERVISE_INTERVAL = 1.0
+
+
+class QueueFull(Exception):
+    """Raised by submit() when the backlog is at its cap; the caller should retry later"""
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobQueue:
+    """
+    SQLite-backed job table shared by every process using the same file.
+    Like ResultCache, the connection is opened lazily and reopened after a fork.
+
+    A job is "queued" until a worker claims it ("running"), then ends as "done"
+    (the pipeline returned success), "failed" (the pipeline reported an error,
+    or the job used up its attempts) or "cancelled".
+    """
+
+    def __init__(self, path: str = DEFAULT_QUEUE_PATH, max_queued: int = DEFAULT_MAX_QUEUED):
+        self.path = path
+        self.max_queued = max_queued
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL UNIQUE,"
+                " status TEXT NOT NULL, priority INTEGER NOT NULL, request TEXT NOT NULL,"
+                " result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, max_attempts INTEGER NOT NULL,"
+                " worker_pid INTEGER, created_at REAL NOT NULL, available_at REAL NOT NULL,"
+                " started_at REAL, lease_until REAL, finished_at REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, priority DESC, seq)")
+            self._pid = os.getpid()
+        return self._conn
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Write transaction taken up front, so concurrent claims cannot pick the same job"""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def submit(
+        self,
+        request: Dict,
+        priority: int = PRIORITY_BATCH,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        job_id: Optional[str] = None
+    ) -> str:
+        """Enqueue one OMRWorker process request and return its job ID"""
+        if "cmd" in request:
+            raise ValueError("Only form requests can be queued")
+        if not request.get("image_path") and not request.get("image_base64"):
+            raise ValueError("Missing 'image_path' or 'image_base64'")
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        with self.transaction() as conn:
+            queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            if queued >= self.max_queued:
+                raise QueueFull(f"Queue is full ({queued} jobs waiting)")
+            conn.execute(
+                "INSERT INTO jobs (id, status, priority, request, max_attempts, created_at, available_at)"
+                " VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, int(priority), json.dumps(request, ensure_ascii=False), int(max_attempts), now, now)
+            )
+        return job_id
+
+    def claim(self, worker_pid: int, lease_seconds: float = DEFAULT_JOB_TIMEOUT) -> Optional[Dict]:
+        """Take the highest-priority, oldest ready job; None when there is nothing to do"""
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute(
+                "SELECT id, request, attempts FROM jobs WHERE status = 'queued' AND available_at <= ?"
+                " ORDER BY priority DESC, seq LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker_pid = ?,"
+                " started_at = ?, lease_until = ? WHERE id = ?",
+                (worker_pid, now, now + lease_seconds, row["id"])
+            )
+        return {"id": row["id"], "request": json.loads(row["request"]), "attempt": row["attempts"] + 1}
+
+    def complete(self, job_id: str, worker_pid: int, result: Dict) -> None:
+        """
+        Store a job's result; a pipeline error is final and is not retried.
+        Ignored if the job was meanwhile handed to another worker.
+        """
+        status = "done" if result.get("success") else "failed"
+        self.conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_until = NULL"
+            " WHERE id = ? AND status = 'running' AND worker_pid = ?",
+            (status, json.dumps(result, ensure_ascii=False), result.get("error"), time.time(), job_id, worker_pid)
+        )
+
+    def release(self, job_id: str, error: str, worker_pid: Optional[int] = None) -> str:
+        """
+        Give back a job whose worker crashed or timed out: it is queued again after a
+        backoff, or marked failed once it has used up its attempts. With `worker_pid`, only
+        while that worker still holds it. Returns the new status.
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND status = 'running'"
+                + (" AND worker_pid = ?" if worker_pid is not None else ""),
+                (job_id,) if worker_pid is None else (job_id, worker_pid)
+            ).fetchone()
+            if row is None:
+                return "missing"
+            if row["attempts"] >= row["max_attempts"]:
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, lease_until = NULL WHERE id = ?",
+                    (f"{error} (gave up after {row['attempts']} attempts)", now, job_id)
+                )
+                return "failed"
+            backoff = RETRY_BACKOFF_SECONDS * 2 ** (row["attempts"] - 1)
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', error = ?, available_at = ?, worker_pid = NULL,"
+                " lease_until = NULL WHERE id = ?",
+                (error, now + backoff, job_id)
+            )
+        return "queued"
+
+    def recover(self) -> int:
+        """
+        Hand back running jobs whose worker process is gone or whose lease expired,
+        e.g. after the service was killed. Returns the number of jobs released.
+        """
+        now = time.time()
+        rows = self.conn.execute("SELECT id, worker_pid, lease_until FROM jobs WHERE status = 'running'").fetchall()
+        released = 0
+        for row in rows:
+            if row["worker_pid"] is not None and _pid_alive(row["worker_pid"]) and row["lease_until"] > now:
+                continue
+            state = self.release(row["id"], "Worker stopped while processing the job")
+            logger.warning("Job %s recovered from worker %s: %s", row["id"], row["worker_pid"], state)
+            released += 1
+        return released
+
+    def release_expired(self, live_workers: Set[int]) -> int:
+        """
+        Hand back running jobs past their lease that none of `live_workers` holds, whether
+        or not their worker pid is alive: an orphan of an earlier service, or a pid since
+        reused by another process, would otherwise keep them running forever.
+        Returns the number of jobs released.
+        """
+        released = 0
+        for job in self.expired():
+            if job["worker_pid"] in live_workers:
+                continue
+            state = self.release(job["id"], "Lease expired on a worker outside this service", job["worker_pid"])
+            if state != "missing":
+                logger.warning("Job %s released from worker %s: %s", job["id"], job["worker_pid"], state)
+                released += 1
+        return released
+
+    def expired(self) -> List[Dict]:
+        """Running jobs held longer than their lease, with the worker holding them"""
+        rows = self.conn.execute(
+            "SELECT id, worker_pid FROM jobs WHERE status = 'running' AND lease_until < ?", (time.time(),)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job that has not started yet"""
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+            (time.time(), job_id)
+        )
+        return cursor.rowcount > 0
+
+    def retry(self, job_id: str) -> bool:
+        """Queue a failed or cancelled job again, with a fresh set of attempts"""
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = 'queued', attempts = 0, result = NULL, error = NULL, finished_at = NULL,"
+            " available_at = ? WHERE id = ? AND status IN ('failed', 'cancelled')",
+            (time.time(), job_id)
+        )
+        return cursor.rowcount > 0
+
+    def resolve(self, job_id: str, result: Dict) -> bool:
+        """Replace a finished job's result with one validated by hand; the job becomes done"""
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = 'done', result = ?, error = NULL, finished_at = ?"
+            " WHERE id = ? AND status IN ('done', 'failed', 'cancelled')",
+            (json.dumps(result, ensure_ascii=False), time.time(), job_id)
+        )
+        return cursor.rowcount > 0
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """A job's state, its request (without inline image data) and, once finished, its result"""
+        row = self.conn.execute(
+            "SELECT id, status, priority, attempts, max_attempts, error, request, result, created_at, started_at,"
+            " finished_at FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["request"] = {key: value for key, value in json.loads(job["request"]).items() if key != "image_base64"}
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        if job["status"] == "queued":
+            job["position"] = self.conn.execute(
+                "SELECT COUNT(*) FROM jobs j, jobs me WHERE me.id = ? AND j.status = 'queued'"
+                " AND (j.priority > me.priority OR (j.priority = me.priority AND j.seq < me.seq))",
+                (job_id,)
+            ).fetchone()[0]
+        return job
+
+    def counts(self) -> Dict[str, int]:
+        counts = {state: 0 for state in JOB_STATES}
+        for status, count in self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"):
+            counts[status] = count
+        return counts
+
+    def prune(self, older_than_seconds: float) -> int:
+        """Delete finished jobs (and their results) older than the given age"""
+        cursor = self.conn.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed', 'cancelled') AND finished_at < ?",
+            (time.time() - older_than_seconds,)
+        )
+        return cursor.rowcount
+
+
+def _queue_worker(
+    queue_path: str,
+    config_path: str,
+    output_dir: str,
+    form_options: Dict,
+    result_cache_mb: Optional[float],
+    job_timeout: float,
+    log_level: str,
+    log_file: Optional[str],
+    roster_path: Optional[str],
+    stop: multiprocessing.Event
+) -> None:
+    """Worker process: one warm OMRWorker claiming jobs until told to stop"""
+    cv2.setNumThreads(1)
+    sys.stdout = sys.stderr
+    configure_logging(log_level, log_file)
+    queue = JobQueue(queue_path)
+    worker = OMRWorker(config_path, output_dir, form_options, result_cache_mb=result_cache_mb, roster_path=roster_path)
+    pid = os.getpid()
+    # A worker whose service was killed is re-parented; it stops rather than keep claiming jobs
+    service_pid = os.getppid()
+    try:
+        while not stop.is_set() and os.getppid() == service_pid:
+            job = queue.claim(pid, job_timeout)
+            if job is None:
+                stop.wait(POLL_INTERVAL)
+                continue
+            logger.debug("Worker %d running job %s (attempt %d)", pid, job["id"], job["attempt"])
+            # handle() never raises; errors come back as {"success": false}
+            result = worker.handle(job["request"])
+            queue.complete(job["id"], pid, result)
+    finally:
+        worker.processor.writer.close()
+
+
+class QueueService:
+    """
+    Fixed pool of queue workers plus a supervisor thread that restarts dead
+    workers, kills workers stuck on a job past its timeout and hands their
+    jobs back to the queue. Control requests are JSON lines on stdin:
+
+        {"id": ..., "cmd": "submit", "request": {"image_path": ..., "template_name": ...}, "priority": 10}
+        {"id": ..., "cmd": "status" | "cancel" | "retry", "job_id": ...}
+        {"id": ..., "cmd": "resolve", "job_id": ..., "result": {...}}
+        {"id": ..., "cmd": "stats" | "shutdown"}
+    """
+
+    def __init__(
+        self,
+        queue_path: str,
+        config_path: str,
+        output_dir: str,
+        workers: int,
+        form_options: Optional[Dict] = None,
+        result_cache_mb: Optional[float] = None,
+        max_queued: int = DEFAULT_MAX_QUEUED,
+        job_timeout: float = DEFAULT_JOB_TIMEOUT,
+        log_level: str = "WARNING",
+        log_file: Optional[str] = None,
+        roster_path: Optional[str] = None
+    ):
+        self.queue = JobQueue(queue_path, max_queued)
+        self.worker_args = (queue_path, config_path, output_dir, dict(form_options or {}),
+                            result_cache_mb, job_timeout, log_level, log_file, roster_path)
+        self.workers = workers
+        # Workers are also restarted from the supervisor thread, and forking a threaded process is unsafe
+        self.context = multiprocessing.get_context("spawn")
+        self.stop = self.context.Event()
+        self.processes: List[multiprocessing.Process] = []
+        self.restarts = 0
+        self.started_at = time.time()
+        self.supervisor = threading.Thread(target=self._supervise, name="omr-queue-supervisor", daemon=True)
+
+    def start(self) -> None:
+        recovered = self.queue.recover()
+        if recovered:
+            logger.warning("Resumed %d jobs left running by a previous service", recovered)
+        for _ in range(self.workers):
+            self._spawn()
+        self.supervisor.start()
+
+    def _spawn(self) -> None:
+        process = self.context.Process(target=_queue_worker, args=(*self.worker_args, self.stop),
+                                       name="omr-queue-worker", daemon=True)
+        process.start()
+        self.processes.append(process)
+
+    def _supervise(self) -> None:
+        queue = JobQueue(self.queue.path)
+        while not self.stop.wait(SUPERVISE_INTERVAL):
+            try:
+                ours = {process.pid: process for process in self.processes}
+                for job in queue.expired():
+                    process = ours.get(job["worker_pid"])
+                    if process is not None and process.is_alive():
+                        logger.warning("Job %s exceeded its timeout; restarting worker %d", job["id"], process.pid)
+                        process.kill()
+                        process.join()
+                dead = [process for process in self.processes if not process.is_alive()]
+                if dead:
+                    queue.recover()
+                    for process in dead:
+                        logger.warning("Queue worker %d exited with %s; restarting", process.pid, process.exitcode)
+                        self.processes.remove(process)
+                        self.restarts += 1
+                        self._spawn()
+                queue.release_expired({process.pid for process in self.processes if process.is_alive()})
+            except sqlite3.Error as e:
+                logger.warning("Queue supervision failed: %s", e)
+
+    def shutdown(self) -> None:
+        """Let running jobs finish, then stop the workers; queued jobs stay for the next start"""
+        self.stop.set()
+        if self.supervisor.is_alive():
+            self.supervisor.join()
+        for process in self.processes:
+            process.join()
+
+    def stats(self) -> Dict:
+        return {
+            "success": True,
+            "pid": os.getpid(),
+            "uptime_seconds": round(time.time() - self.started_at, 3),
+            "workers": sum(1 for process in self.processes if process.is_alive()),
+            "worker_restarts": self.restarts,
+            "max_queued": self.queue.max_queued,
+            "jobs": self.queue.counts()
+        }
+
+    def handle(self, request: Dict) -> Dict:
+        cmd = request.get("cmd")
+        if cmd == "submit":
+            try:
+                job_id = self.queue.submit(
+                    request.get("request") or {},
+                    request.get("priority", PRIORITY_BATCH),
+                    request.get("max_attempts", DEFAULT_MAX_ATTEMPTS),
+                    request.get("job_id")
+                )
+            except QueueFull as e:
+                return {"success": False, "error": str(e), "queue_full": True}
+            except (ValueError, sqlite3.IntegrityError) as e:
+                return {"success": False, "error": str(e)}
+            return {"success": True, "job_id": job_id}
+        if cmd in ("status", "cancel", "retry"):
+            job_id = request.get("job_id")
+            if cmd == "status":
+                job = self.queue.get(job_id)
+                if job is None:
+                    return {"success": False, "error": f"Unknown job: {job_id}"}
+                return {"success": True, "job": job}
+            done = self.queue.cancel(job_id) if cmd == "cancel" else self.queue.retry(job_id)
+            return {"success": done, **({} if done else {"error": f"Job {job_id} cannot be {cmd}ed in its current state"})}
+        if cmd == "resolve":
+            result = request.get("result")
+            if not isinstance(result, dict):
+                return {"success": False, "error": "Missing 'result'"}
+            if not self.queue.resolve(request.get("job_id"), result):
+                return {"success": False, "error": f"Job {request.get('job_id')} has not finished"}
+            return {"success": True}
+        if cmd == "stats":
+            return self.stats()
+        if cmd == "shutdown":
+            return {"success": True, "status": "shutting_down"}
+        return {"success": False, "error": f"Unknown command: {cmd}"}
+
+    def serve(self, stdin: TextIO, stdout: TextIO) -> None:
+        self.start()
+        try:
+            for line in stdin:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("Request must be a JSON object")
+                except ValueError as e:
+                    response = {"success": False, "error": f"Invalid request: {e}"}
+                    request = {}
+                else:
+                    try:
+                        response = self.handle(request)
+                    except sqlite3.Error as e:
+                        response = {"success": False, "error": f"Queue database error: {e}"}
+                if "id" in request:
+                    response["id"] = request["id"]
+                stdout.write(json.dumps(response, ensure_ascii=False) + "\n")
+                stdout.flush()
+                if request.get("cmd") == "shutdown":
+                    break
+        finally:
+            self.shutdown()
+
+
+def iter_submissions(sources: List[str], template_name: str, output_dir: str):
+    """Form requests for image files, directories of scans and manifest files"""
+    for source in sources:
+        if os.path.isfile(source) and source.lower().endswith(IMAGE_EXTENSIONS):
+            yield {"image_path": os.path.abspath(source), "template_name": template_name, "output_dir": output_dir}
+            continue
+        for image_path, item_template, item_output in _iter_batch_sources(source, template_name, output_dir):
+            yield {"image_path": os.path.abspath(image_path), "template_name": item_template, "output_dir": item_output}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Durable OMR job queue")
+    parser.add_argument("--queue", default=DEFAULT_QUEUE_PATH, help="Queue database (default: .omr_cache/jobs.sqlite)")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--log-file", default=None)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve", help="Run the worker pool; control requests on stdin, responses on stdout")
+    serve.add_argument("--config", default=DEFAULT_CONFIG_PATH)
+    serve.add_argument("--output", default="./output", help="Default output directory")
+    serve.add_argument("--workers", type=int, default=None, help="Pool size (default: CPU count)")
+    serve.add_argument("--max-queued", type=int, default=DEFAULT_MAX_QUEUED,
+                       help=f"Refuse submissions beyond this many waiting jobs (default: {DEFAULT_MAX_QUEUED})")
+    serve.add_argument("--job-timeout", type=float, default=DEFAULT_JOB_TIMEOUT,
+                       help=f"Seconds before a stuck job's worker is restarted (default: {DEFAULT_JOB_TIMEOUT:g})")
+    serve.add_argument("--retain-hours", type=float, default=168.0,
+                       help="Delete finished jobs older than this at startup (default: 168)")
+    serve.add_argument("--cache", action="store_true", help="Answer scans seen before from the result cache")
+    serve.add_argument("--no-cache", action="store_true", help="Do not use the result cache, even with --cache")
+    serve.add_argument("--cache-size-mb", type=float, default=64.0)
+    serve.add_argument("--roster", metavar="FILE", default=None,
+                       help="Student roster export (CSV / JSON) to resolve student numbers against")
+
+    submit = sub.add_parser("submit", help="Enqueue images, directories of scans or manifest files")
+    submit.add_argument("sources", nargs="+")
+    submit.add_argument("--template", default="YKS_STANDARD")
+    submit.add_argument("--output", default="./output")
+    submit.add_argument("--priority", type=int, default=PRIORITY_BATCH)
+    submit.add_argument("--max-queued", type=int, default=DEFAULT_MAX_QUEUED)
+
+    status = sub.add_parser("status", help="Print a job's status and result")
+    status.add_argument("job_ids", nargs="+")
+
+    sub.add_parser("stats", help="Print job counts per state")
+    options = parser.parse_args()
+    configure_logging(options.log_level, options.log_file)
+
+    if options.command == "serve":
+        if options.roster:
+            # Workers that cannot load the roster would only be restarted over and over
+            try:
+                RosterIndex.load(options.roster)
+            except (OSError, ValueError) as e:
+                print(json.dumps({"success": False, "error": f"Invalid roster: {e}"}))
+                sys.exit(1)
+        service = QueueService(
+            options.queue, options.config, options.output, options.workers or os.cpu_count() or 1,
+            result_cache_mb=options.cache_size_mb if options.cache and not options.no_cache else None,
+            max_queued=options.max_queued, job_timeout=options.job_timeout,
+            log_level=options.log_level, log_file=options.log_file, roster_path=options.roster
+        )
+        pruned = service.queue.prune(options.retain_hours * 3600)
+        if pruned:
+            logger.info("Pruned %d finished jobs", pruned)
+        service.serve(sys.stdin, sys.stdout)
+        return
+
+    queue = JobQueue(options.queue)
+    if options.command == "submit":
+        queue.max_queued = options.max_queued
+        for request in iter_submissions(options.sources, options.template, options.output):
+            try:
+                job_id = queue.submit(request, options.priority)
+            except QueueFull as e:
+                print(json.dumps({"success": False, "error": str(e), "source": request["image_path"]}))
+                sys.exit(1)
+            print(json.dumps({"success": True, "job_id": job_id, "source": request["image_path"]}), flush=True)
+    elif options.command == "status":
+        for job_id in options.job_ids:
+            job = queue.get(job_id)
+            print(json.dumps({"success": job is not None, "job_id": job_id, "job": job}, ensure_ascii=False))
+    else:
+        print(json.dumps({"success": True, "jobs": queue.counts()}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Content-addressed OMR result cache
+Results are stored in SQLite under a key derived from the image bytes,
+the template name and the template's fingerprint, so re-uploaded scans are
+answered without running the pipeline and config changes invalidate old
+entries automatically. Least recently used entries are evicted once the
+cache grows past its size cap.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Callable, Dict, Optional
+
+
+logger = logging.getLogger("omr")
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def content_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_digest(path: str) -> str:
+    """sha256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    On-disk result cache shared by every process using the same file
+    (batch pool workers included). The connection is opened lazily so a
+    cache object can be created before a fork.
+    """
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # A connection must not cross a fork; reopen in a new process
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY, result TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+            # Running total of the entry sizes, kept by triggers so that every process sharing
+            # the file sees it and a store does not have to sum the table
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS meta (id INTEGER PRIMARY KEY CHECK (id = 0), total INTEGER NOT NULL);"
+                "INSERT OR IGNORE INTO meta VALUES (0, (SELECT COALESCE(SUM(size), 0) FROM results));"
+                "CREATE TRIGGER IF NOT EXISTS results_added AFTER INSERT ON results"
+                " BEGIN UPDATE meta SET total = total + NEW.size; END;"
+                "CREATE TRIGGER IF NOT EXISTS results_removed AFTER DELETE ON results"
+                " BEGIN UPDATE meta SET total = total - OLD.size; END;"
+                "CREATE TRIGGER IF NOT EXISTS results_resized AFTER UPDATE OF size ON results"
+                " BEGIN UPDATE meta SET total = total + NEW.size - OLD.size; END;"
+            )
+            self._pid = os.getpid()
+        return self._conn
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        return hashlib.sha256("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+    def get(self, key: str, valid: Optional[Callable[[Dict], bool]] = None) -> Optional[Dict]:
+        """Stored result for `key`; one that fails `valid` is dropped and counts as a miss"""
+        try:
+            row = self.conn.execute("SELECT result FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            result = json.loads(row[0])
+            if valid is not None and not valid(result):
+                self.delete(key)
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+        except sqlite3.Error as e:
+            # The cache is an optimisation; a broken or locked database must not fail the form
+            logger.warning("Result cache lookup failed: %s", e)
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, key: str, result: Dict) -> None:
+        payload = json.dumps(result, ensure_ascii=False)
+        try:
+            # An upsert rather than INSERT OR REPLACE, whose implicit delete skips the triggers
+            self.conn.execute(
+                "INSERT INTO results (key, result, size, last_used) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET result = excluded.result, size = excluded.size,"
+                " last_used = excluded.last_used",
+                (key, payload, len(payload), time.time())
+            )
+            self.evict()
+        except sqlite3.Error as e:
+            logger.warning("Result cache store failed: %s", e)
+
+    def delete(self, key: str) -> None:
+        self.conn.execute("DELETE FROM results WHERE key = ?", (key,))
+
+    def evict(self) -> None:
+        """Drop least recently used entries until the cache fits its size cap"""
+        total = self.total()
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed = 0
+        doomed = []
+        for key, size in self.conn.execute("SELECT key, size FROM results ORDER BY last_used"):
+            doomed.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self.conn.executemany("DELETE FROM results WHERE key = ?", doomed)
+        logger.debug("Result cache evicted %d entries (%d bytes)", len(doomed), freed)
+
+    def total(self) -> int:
+        """Bytes held by all entries"""
+        return self.conn.execute("SELECT total FROM meta").fetchone()[0]
+
+    def stats(self) -> Dict:
+        entries = self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return {"entries": entries, "bytes": self.total(), "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses}
+
+    def clear(self) -> None:
+        self.conn.execute("DELETE FROM results")
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Student roster index
+An exported student list is loaded once per worker process and used to resolve
+student number grids: every roster number is scored against the per-bubble
+fill ratios at once (NumPy), so a smudged, double-marked or blank column is
+filled in from the only valid number that fits the rest of the grid.
+
+    student_number,student_id,name          (CSV with a header row,
+    20240001,ckv9x0...,Ayşe Yılmaz           or a JSON / NDJSON list of objects)
+
+    python omr_roster.py roster.csv [--columns 8]
+"""
+
+import argparse
+import csv
+import hashlib
+import io
+import json
+import sys
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+# Fill ratio -> probability that a bubble is marked: a logistic around the template's
+# fill threshold with this width (ratios of marked bubbles sit ~0.3-0.5 above the threshold)
+FILL_SCALE = 0.05
+# Probabilities are clipped so one bubble contributes at most ~9.2 nats of evidence
+MIN_PROBABILITY = 1e-4
+# A candidate is accepted when the evidence against it (nats, 0 = exactly what was read)
+# stays below MAX_COST and it takes at least MIN_POSTERIOR of the roster's probability mass.
+# One confidently contradicted column costs ~12 nats, a faint or smudged one a few and a
+# blank one nothing, so a number is never corrected against a clearly marked digit.
+MAX_COST = 6.0
+MIN_POSTERIOR = 0.95
+DEFAULT_TOP_K = 3
+
+
+def column_costs(fill_ratios: np.ndarray, threshold: float) -> np.ndarray:
+    """
+    (columns x 10) cost of reading each digit in each column of a student number grid
+    (fill_ratios: digits x columns), as negative log-likelihood relative to the most
+    likely digit of the column: the chosen bubble marked, every other one empty
+    """
+    rows, columns = fill_ratios.shape
+    p = 1.0 / (1.0 + np.exp(-(fill_ratios.astype(np.float64) - threshold) / FILL_SCALE))
+    p = np.clip(p, MIN_PROBABILITY, 1.0 - MIN_PROBABILITY)
+    log_empty = np.log1p(-p)
+    likelihood = (np.log(p) - log_empty + log_empty.sum(axis=0)).T
+    costs = np.full((columns, 10), np.inf)
+    costs[:, :min(rows, 10)] = (likelihood.max(axis=1, keepdims=True) - likelihood)[:, :10]
+    return costs
+
+
+class RosterIndex:
+    """
+    Valid student numbers with their student id and name. Numbers are kept as one
+    column-major (digits x students) uint8 matrix per number length.
+    """
+
+    def __init__(self, entries: List[Dict], fingerprint: str = ""):
+        self.entries: List[Dict] = []
+        self.by_number: Dict[str, int] = {}
+        for entry in entries:
+            number = str(entry.get("student_number", "")).strip()
+            if not number.isdigit():
+                raise ValueError(f"Roster entry without a numeric student_number: {entry!r}")
+            if number in self.by_number:
+                raise ValueError(f"Duplicate student number in roster: {number}")
+            self.by_number[number] = len(self.entries)
+            self.entries.append({
+                "student_number": number,
+                "student_id": entry.get("student_id") or None,
+                "name": entry.get("name") or None
+            })
+        self.fingerprint = fingerprint
+        # Built up front so the first form read by a worker does not pay for it
+        lengths: Dict[int, List[int]] = {}
+        for i, entry in enumerate(self.entries):
+            lengths.setdefault(len(entry["student_number"]), []).append(i)
+        self._digits: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        for columns, members in lengths.items():
+            indices = np.array(members, dtype=np.intp)
+            numbers = "".join(self.entries[i]["student_number"] for i in members).encode("ascii")
+            matrix = (np.frombuffer(numbers, dtype=np.uint8) - ord("0")).reshape(len(indices), columns)
+            self._digits[columns] = (np.ascontiguousarray(matrix.T), indices)
+
+    @classmethod
+    def load(cls, path: str) -> "RosterIndex":
+        """Read a CSV (header with student_number[, student_id, name]), JSON list or NDJSON export"""
+        with open(path, 'rb') as f:
+            raw = f.read()
+        text = raw.decode('utf-8-sig')
+        stripped = text.lstrip()
+        if stripped.startswith("["):
+            entries = json.loads(stripped)
+        elif stripped.startswith("{"):
+            entries = [json.loads(line) for line in text.splitlines() if line.strip()]
+        else:
+            reader = csv.DictReader(io.StringIO(text))
+            if not reader.fieldnames or "student_number" not in reader.fieldnames:
+                raise ValueError(f"Roster CSV needs a header row with a student_number column: {path}")
+            entries = list(reader)
+        return cls(entries, hashlib.sha256(raw).hexdigest()[:16])
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def digits(self, columns: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(columns x students) digit matrix of the numbers with `columns` digits, and their entry indices"""
+        return self._digits.get(columns, (np.zeros((columns, 0), dtype=np.uint8), np.zeros(0, dtype=np.intp)))
+
+    def resolve(self, fill_ratios: np.ndarray, threshold: float, top_k: int = DEFAULT_TOP_K) -> Optional[Dict]:
+        """
+        Most likely roster numbers for a student number grid (fill_ratios: digits x columns).
+        Returns {"match": entry or None, "candidates": [...]}, each candidate with its
+        "cost" (nats of evidence against it) and "score" (share of the roster's probability
+        mass); None when the roster holds no number of this length.
+        """
+        columns = fill_ratios.shape[1]
+        matrix, indices = self.digits(columns)
+        if not len(indices):
+            return None
+        costs = column_costs(fill_ratios, threshold).astype(np.float32)
+        # One contiguous gather per column from its 10-entry cost table, accumulated in place
+        totals = np.zeros(len(indices), dtype=np.float32)
+        for column in range(columns):
+            totals += costs[column].take(matrix[column])
+        finite = np.isfinite(totals)
+        if not finite.any():
+            return {"match": None, "candidates": []}
+        best_cost = totals[finite].min()
+        weights = np.where(finite, np.exp(-(np.where(finite, totals, best_cost) - best_cost)), 0.0)
+        posterior = weights / weights.sum()
+
+        k = min(top_k, len(totals))
+        top = np.argpartition(totals, k - 1)[:k]
+        top = top[np.argsort(totals[top], kind="stable")]
+        candidates = [
+            {**self.entries[indices[i]], "cost": round(float(totals[i]), 3), "score": round(float(posterior[i]), 4)}
+            for i in top if np.isfinite(totals[i])
+        ]
+        best = candidates[0]
+        accepted = best["cost"] <= MAX_COST and posterior[top[0]] >= MIN_POSTERIOR
+        return {"match": best if accepted else None, "candidates": candidates}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check a student roster export")
+    parser.add_argument("roster", help="CSV (student_number,student_id,name), JSON list or NDJSON")
+    parser.add_argument("--columns", type=int, default=None, help="Also report the numbers of this length")
+    options = parser.parse_args()
+    try:
+        roster = RosterIndex.load(options.roster)
+    except (OSError, ValueError) as e:
+        print(json.dumps({"success": False, "error": str(e)}))
+        sys.exit(1)
+    lengths: Dict[int, int] = {}
+    for entry in roster.entries:
+        lengths[len(entry["student_number"])] = lengths.get(len(entry["student_number"]), 0) + 1
+    report = {"success": True, "students": len(roster), "fingerprint": roster.fingerprint, "number_lengths": lengths}
+    if options.columns is not None:
+        report["matching_length"] = lengths.get(options.columns, 0)
+    print(json.dumps(report, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
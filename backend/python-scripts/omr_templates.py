@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""
+Template compiler for omr_config.json
+Validates every template once and precomputes its bubble geometry
+(centres, sampling boxes, ROI slices and ring samples) so the
+recognition hot path never re-derives it from the raw config.
+"""
+
+import functools
+import hashlib
+import json
+import logging
+import os
+import pickle
+import sys
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from omr_output import OUTPUT_POLICIES
+
+
+logger = logging.getLogger("omr")
+
+# Bump whenever the compiled layout changes so stale on-disk caches are ignored
+COMPILER_VERSION = 8
+
+# Template keys that do not affect recognition results (left out of the fingerprint)
+NON_RECOGNITION_KEYS = ("name", "description", "output")
+
+# Template units per layout map pixel (template detection works on this coarse level)
+LAYOUT_MAP_SCALE = 8
+
+# Pixel step of the lattice behind CompiledGrid.ring_samples
+RING_SAMPLE_STEP = 3
+
+# Supported values of detection_params.threshold_method
+THRESHOLD_METHODS = ("otsu", "otsu_region", "adaptive")
+
+# Compiled templates per config hash, shared by every processor in the process
+_memory_cache: Dict[str, Dict[str, "CompiledTemplate"]] = {}
+
+
+class TemplateConfigError(ValueError):
+    """Raised when omr_config.json contains an invalid template"""
+
+
+@dataclass
+class CompiledGrid:
+    """Precomputed geometry of one bubble grid (student number or answer section)"""
+    name: str
+    x: int
+    y: int
+    width: int
+    height: int
+    rows: int
+    columns: int
+    bubble_radius: int
+    row_spacing: int
+    col_spacing: int
+    # Bubble centres relative to the ROI origin
+    centers_x: np.ndarray
+    centers_y: np.ndarray
+    # Sampling box edges relative to the ROI origin (not yet clipped to the ROI)
+    box_x1: np.ndarray
+    box_x2: np.ndarray
+    box_y1: np.ndarray
+    box_y2: np.ndarray
+    # (rows x columns x samples) flat indices into the (height x width) region of a sparse
+    # lattice inside every printed ring, clipped to the region (grey level flagging)
+    ring_samples: np.ndarray
+    options: List[str] = field(default_factory=list)
+    question_count: int = 0
+
+    @property
+    def roi(self) -> Tuple[slice, slice]:
+        """Slices that cut this grid's region out of a page in template coordinates"""
+        return slice(self.y, self.y + self.height), slice(self.x, self.x + self.width)
+
+    def page_centers(self) -> np.ndarray:
+        """rows x columns x 2 array of bubble centres in page coordinates"""
+        xs = np.broadcast_to(self.centers_x[None, :] + self.x, (self.rows, self.columns))
+        ys = np.broadcast_to(self.centers_y[:, None] + self.y, (self.rows, self.columns))
+        return np.stack([xs, ys], axis=-1)
+
+
+@dataclass
+class CompiledTemplate:
+    """A validated template with all bubble geometry precomputed"""
+    name: str
+    marker_positions: np.ndarray
+    student_number: CompiledGrid
+    sections: List[CompiledGrid]
+    fill_threshold: float
+    detection_params: Dict
+    # Page preprocessing (detection_params.threshold_method and friends)
+    threshold_method: str = "otsu"
+    blur_kernel: int = 5
+    adaptive_block_size: int = 51
+    adaptive_c: float = 2.0
+    # Scan quality gate (detection_params.blank_max_ink / min_sharpness / detect_rotation; 0 / False disables)
+    blank_max_ink: float = 0.002
+    min_sharpness: float = 12.0
+    detect_rotation: bool = True
+    # Rows whose fill ratios are closer than this to the threshold are re-read from grayscale
+    # (detection_params.reread_margin; 0 disables the cascade)
+    reread_margin: float = 0.05
+    # Annotated output artefacts (template "output" block; see omr_output.py)
+    output_policy: str = "full"
+    jpeg_quality: int = 95
+    thumbnail_width: int = 600
+    # Hash of everything in the template that can change a result (geometry, thresholds, ...)
+    fingerprint: str = ""
+    # Expected ink of the printed bubble lattice in template coordinates at 1/LAYOUT_MAP_SCALE,
+    # zero-mean and unit-norm (see layout_map); used to recognise the template of a page
+    layout_map: Optional[np.ndarray] = None
+
+
+def _require(cond: bool, template_name: str, where: str, message: str) -> None:
+    if not cond:
+        raise TemplateConfigError(f"Template '{template_name}': {where}: {message}")
+
+
+def _positive_int(value, template_name: str, where: str, key: str) -> int:
+    _require(
+        isinstance(value, (int, float)) and not isinstance(value, bool) and value == int(value) and value > 0,
+        template_name, where, f"'{key}' must be a positive integer (got {value!r})"
+    )
+    return int(value)
+
+
+def grid_boxes(
+    rows: int,
+    columns: int,
+    bubble_radius: int,
+    row_spacing: int,
+    col_spacing: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Bubble centres and sampling box edges of a regular grid, relative to the grid origin
+    Returns (centers_x, centers_y, box_x1, box_x2, box_y1, box_y2)
+    """
+    centers_x = np.arange(columns, dtype=np.int64) * col_spacing + bubble_radius
+    centers_y = np.arange(rows, dtype=np.int64) * row_spacing + bubble_radius
+    return (
+        centers_x,
+        centers_y,
+        centers_x - bubble_radius,
+        centers_x + bubble_radius,
+        centers_y - bubble_radius,
+        centers_y + bubble_radius
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def ring_offsets(bubble_radius: int, step: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (dy, dx) pixel offsets from a bubble centre of the disc inside the printed ring
+    and of the ring itself (its outline drawn at bubble_radius, a few pixels wide once blurred),
+    on a lattice of `step` pixels
+    """
+    coords = np.arange(-bubble_radius - 2, bubble_radius + 3)
+    coords = coords[coords % step == 0]
+    dy, dx = np.meshgrid(coords, coords, indexing="ij")
+    distance = np.hypot(dy, dx)
+    inner = distance <= max(bubble_radius - 3, 1)
+    ring = np.abs(distance - bubble_radius) <= 1.5
+    return np.stack([dy[inner], dx[inner]]), np.stack([dy[ring], dx[ring]])
+
+
+def _compile_grid(region: Dict, template_name: str, where: str, name: str) -> CompiledGrid:
+    _require(isinstance(region, dict), template_name, where, "must be an object")
+    x = region.get('x')
+    y = region.get('y')
+    _require(isinstance(x, (int, float)) and x >= 0, template_name, where, f"'x' must be >= 0 (got {x!r})")
+    _require(isinstance(y, (int, float)) and y >= 0, template_name, where, f"'y' must be >= 0 (got {y!r})")
+    width = _positive_int(region.get('width'), template_name, where, 'width')
+    height = _positive_int(region.get('height'), template_name, where, 'height')
+
+    grid = region.get('grid')
+    _require(isinstance(grid, dict), template_name, where, "missing 'grid'")
+    rows = _positive_int(grid.get('rows'), template_name, where, 'grid.rows')
+    columns = _positive_int(grid.get('columns'), template_name, where, 'grid.columns')
+    radius = _positive_int(grid.get('bubble_radius'), template_name, where, 'grid.bubble_radius')
+    row_spacing = _positive_int(grid.get('row_spacing'), template_name, where, 'grid.row_spacing')
+    col_spacing = _positive_int(grid.get('col_spacing'), template_name, where, 'grid.col_spacing')
+
+    centers_x, centers_y, box_x1, box_x2, box_y1, box_y2 = grid_boxes(rows, columns, radius, row_spacing, col_spacing)
+    # Boxes may be clipped at the region edge, but every bubble centre must be inside it
+    _require(int(centers_x[-1]) < width, template_name, where, "grid columns extend beyond the region width")
+    _require(int(centers_y[-1]) < height, template_name, where, "grid rows extend beyond the region height")
+    inner, _ = ring_offsets(radius, RING_SAMPLE_STEP)
+    sample_y = np.clip(centers_y[:, None, None] + inner[0], 0, height - 1)
+    sample_x = np.clip(centers_x[None, :, None] + inner[1], 0, width - 1)
+
+    return CompiledGrid(
+        name=name,
+        x=int(x),
+        y=int(y),
+        width=width,
+        height=height,
+        rows=rows,
+        columns=columns,
+        bubble_radius=radius,
+        row_spacing=row_spacing,
+        col_spacing=col_spacing,
+        centers_x=centers_x,
+        centers_y=centers_y,
+        box_x1=box_x1,
+        box_x2=box_x2,
+        box_y1=box_y1,
+        box_y2=box_y2,
+        ring_samples=(sample_y * width + sample_x).astype(np.intp)
+    )
+
+
+def compile_template(template_name: str, template: Dict) -> CompiledTemplate:
+    """Validate one template and precompute its geometry"""
+    _require(isinstance(template, dict), template_name, "template", "must be an object")
+
+    markers = template.get('alignment_markers', {}).get('positions')
+    _require(isinstance(markers, list) and len(markers) == 4, template_name, "alignment_markers", "exactly 4 positions are required")
+    for m in markers:
+        _require(
+            isinstance(m, dict) and isinstance(m.get('x'), (int, float)) and isinstance(m.get('y'), (int, float)),
+            template_name, "alignment_markers", f"invalid position {m!r}"
+        )
+    marker_positions = np.array([[m['x'], m['y']] for m in markers], dtype=np.float32)
+
+    params = template.get('detection_params')
+    _require(isinstance(params, dict), template_name, "detection_params", "missing")
+    threshold = params.get('bubble_fill_threshold')
+    _require(
+        isinstance(threshold, (int, float)) and 0 < threshold <= 1,
+        template_name, "detection_params", f"'bubble_fill_threshold' must be in (0, 1] (got {threshold!r})"
+    )
+
+    threshold_method = params.get('threshold_method', "otsu")
+    _require(
+        threshold_method in THRESHOLD_METHODS,
+        template_name, "detection_params", f"'threshold_method' must be one of {', '.join(THRESHOLD_METHODS)} (got {threshold_method!r})"
+    )
+    blur_kernel = _positive_int(params.get('gaussian_blur_kernel', 5), template_name, "detection_params", 'gaussian_blur_kernel')
+    _require(blur_kernel % 2 == 1, template_name, "detection_params", "'gaussian_blur_kernel' must be odd")
+    block_size = _positive_int(params.get('adaptive_threshold_block_size', 51), template_name, "detection_params", 'adaptive_threshold_block_size')
+    _require(block_size % 2 == 1 and block_size > 1, template_name, "detection_params", "'adaptive_threshold_block_size' must be odd and > 1")
+    adaptive_c = params.get('adaptive_threshold_c', 2)
+    _require(isinstance(adaptive_c, (int, float)), template_name, "detection_params", "'adaptive_threshold_c' must be a number")
+    blank_max_ink = params.get('blank_max_ink', 0.002)
+    _require(
+        isinstance(blank_max_ink, (int, float)) and not isinstance(blank_max_ink, bool) and 0 <= blank_max_ink < 1,
+        template_name, "detection_params", f"'blank_max_ink' must be in [0, 1) (got {blank_max_ink!r})"
+    )
+    min_sharpness = params.get('min_sharpness', 12.0)
+    _require(
+        isinstance(min_sharpness, (int, float)) and not isinstance(min_sharpness, bool) and min_sharpness >= 0,
+        template_name, "detection_params", f"'min_sharpness' must be a number >= 0 (got {min_sharpness!r})"
+    )
+    detect_rotation = params.get('detect_rotation', True)
+    _require(isinstance(detect_rotation, bool), template_name, "detection_params", "'detect_rotation' must be true or false")
+    reread_margin = params.get('reread_margin', 0.05)
+    _require(
+        isinstance(reread_margin, (int, float)) and not isinstance(reread_margin, bool) and 0 <= reread_margin < 1,
+        template_name, "detection_params", f"'reread_margin' must be in [0, 1) (got {reread_margin!r})"
+    )
+
+    regions = template.get('regions')
+    _require(isinstance(regions, dict), template_name, "regions", "missing")
+    student_number = _compile_grid(regions.get('student_number'), template_name, "regions.student_number", "student_number")
+
+    sections_config = regions.get('answers', {}).get('sections')
+    _require(isinstance(sections_config, list) and sections_config, template_name, "regions.answers", "'sections' must be a non-empty list")
+
+    sections = []
+    subjects = set()
+    for i, section in enumerate(sections_config):
+        where = f"regions.answers.sections[{i}]"
+        _require(isinstance(section, dict), template_name, where, "must be an object")
+        subject = section.get('subject')
+        _require(isinstance(subject, str) and subject, template_name, where, "'subject' is required")
+        _require(subject not in subjects, template_name, where, f"duplicate subject '{subject}'")
+        subjects.add(subject)
+
+        grid = _compile_grid(section, template_name, where, subject)
+        options = section.get('options')
+        _require(
+            isinstance(options, list) and options and all(isinstance(o, str) for o in options),
+            template_name, where, "'options' must be a non-empty list of strings"
+        )
+        _require(len(options) <= grid.columns, template_name, where, "more options than grid columns")
+        question_count = _positive_int(section.get('question_count'), template_name, where, 'question_count')
+        _require(question_count <= grid.rows, template_name, where, "more questions than grid rows")
+
+        grid.options = list(options)
+        grid.question_count = question_count
+        sections.append(grid)
+
+    output = template.get('output', {})
+    _require(isinstance(output, dict), template_name, "output", "must be an object")
+    output_policy = output.get('policy', "full")
+    _require(
+        output_policy in OUTPUT_POLICIES,
+        template_name, "output", f"'policy' must be one of {', '.join(OUTPUT_POLICIES)} (got {output_policy!r})"
+    )
+    jpeg_quality = _positive_int(output.get('jpeg_quality', 95), template_name, "output", 'jpeg_quality')
+    _require(jpeg_quality <= 100, template_name, "output", "'jpeg_quality' must be between 1 and 100")
+    thumbnail_width = _positive_int(output.get('thumbnail_width', 600), template_name, "output", 'thumbnail_width')
+
+    return CompiledTemplate(
+        name=template_name,
+        marker_positions=marker_positions,
+        student_number=student_number,
+        sections=sections,
+        fill_threshold=float(threshold),
+        detection_params=dict(params),
+        threshold_method=threshold_method,
+        blur_kernel=blur_kernel,
+        adaptive_block_size=block_size,
+        adaptive_c=float(adaptive_c),
+        blank_max_ink=float(blank_max_ink),
+        min_sharpness=float(min_sharpness),
+        detect_rotation=detect_rotation,
+        reread_margin=float(reread_margin),
+        output_policy=output_policy,
+        jpeg_quality=jpeg_quality,
+        thumbnail_width=thumbnail_width,
+        fingerprint=template_fingerprint(template),
+        layout_map=layout_map(marker_positions, [student_number] + sections)
+    )
+
+
+def layout_map(marker_positions: np.ndarray, grids: List[CompiledGrid]) -> np.ndarray:
+    """
+    Low-resolution picture of where a template prints ink: every bubble ring that is
+    read, drawn in template coordinates (origin at the top-left marker centre) and
+    area-averaged down to 1/LAYOUT_MAP_SCALE. It captures the region positions and the
+    lattice density, so templates sharing a marker layout still look different.
+    """
+    origin = marker_positions[np.argmin(marker_positions.sum(axis=1))]
+    frame = marker_positions - origin
+    width, height = int(round(frame[:, 0].max())) + 1, int(round(frame[:, 1].max())) + 1
+    canvas = np.zeros((height, width), dtype=np.uint8)
+    for grid in grids:
+        rows = grid.question_count or grid.rows
+        columns = len(grid.options) or grid.columns
+        for x, y in grid.page_centers()[:rows, :columns].reshape(-1, 2):
+            cv2.circle(canvas, (int(x), int(y)), grid.bubble_radius, 255, 2)
+    size = (max(1, width // LAYOUT_MAP_SCALE), max(1, height // LAYOUT_MAP_SCALE))
+    small = cv2.resize(canvas, size, interpolation=cv2.INTER_AREA).astype(np.float32)
+    small -= small.mean()
+    norm = float(np.linalg.norm(small))
+    return small / norm if norm > 0 else small
+
+
+def template_fingerprint(template: Dict) -> str:
+    """Stable hash of the recognition-relevant part of a raw template"""
+    relevant = {key: value for key, value in template.items() if key not in NON_RECOGNITION_KEYS}
+    digest = hashlib.sha256(json.dumps(relevant, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    digest.update(f"compiler-v{COMPILER_VERSION}".encode())
+    return digest.hexdigest()
+
+
+def compile_templates(config: Dict) -> Dict[str, CompiledTemplate]:
+    """Validate and compile every template in a parsed omr_config.json"""
+    templates = config.get('templates') if isinstance(config, dict) else None
+    if not isinstance(templates, dict) or not templates:
+        raise TemplateConfigError("Config must contain a non-empty 'templates' object")
+    return {name: compile_template(name, template) for name, template in templates.items()}
+
+
+def config_hash(raw: bytes) -> str:
+    """Cache key for a config file's raw contents"""
+    digest = hashlib.sha256(raw)
+    digest.update(f"compiler-v{COMPILER_VERSION}".encode())
+    return digest.hexdigest()
+
+
+def load_compiled_templates(raw: bytes, config: Dict, cache_dir: Optional[str]) -> Dict[str, CompiledTemplate]:
+    """
+    Return the compiled templates for a config, using the in-memory cache,
+    then the on-disk cache, and compiling (and persisting) only on a miss.
+    """
+    key = config_hash(raw)
+    compiled = _memory_cache.get(key)
+    if compiled is not None:
+        return compiled
+
+    cache_path = os.path.join(cache_dir, f"templates-{key[:16]}.pkl") if cache_dir else None
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                cached = pickle.load(f)
+            if cached.get('key') == key:
+                compiled = cached['templates']
+        except Exception as e:
+            logger.warning("Ignoring unreadable template cache %s: %s", cache_path, e)
+
+    if compiled is None:
+        compiled = compile_templates(config)
+        if cache_path:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    pickle.dump({'key': key, 'templates': compiled}, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, cache_path)
+            except OSError as e:
+                # A read-only deployment still works, it just compiles on every start
+                logger.warning("Could not persist template cache %s: %s", cache_path, e)
+
+    _memory_cache[key] = compiled
+    return compiled
+
+
+if __name__ == "__main__":
+    # Validate a config file: python omr_templates.py [omr_config.json]
+    path = sys.argv[1] if len(sys.argv) > 1 else "omr_config.json"
+    with open(path, 'rb') as f:
+        raw_config = f.read()
+    try:
+        compiled_templates = compile_templates(json.loads(raw_config))
+    except (TemplateConfigError, ValueError) as e:
+        print(json.dumps({"success": False, "error": str(e)}, ensure_ascii=False))
+        sys.exit(1)
+    print(json.dumps({
+        "success": True,
+        "templates": {
+            name: {
+                "student_number_bubbles": t.student_number.rows * t.student_number.columns,
+                "questions": sum(s.question_count for s in t.sections)
+            }
+            for name, t in compiled_templates.items()
+        }
+    }, ensure_ascii=False))
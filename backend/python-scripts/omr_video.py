@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""
+Video capture mode
+Reads a filmed stack of sheets (video file, printf-style frame pattern such as
+frames/%05d.jpg, directory of frames or camera index) frame by frame. The four
+alignment markers are searched for once and then tracked from frame to frame with
+pyramidal Lucas-Kanade on a 1/TRACK_SCALE copy of the frame, so a frame costs a
+decimation and four small optical-flow windows. A sheet is read only once it has
+held still for a few frames, from the sharpest of them, and every sheet is emitted once.
+
+    python omr_video.py stack.mp4 --template YKS_STANDARD [--output ./output] [--still-frames 5]
+    python omr_video.py frames/ --template AUTO --fps 30
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
+
+import cv2
+import numpy as np
+
+from omr_output import OUTPUT_POLICIES, OutputWriter
+from omr_templates import CompiledTemplate
+from standard_omr import (
+    AUTO_TEMPLATE, DECODE_FLAGS, DEFAULT_CONFIG_PATH, IMAGE_EXTENSIONS, MARKER_PYRAMID_SCALE, OMRProcessor,
+    configure_logging, strip_timings
+)
+
+
+logger = logging.getLogger("omr")
+
+# Markers are tracked on a plain decimation of each frame, like the pyramid marker search
+TRACK_SCALE = MARKER_PYRAMID_SCALE
+TRACK_WINDOW = (21, 21)
+TRACK_LEVELS = 2
+TRACK_CRITERIA = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03)
+# A marker is lost when tracking it back to the previous frame misses by more than this
+# (tracking-scale pixels), or the marker frame changes area by more than TRACK_MAX_AREA_CHANGE
+TRACK_MAX_ERROR = 0.5
+TRACK_MAX_AREA_CHANGE = 0.2
+# Markers are searched for (before tracking, and whenever it loses them) with the contour
+# search on a 1/SEARCH_SCALE copy; the pyramid search's coarse level and refinement windows
+# reach past the narrow paper margin onto whatever the sheet lies on
+SEARCH_SCALE = 2
+
+# A frame is still when no marker moved more than this share of the marker frame diagonal
+# since the previous frame; a move beyond SHEET_MOTION (the sheet handled, not a shaking
+# hand) may have brought in another sheet
+DEFAULT_MAX_MOTION = 0.004
+SHEET_MOTION = 0.03
+# Still frames collected before the sharpest of them is read
+DEFAULT_STILL_FRAMES = 5
+# Sharpness (variance of the Laplacian) is measured on the marker frame's bounding box at 1/2
+SHARPNESS_SCALE = 2
+# A sheet swapped in place without visible movement (a frame sequence) is noticed by comparing
+# the layout-level page ink (warped from the frame blurred with a CHANGE_BLUR sigma, so the
+# eightfold reduction does not alias) with the sheet last read every CHANGE_INTERVAL still
+# frames: 1 - correlation above SHEET_CHANGE is a different sheet (the same sheet stays
+# below ~0.15 with tracked markers, one with other marks comes out near 0.4)
+CHANGE_BLUR = 2.0
+CHANGE_INTERVAL = 5
+SHEET_CHANGE = 0.25
+# A sheet already read is read again from a still window this much sharper than its best reading
+REREAD_SHARPNESS = 1.5
+DEFAULT_FPS = 30.0
+
+
+def iter_frames(source: str, fps: float = DEFAULT_FPS) -> Iterator[Tuple[int, float, np.ndarray]]:
+    """
+    (frame index, timestamp in ms, grayscale frame) of a video file, frame pattern, camera index
+    or directory of images (in name order, timed at `fps`)
+    """
+    if os.path.isdir(source):
+        names = sorted(n for n in os.listdir(source) if n.lower().endswith(IMAGE_EXTENSIONS))
+        for index, name in enumerate(names):
+            frame = cv2.imread(os.path.join(source, name), DECODE_FLAGS)
+            if frame is None:
+                logger.warning("Skipping unreadable frame %s", name)
+                continue
+            yield index, index * 1000.0 / fps, frame
+        return
+    capture = cv2.VideoCapture(int(source) if source.isdigit() else source)
+    if not capture.isOpened():
+        raise ValueError(f"Cannot open video source: {source}")
+    try:
+        index = 0
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            timestamp = capture.get(cv2.CAP_PROP_POS_MSEC) or index * 1000.0 / fps
+            yield index, timestamp, cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+            index += 1
+    finally:
+        capture.release()
+
+
+class VideoReader:
+    """
+    One result per sheet from a stream of grayscale frames (feed them in order, then flush).
+    Markers are searched for only until they are found, then tracked. A sheet is one unbroken
+    track: losing the markers, moving the sheet or a changed page under them ends it and
+    starts the next. A sheet is read once it has held still for `still_frames` frames (hand
+    shake only delays the read), and again from a clearly sharper still window; its best
+    reading is emitted when the sheet ends. Two sheets with the same marks are two results.
+    """
+
+    def __init__(
+        self,
+        processor: OMRProcessor,
+        template_name: str,
+        output_dir: str,
+        source_name: str = "video",
+        form_options: Optional[Dict] = None,
+        still_frames: int = DEFAULT_STILL_FRAMES,
+        max_motion: float = DEFAULT_MAX_MOTION
+    ):
+        processor.check_template(template_name)
+        if still_frames < 1:
+            raise ValueError(f"still_frames must be at least 1 (got {still_frames})")
+        self.processor = processor
+        self.template_name = template_name
+        self.output_dir = output_dir
+        self.source_name = source_name
+        self.form_options = dict(form_options or {})
+        self.still_frames = still_frames
+        self.max_motion = max_motion
+        # Templates to search markers with: AUTO needs one per distinct marker layout
+        if template_name == AUTO_TEMPLATE:
+            layouts: Dict[bytes, CompiledTemplate] = {}
+            for template in processor.templates.values():
+                layouts.setdefault(template.marker_positions.tobytes(), template)
+            self.search_templates: List[CompiledTemplate] = list(layouts.values())
+        else:
+            self.search_templates = [processor.get_template(template_name)]
+        self.template: Optional[CompiledTemplate] = None
+        self.previous: Optional[np.ndarray] = None
+        # Marker centres in full-resolution frame pixels, ordered tl, tr, br, bl
+        self.corners: Optional[np.ndarray] = None
+        self.still = 0
+        # Still frames since the page was last compared with the sheet read (CHANGE_INTERVAL)
+        self.unchecked = 0
+        # (sharpness, frame index, timestamp, frame, corners) of the sharpest still frame so far
+        self.best: Optional[Tuple[float, int, float, np.ndarray, np.ndarray]] = None
+        # Best reading of the sheet in view and its (confidence, sharpness); None until it is read
+        self.sheet: Optional[Dict] = None
+        self.sheet_quality: Tuple[float, float] = (0.0, 0.0)
+        self.sheet_reads = 0
+        # Layout-level page ink of the sheet in view, and the template it was read with
+        self.snapshot: Optional[Tuple[np.ndarray, CompiledTemplate]] = None
+        self.stats = {"frames": 0, "searched": 0, "tracked": 0, "lost": 0, "reads": 0, "sheets": 0}
+
+    def locate(self, frame: np.ndarray, template: CompiledTemplate, scale: int = 1) -> Optional[np.ndarray]:
+        """
+        Markers fitted to the template's layout by the contour search on a 1/scale copy of the
+        frame, in full-resolution pixels (the form-border fallback is no use on a video frame)
+        """
+        if scale > 1:
+            # Area averaging is all the smoothing a reduced copy takes: blurring it further
+            # closes the gap between the markers and the edge of the paper
+            copy = cv2.resize(frame, None, fx=1.0 / scale, fy=1.0 / scale, interpolation=cv2.INTER_AREA)
+        else:
+            copy = cv2.GaussianBlur(frame, (template.blur_kernel, template.blur_kernel), 0)
+        markers, method = self.processor.find_markers_full(copy, template)
+        if markers is None or method != "contours":
+            return None
+        return self.processor.order_points(markers) * scale + (scale - 1) / 2.0
+
+    def search(self, frame: np.ndarray) -> Optional[np.ndarray]:
+        """Markers of a frame without tracking history (first frame, or tracking lost)"""
+        self.stats["searched"] += 1
+        for template in self.search_templates:
+            corners = self.locate(frame, template, SEARCH_SCALE)
+            if corners is not None:
+                self.template = template
+                return corners
+        return None
+
+    def track(self, small: np.ndarray) -> Optional[np.ndarray]:
+        """Markers moved from the previous frame onto `small` (forward-backward checked), or None when lost"""
+        points = (self.corners / TRACK_SCALE).reshape(-1, 1, 2).astype(np.float32)
+        flow = dict(winSize=TRACK_WINDOW, maxLevel=TRACK_LEVELS, criteria=TRACK_CRITERIA)
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(self.previous, small, points, None, **flow)
+        back, back_status, _ = cv2.calcOpticalFlowPyrLK(small, self.previous, moved, None, **flow)
+        error = np.linalg.norm((back - points).reshape(-1, 2), axis=1)
+        if not (status.all() and back_status.all()) or error.max() > TRACK_MAX_ERROR:
+            return None
+        corners = moved.reshape(-1, 2) * TRACK_SCALE
+        before, after = cv2.contourArea(self.corners), cv2.contourArea(corners)
+        if not cv2.isContourConvex(corners) or abs(after - before) > TRACK_MAX_AREA_CHANGE * before:
+            return None
+        return corners
+
+    @staticmethod
+    def sharpness(frame: np.ndarray, corners: np.ndarray) -> float:
+        """Variance of the Laplacian over the marker frame's bounding box, at 1/SHARPNESS_SCALE"""
+        x, y, width, height = cv2.boundingRect(corners.astype(np.float32))
+        box = np.ascontiguousarray(frame[max(y, 0):y + height:SHARPNESS_SCALE, max(x, 0):x + width:SHARPNESS_SCALE])
+        _, deviation = cv2.meanStdDev(cv2.Laplacian(box, cv2.CV_16S))
+        return float(deviation[0, 0]) ** 2
+
+    def page_ink(self, frame: np.ndarray, corners: np.ndarray, template: CompiledTemplate) -> np.ndarray:
+        """Layout-level page ink of a frame (see OMRProcessor.page_ink)"""
+        return self.processor.page_ink(cv2.GaussianBlur(frame, (0, 0), CHANGE_BLUR), corners, template)
+
+    def sheet_changed(self, frame: np.ndarray) -> bool:
+        """Whether the page ink under the markers no longer matches the sheet last read"""
+        ink, template = self.snapshot
+        return 1.0 - float(np.dot(ink, self.page_ink(frame, self.corners, template))) > SHEET_CHANGE
+
+    def restart(self) -> None:
+        """The view moved: collect a new set of still frames"""
+        self.still = 0
+        self.unchecked = 0
+        self.best = None
+
+    def end_sheet(self) -> Optional[Dict]:
+        """
+        The track of the sheet in view ended: its best reading, with a "video" block
+        (sheet_index, frame_index, timestamp_ms, sharpness, reads), or None if it was never read
+        """
+        result = self.sheet
+        if result is not None:
+            result["video"]["sheet_index"] = self.stats["sheets"]
+            result["video"]["reads"] = self.sheet_reads
+            self.stats["sheets"] += 1
+        self.sheet = None
+        self.sheet_quality = (0.0, 0.0)
+        self.sheet_reads = 0
+        self.snapshot = None
+        return result
+
+    def flush(self) -> Optional[Dict]:
+        """End of the stream: the sheet still in view, if it was read"""
+        self.restart()
+        return self.end_sheet()
+
+    def feed(self, frame: np.ndarray, frame_index: int, timestamp_ms: float) -> Optional[Dict]:
+        """
+        Take the next grayscale frame. Returns the best reading of the previous sheet when
+        this frame ends its track (see end_sheet), else None
+        """
+        self.stats["frames"] += 1
+        small = np.ascontiguousarray(frame[::TRACK_SCALE, ::TRACK_SCALE])
+        motion = np.inf
+        if self.corners is not None:
+            corners = self.track(small)
+            if corners is None:
+                self.stats["lost"] += 1
+            else:
+                self.stats["tracked"] += 1
+                motion = float(np.abs(corners - self.corners).max())
+            self.corners = corners
+        if self.corners is None:
+            self.corners = self.search(frame)
+        self.previous = small
+        if self.corners is None or motion == np.inf:
+            # Markers lost, or found again by a search: a new track
+            self.restart()
+            return self.end_sheet()
+
+        diagonal = float(np.hypot(*(self.corners[2] - self.corners[0])))
+        if motion > self.max_motion * diagonal:
+            self.restart()
+            return self.end_sheet() if motion > SHEET_MOTION * diagonal else None
+        self.still += 1
+        ended = None
+        if self.sheet is not None:
+            self.unchecked += 1
+            if self.unchecked >= CHANGE_INTERVAL:
+                self.unchecked = 0
+                if self.sheet_changed(frame):
+                    logger.debug("Frame %d: the page changed in place", frame_index)
+                    self.restart()
+                    self.still = 1
+                    ended = self.end_sheet()
+
+        sharpness = self.sharpness(frame, self.corners)
+        if self.best is None or sharpness > self.best[0]:
+            self.best = (sharpness, frame_index, timestamp_ms, frame, self.corners.copy())
+        if self.still >= self.still_frames and (
+            self.sheet is None or self.best[0] > self.sheet_quality[1] * REREAD_SHARPNESS
+        ):
+            self.read(*self.best)
+        return ended
+
+    def read(self, sharpness: float, frame_index: int, timestamp_ms: float, frame: np.ndarray,
+             corners: np.ndarray) -> None:
+        """Read the sheet in view from one still frame; keeps the reading if it is its best so far"""
+        self.stats["reads"] += 1
+        self.still = 0
+        self.unchecked = 0
+        self.best = None
+        # Tracked centres are only as precise as the tracking scale: the sheet is read with
+        # the full-resolution markers, which tracking continues from (the sheet held still)
+        markers = self.locate(frame, self.template)
+        method = "contours"
+        if markers is None:
+            markers, method = corners, "tracked"
+        elif self.corners is not None:
+            self.corners = markers
+        result = self.processor.process_image(
+            frame, self.template_name, self.output_dir, f"{self.source_name}_f{frame_index}",
+            located=(markers, method), **self.form_options
+        )
+        if not result.get("success"):
+            logger.debug("Frame %d not read: %s", frame_index, result.get("error"))
+            return
+
+        self.sheet_reads += 1
+        if self.snapshot is None:
+            read_template = self.processor.get_template(result.get("template_name", self.template_name))
+            self.snapshot = (self.page_ink(frame, markers, read_template), read_template)
+        quality = (result["confidence_score"], sharpness)
+        if self.sheet is not None and quality <= self.sheet_quality:
+            # Still raises the bar for another re-read
+            self.sheet_quality = (self.sheet_quality[0], max(self.sheet_quality[1], sharpness))
+            return
+        result["video"] = {
+            "frame_index": frame_index,
+            "timestamp_ms": round(timestamp_ms, 1),
+            "sharpness": round(sharpness, 1)
+        }
+        self.sheet = result
+        self.sheet_quality = quality
+
+
+def run_video(
+    source: str,
+    config_path: str,
+    template_name: str,
+    output_dir: str,
+    stdout: TextIO,
+    form_options: Optional[Dict] = None,
+    fps: float = DEFAULT_FPS,
+    still_frames: int = DEFAULT_STILL_FRAMES,
+    max_motion: float = DEFAULT_MAX_MOTION,
+    read_threads: int = 1,
+    roster_path: Optional[str] = None
+) -> int:
+    """
+    Read every sheet of a filmed stack and write one NDJSON result per sheet as soon as its
+    track ends (the next sheet comes into view, or the stream ends; a camera runs until Ctrl-C)
+    """
+    processor = OMRProcessor(config_path, read_threads=read_threads, roster_path=roster_path)
+    processor.writer = OutputWriter()
+    form_options = dict(form_options or {})
+    report_timings = form_options.get("timings", False)
+    source_name = os.path.splitext(os.path.basename(os.path.normpath(source)))[0] or "video"
+    reader = VideoReader(processor, template_name, output_dir, source_name, form_options, still_frames, max_motion)
+    def emit(result: Optional[Dict]) -> None:
+        if result is None:
+            return
+        if not report_timings:
+            strip_timings(result)
+        stdout.write(json.dumps(result, ensure_ascii=False) + "\n")
+        stdout.flush()
+
+    started = time.perf_counter()
+    try:
+        for frame_index, timestamp, frame in iter_frames(source, fps):
+            emit(reader.feed(frame, frame_index, timestamp))
+    except KeyboardInterrupt:
+        # A live camera is read until interrupted
+        logger.info("Stopped")
+    finally:
+        emit(reader.flush())
+        processor.writer.close()
+    elapsed = time.perf_counter() - started
+    stats = reader.stats
+    logger.info("Video finished: %d frames (%.1f fps), %d sheets, %s", stats["frames"],
+                stats["frames"] / elapsed if elapsed > 0 else 0.0, stats["sheets"], stats)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read a filmed stack of OMR sheets")
+    parser.add_argument("source", help="Video file, frame pattern (frames/%%05d.jpg), directory of frames or camera index")
+    parser.add_argument("--config", default=DEFAULT_CONFIG_PATH)
+    parser.add_argument("--template", default="YKS_STANDARD",
+                        help=f"Template name; {AUTO_TEMPLATE} recognises each sheet's template")
+    parser.add_argument("--output", default="./output", help="Output directory")
+    parser.add_argument("--fps", type=float, default=DEFAULT_FPS,
+                        help=f"Frame rate of a directory of frames, for timestamps (default: {DEFAULT_FPS:g})")
+    parser.add_argument("--still-frames", type=int, default=DEFAULT_STILL_FRAMES,
+                        help=f"Still frames before a sheet is read (default: {DEFAULT_STILL_FRAMES})")
+    parser.add_argument("--max-motion", type=float, default=DEFAULT_MAX_MOTION,
+                        help=f"Largest marker movement of a still frame, as a share of the marker frame (default: {DEFAULT_MAX_MOTION:g})")
+    parser.add_argument("--read-threads", type=int, default=1, help="Threads reading the regions of one sheet")
+    parser.add_argument("--roster", metavar="FILE", default=None,
+                        help="Student roster export (CSV / JSON) to resolve student numbers against")
+    parser.add_argument("--output-policy", choices=OUTPUT_POLICIES, default=None,
+                        help="Output images to write: none, thumbnail, roi or full (default: per template)")
+    parser.add_argument("--timings", action="store_true", help="Include per-stage milliseconds in each result")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--log-file", default=None)
+    options = parser.parse_args()
+    configure_logging(options.log_level, options.log_file)
+
+    try:
+        code = run_video(
+            options.source, options.config, options.template, options.output, sys.stdout,
+            {"output_policy": options.output_policy, "timings": options.timings},
+            options.fps, options.still_frames, options.max_motion, options.read_threads, options.roster
+        )
+    except (OSError, ValueError) as e:
+        print(json.dumps({"success": False, "error": str(e)}))
+        code = 1
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
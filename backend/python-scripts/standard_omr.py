@@ -7,20 +7,227 @@ Processes scanned exam forms to detect student numbers and answers
 import cv2
 import numpy as np
 import imutils
+import argparse
+import base64
+import binascii
+import contextlib
+import functools
+import itertools
 import json
+import logging
+import multiprocessing.util
 import sys
 import os
-from typing import Dict, List, Tuple, Optional
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Tuple, Optional, TextIO
 from pathlib import Path
 
+from omr_answer_store import AnswerStore, template_layout
+from omr_metrics import Metrics, Profiler, merge_profiles
+from omr_output import OUTPUT_POLICIES, OutputWriter, write_jpeg
+from omr_result_cache import ResultCache, content_digest, file_digest
+from omr_roster import RosterIndex
+from omr_templates import (
+    LAYOUT_MAP_SCALE, CompiledGrid, CompiledTemplate, grid_boxes, load_compiled_templates,
+    ring_offsets
+)
+
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "omr_config.json")
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+# Downscale factor of the coarse level used to locate alignment markers
+MARKER_PYRAMID_SCALE = 4
+# Marker candidate filters and layout fit
+MARKER_MIN_FILL = 0.6          # blob area / bounding-box area (solid squares ~1.0, discs ~0.79)
+MARKER_FIT_POOL = 10           # largest candidates considered by the layout fit (210 subsets)
+MARKER_FIT_TOLERANCE = 0.03    # max fit residual, as a fraction of the marker frame diagonal
+MARKER_MIN_FRAME = 0.5         # min marker frame diagonal, as a fraction of the image diagonal
+# Part of every result cache key: bump when a change to the recognition code alters results
+RESULT_CACHE_VERSION = 6
+# Pages are decoded straight to one channel; colour is only needed for annotated outputs
+DECODE_FLAGS = cv2.IMREAD_GRAYSCALE
+
+# Template name that asks for the template to be recognised from the page itself
+AUTO_TEMPLATE = "AUTO"
+# Minimum correlation between a page and a template's layout map to accept the template
+TEMPLATE_MIN_SCORE = 0.15
+
+# Quality gate: blank and blur checks look at a 1/QUALITY_GATE_SCALE decimated copy of the page
+QUALITY_GATE_SCALE = 8
+# A pixel is ink when it is this many grey levels darker than the paper (90th percentile level)
+BLANK_INK_CONTRAST = 64
+# Clockwise page rotations tried by the orientation check
+ROTATIONS = (0, 90, 180, 270)
+# Error of a result rejected by the quality gate, by gate
+QUALITY_GATE_ERRORS = {"blank": "Blank page", "blur": "Scan too blurry to read"}
+
+# Reading confidence: a row (answer question or student number digit) whose weakest mark and
+# strongest empty bubble are this far from the fill threshold is read with full confidence
+CONFIDENT_MARGIN = 0.08
+# Cascaded re-read of ambiguous rows (see reread_lines): ink is the mean darkness inside the
+# printed ring relative to the paper level of its grid (the PAPER_QUANTILE grey level)
+PAPER_QUANTILE = 0.9
+LOCAL_INK_THRESHOLD = 0.3
+LOCAL_CONFIDENT_MARGIN = 0.1
+# A row is also re-read when one of its bubbles is this much darker (or a mark this little
+# darker) than the row's typical grey level, as a share of that level (grey levels for this
+# check are sampled at CompiledGrid.ring_samples)
+GRAY_CONTRAST = 0.1
+# Lattice shift searched by the realign level, in template pixels
+REALIGN_RADIUS = 3
+
+# Logs go to stderr (or --log-file); stdout is reserved for JSON results
+logger = logging.getLogger("omr")
+
+
+def line_decisions(scores: np.ndarray, threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Marks of a (lines x bubbles) score matrix and each line's margin: the distance of its
+    weakest mark and of its strongest empty bubble from the threshold, whichever is smaller
+    """
+    marked = scores >= threshold
+    weakest = np.where(marked, scores, np.inf).min(axis=1) - threshold
+    strongest = threshold - np.where(marked, -np.inf, scores).max(axis=1)
+    return marked, np.minimum(weakest, strongest)
+
+
+@dataclass
+class PageBuffers:
+    """
+    Shared per-page preprocessing results in template coordinates.
+    Region readers take zero-copy views into these buffers.
+    Either a whole page (`blurred` / `binary`) or, when only the read regions
+    were warped, one binarised buffer per grid (`regions`).
+    """
+    blurred: Optional[np.ndarray] = None
+    # Binarised page (ink = 255); None when the template thresholds per region
+    binary: Optional[np.ndarray] = None
+    # Binarised region buffers keyed by grid name
+    regions: Optional[Dict[str, np.ndarray]] = None
+    # Blurred grayscale region buffers (before binarisation) keyed by grid name
+    gray_regions: Optional[Dict[str, np.ndarray]] = None
+
+    def region_binary(self, grid: CompiledGrid) -> np.ndarray:
+        """Binarised view of one grid's region"""
+        if self.regions is not None:
+            return self.regions[grid.name]
+        if self.binary is not None:
+            return self.binary[grid.roi]
+        return cv2.threshold(self.blurred[grid.roi], 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)[1]
+
+    def region_gray(self, grid: CompiledGrid) -> np.ndarray:
+        """
+        Blurred grayscale (height x width) region of one grid; on a page smaller than the
+        template (read without markers) the part past the page edge repeats its border
+        """
+        if self.gray_regions is not None:
+            return self.gray_regions[grid.name]
+        gray = self.blurred[grid.roi]
+        if gray.shape == (grid.height, grid.width):
+            return gray
+        if not gray.size:
+            return np.full((grid.height, grid.width), 255, dtype=np.uint8)
+        return cv2.copyMakeBorder(gray, 0, grid.height - gray.shape[0], 0, grid.width - gray.shape[1],
+                                  cv2.BORDER_REPLICATE)
+
 
 class OMRProcessor:
     """Main OMR processing class"""
     
-    def __init__(self, config_path: str):
-        """Initialize OMR processor with configuration"""
-        with open(config_path, 'r', encoding='utf-8') as f:
-            self.config = json.load(f)
+    def __init__(
+        self,
+        config_path: str,
+        cache_dir: Optional[str] = None,
+        result_cache_mb: Optional[float] = None,
+        read_threads: int = 1,
+        roster_path: Optional[str] = None
+    ):
+        """
+        Initialize OMR processor with configuration.
+        Compiled template geometry is cached in `cache_dir`
+        (default: .omr_cache next to the config file).
+        With `result_cache_mb`, results are cached by image content in
+        <cache_dir>/results.sqlite, capped at that size (LRU eviction).
+        With `read_threads` > 1 the regions of one form (student number and each
+        answer section) are warped and scored concurrently on that many threads.
+        With `roster_path` (an exported student list, see omr_roster.py) student numbers
+        are resolved against the roster from the bubble fill ratios.
+        """
+        self.config_path = config_path
+        self.cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(config_path)), ".omr_cache")
+        self.config_mtime = 0.0
+        # Background writer for annotated outputs; None writes synchronously
+        self.writer: Optional[OutputWriter] = None
+        self.result_cache: Optional[ResultCache] = None
+        # Page-sized working buffers (blurred page, warped regions), reused from form to form
+        self.buffers: Dict[str, np.ndarray] = {}
+        if read_threads < 1:
+            raise ValueError(f"read_threads must be at least 1 (got {read_threads})")
+        self.read_threads = read_threads
+        # Started on first use; one pool per processor, shared by all its forms
+        self.read_pool: Optional[ThreadPoolExecutor] = None
+        self.roster: Optional[RosterIndex] = RosterIndex.load(roster_path) if roster_path else None
+        if result_cache_mb is not None:
+            self.result_cache = ResultCache(
+                os.path.join(self.cache_dir, "results.sqlite"), int(result_cache_mb * 1024 * 1024)
+            )
+        self.load_config()
+
+    def load_config(self) -> None:
+        """
+        (Re)load and compile the configuration file.
+        The current configuration is kept if the new file cannot be parsed
+        or contains an invalid template (TemplateConfigError).
+        """
+        mtime = os.path.getmtime(self.config_path)
+        with open(self.config_path, 'rb') as f:
+            raw = f.read()
+        config = json.loads(raw.decode('utf-8'))
+        templates = load_compiled_templates(raw, config, self.cache_dir)
+        self.config = config
+        self.templates = templates
+        self.config_mtime = mtime
+
+    def reload_if_changed(self) -> bool:
+        """
+        Reload the configuration if the file changed on disk since the last load.
+        Returns True if a reload happened
+        """
+        try:
+            mtime = os.path.getmtime(self.config_path)
+        except OSError:
+            return False
+        if mtime == self.config_mtime:
+            return False
+        self.load_config()
+        return True
+    
+    def work_buffer(self, name: str, shape: Tuple[int, ...]) -> np.ndarray:
+        """
+        Preallocated uint8 buffer for one pipeline stage, reused by every form of the
+        same size (reallocated only when the size changes). Its contents are
+        overwritten by the next form, so results must not keep references to it.
+        """
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.shape != shape:
+            buffer = self.buffers[name] = np.empty(shape, dtype=np.uint8)
+        return buffer
+    
+    def map_grids(self, fn: Callable[[object], object], grids: List) -> List:
+        """
+        fn(grid) for every grid (or per-grid work item), in grid order. With read_threads > 1 the calls run
+        on the read pool; OpenCV and NumPy release the GIL for the pixel work, and
+        each grid only touches its own region buffer.
+        """
+        if self.read_threads == 1 or len(grids) < 2:
+            return [fn(grid) for grid in grids]
+        if self.read_pool is None:
+            self.read_pool = ThreadPoolExecutor(max_workers=self.read_threads, thread_name_prefix="omr-read")
+        return list(self.read_pool.map(fn, grids))
     
     def order_points(self, pts: np.ndarray) -> np.ndarray:
         """
@@ -43,6 +250,13 @@ class OMRProcessor:
         """
         Apply perspective transform to get bird's eye view
         """
+        M, size = self.perspective_matrix(pts)
+        return cv2.warpPerspective(image, M, size)
+    
+    def perspective_matrix(self, pts: np.ndarray) -> Tuple[np.ndarray, Tuple[int, int]]:
+        """
+        Perspective transform matrix and output (width, height) for four_point_transform
+        """
         rect = self.order_points(pts)
         (tl, tr, br, bl) = rect
         
@@ -64,98 +278,238 @@ class OMRProcessor:
             [0, maxHeight - 1]
         ], dtype="float32")
         
-        # Compute perspective transform matrix and apply it
+        # Compute perspective transform matrix
         M = cv2.getPerspectiveTransform(rect, dst)
-        warped = cv2.warpPerspective(image, M, (maxWidth, maxHeight))
-        
-        return warped
+        return M, (maxWidth, maxHeight)
     
-    def find_alignment_markers(self, image: np.ndarray) -> Optional[np.ndarray]:
+    def find_alignment_markers(
+        self,
+        image: np.ndarray,
+        blurred: Optional[np.ndarray] = None,
+        template: Optional[CompiledTemplate] = None
+    ) -> Optional[np.ndarray]:
         """
         Find 4 corner alignment markers on the form
+        `blurred` is an optional precomputed blurred grayscale version of `image`
         Returns array of 4 corner points or None if not found
         """
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+        markers, _ = self.locate_markers(image, blurred, template)
+        return markers
+    
+    def locate_markers(
+        self,
+        image: np.ndarray,
+        blurred: Optional[np.ndarray] = None,
+        template: Optional[CompiledTemplate] = None
+    ) -> Tuple[Optional[np.ndarray], str]:
+        """
+        Coarse-to-fine marker search: markers are located on a reduced-resolution
+        level first and refined in small full-resolution windows. Falls back to the
+        full-resolution contour search and then to the form border (Canny).
+        Returns (corners, method) with method "pyramid", "contours", "border" or "none"
+        """
+        if blurred is None:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+            blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+        
+        markers = self.find_markers_pyramid(blurred, template)
+        if markers is not None:
+            return markers, "pyramid"
+        logger.debug("Pyramid marker search failed, falling back to full resolution")
+        return self.find_markers_full(blurred, template)
+    
+    def marker_components(self, thresh: np.ndarray, min_area: float, max_area: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Solid, roughly square blobs in a binary image that could be alignment markers,
+        filtered on connected-component statistics (area, bounding-box aspect ratio, fill density)
+        Returns (centres as N x 2 float32, areas as N float32)
+        """
+        try:
+            # 16-bit labels roughly halve the labelling cost; OpenCV refuses them once
+            # a (very noisy) image has more than 65535 components
+            _, _, stats, centroids = cv2.connectedComponentsWithStats(thresh, connectivity=8, ltype=cv2.CV_16U)
+        except cv2.error:
+            _, _, stats, centroids = cv2.connectedComponentsWithStats(thresh, connectivity=8, ltype=cv2.CV_32S)
+        # Label 0 is the background
+        stats, centroids = stats[1:], centroids[1:]
+        widths = stats[:, cv2.CC_STAT_WIDTH].astype(np.float32)
+        heights = stats[:, cv2.CC_STAT_HEIGHT].astype(np.float32)
+        areas = stats[:, cv2.CC_STAT_AREA].astype(np.float32)
+        aspect = widths / heights
+        # Markers are solid; empty bubble rings and thin lines fill little of their box
+        density = areas / (widths * heights)
+        keep = (
+            (areas > min_area) & (areas < max_area)
+            & (aspect >= 0.7) & (aspect <= 1.3)
+            & (density >= MARKER_MIN_FILL)
+        )
+        logger.debug("Components: %d, marker candidates: %d", len(areas), int(keep.sum()))
+        return centroids[keep].astype(np.float32), areas[keep]
+    
+    def marker_candidates(self, thresh: np.ndarray, min_area: float, max_area: float) -> List[Tuple[float, float, float]]:
+        """
+        Square/round blobs in a binary image that could be alignment markers
+        Returns a list of (center_x, center_y, area)
+        """
+        centres, areas = self.marker_components(thresh, min_area, max_area)
+        return [(float(x), float(y), float(a)) for (x, y), a in zip(centres, areas)]
+    
+    def fit_marker_layout(
+        self,
+        pts: np.ndarray,
+        areas: np.ndarray,
+        template: CompiledTemplate,
+        image_size: Tuple[int, int]
+    ) -> Optional[np.ndarray]:
+        """
+        Choose the 4 candidates whose arrangement best matches the template's marker layout:
+        every 4-subset of the largest candidates is ordered tl, tr, br, bl and fitted to the
+        template positions with a least-squares affine transform; the smallest residual wins.
+        Stray blobs that pass the candidate filters do not fit the layout and are ignored.
+        Returns 4 corners ordered tl, tr, br, bl, or None if no subset fits
+        """
+        # Ignore small blobs (bubbles) when large ones exist, and bound the subset count
+        large = np.flatnonzero(areas >= areas.max() * 0.25)
+        pool = large[np.argsort(-areas[large], kind="stable")][:MARKER_FIT_POOL]
+        if len(pool) < 4:
+            return None
+        
+        subsets = np.array(list(itertools.combinations(pool, 4)), dtype=np.intp)
+        quads = pts[subsets]
+        # Order each subset tl, tr, br, bl (as order_points does) and drop degenerate ones
+        sums, diffs = quads.sum(axis=2), np.diff(quads, axis=2)[:, :, 0]
+        order = np.stack([sums.argmin(1), diffs.argmin(1), sums.argmax(1), diffs.argmax(1)], axis=1)
+        valid = np.array([len(set(row)) == 4 for row in order])
+        if not valid.any():
+            return None
+        quads = np.take_along_axis(quads, order[:, :, None], axis=1)[valid]
+        
+        # One shared least-squares solve: quads ~ [x y 1] @ params for every subset at once
+        layout = self.order_points(template.marker_positions).astype(np.float64)
+        design = np.hstack([layout, np.ones((4, 1))])
+        fitted = design @ (np.linalg.pinv(design) @ quads)
+        diagonals = np.hypot(*(quads[:, 2] - quads[:, 0]).T)
+        residuals = np.linalg.norm(fitted - quads, axis=2).max(axis=1) / np.maximum(diagonals, 1.0)
+        # Markers sit near the page corners: the frame must span a good part of the image
+        residuals[diagonals < MARKER_MIN_FRAME * np.hypot(*image_size)] = np.inf
+        
+        best = int(np.argmin(residuals))
+        if residuals[best] > MARKER_FIT_TOLERANCE:
+            logger.debug("No candidate subset fits the marker layout (best residual %.3f)", residuals[best])
+            return None
+        return quads[best].astype(np.float32)
+    
+    def find_markers_pyramid(self, blurred: np.ndarray, template: Optional[CompiledTemplate] = None) -> Optional[np.ndarray]:
+        """
+        Locate markers on a 1/MARKER_PYRAMID_SCALE level, then refine each one
+        with sub-pixel centroids inside a small full-resolution window.
+        With a template, the candidates that best fit its marker layout are used;
+        without one, the outermost candidates are used.
+        Returns 4 corners ordered tl, tr, br, bl, or None
+        """
+        scale = MARKER_PYRAMID_SCALE
+        height, width = blurred.shape[:2]
+        # The page is already blurred, so plain decimation is enough for blobs the size of a marker
+        # (and far cheaper than an area resize or a second, reduced decode of the file)
+        coarse = blurred[::scale, ::scale]
+        thresh = cv2.threshold(coarse, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)[1]
+        thresh = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3)))
+        
+        # Same area limits as the full-resolution search, scaled to this level
+        pts, areas = self.marker_components(thresh, 50.0 / scale ** 2, 10000.0 / scale ** 2)
+        if len(pts) < 4:
+            return None
+        
+        if template is not None:
+            coarse_corners = self.fit_marker_layout(pts, areas, template, (coarse.shape[1], coarse.shape[0]))
+            if coarse_corners is None:
+                return None
+            coarse_areas = np.array([areas[np.argmin(np.abs(pts - c).sum(axis=1))] for c in coarse_corners])
+        else:
+            coarse_corners = self.order_points(pts)
+            coarse_areas = np.array([areas[np.argmin(np.abs(pts - c).sum(axis=1))] for c in coarse_corners])
+        
+        refined = np.zeros((4, 2), dtype=np.float32)
+        for i, ((cx, cy), area) in enumerate(zip(coarse_corners, coarse_areas)):
+            # Window of ~1.5 marker sizes around the coarse position, in full-resolution pixels
+            half = max(24.0, 1.5 * np.sqrt(area) * scale)
+            point = self.refine_marker(blurred, cx * scale, cy * scale, half)
+            if point is None:
+                return None
+            refined[i] = point
+        return refined
+    
+    def refine_marker(self, blurred: np.ndarray, cx: float, cy: float, half: float) -> Optional[Tuple[float, float]]:
+        """
+        Sub-pixel marker centre from the blob nearest (cx, cy) inside a
+        (2*half)-sized full-resolution window
+        """
+        height, width = blurred.shape[:2]
+        x0, y0 = max(0, int(cx - half)), max(0, int(cy - half))
+        x1, y1 = min(width, int(cx + half) + 1), min(height, int(cy + half) + 1)
+        if x1 - x0 < 3 or y1 - y0 < 3:
+            return None
+        
+        window = blurred[y0:y1, x0:x1]
+        thresh = cv2.threshold(window, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)[1]
+        # Same opening as the full-resolution search, to detach the marker from thin border lines
+        thresh = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5)))
+        count, _, stats, centroids = cv2.connectedComponentsWithStats(thresh, connectivity=8)
+        if count <= 1:
+            return None
+        
+        # Among the larger blobs, take the one closest to the expected centre
+        areas = stats[1:, cv2.CC_STAT_AREA]
+        dist = np.hypot(centroids[1:, 0] - (cx - x0), centroids[1:, 1] - (cy - y0))
+        dist[areas < areas.max() * 0.25] = np.inf
+        best = int(np.argmin(dist)) + 1
+        return float(centroids[best, 0] + x0), float(centroids[best, 1] + y0)
+    
+    def find_markers_full(
+        self, blurred: np.ndarray, template: Optional[CompiledTemplate] = None
+    ) -> Tuple[Optional[np.ndarray], str]:
+        """
+        Full-resolution marker search (corner markers, then the form border)
+        Returns (corners, method) with method "contours", "border" or "none"
+        """
         # Use Otsu's thresholding for alignment markers (solid blocks)
-        thresh = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)[1]
+        thresh = self.work_buffer("thresh", blurred.shape)
+        cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU, dst=thresh)
         
-        # Apply morphological opening to disconnect markers from border or artifacts
+        # Apply morphological opening to disconnect markers from border or artifacts (in place)
         kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5))
-        thresh = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel)
-        
-        # Find contours
-        cnts = cv2.findContours(thresh.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        cnts = imutils.grab_contours(cnts)
+        cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel, dst=thresh)
         
         # Strategy 1: Look for 4 corner markers (small squares/circles)
-        potential_markers = []
-        if len(cnts) > 0:
-            print(f"DEBUG: Total Contours Found: {len(cnts)}")
-            for i, c in enumerate(cnts[:5]):
-                print(f"DEBUG: Contour {i} Area: {cv2.contourArea(c)}")
-        else:
-            print("DEBUG: NO CONTOURS FOUND!")
-        for c in cnts:
-            # Filter by area and aspect ratio
-            area = cv2.contourArea(c)
-            if area > 1000:
-                 peri_debug = cv2.arcLength(c, True)
-                 approx_debug = cv2.approxPolyDP(c, 0.04 * peri_debug, True)
-                 rect_debug = cv2.boundingRect(approx_debug)
-                 ar_debug = rect_debug[2] / float(rect_debug[3])
-                 print(f"DEBUG: Promising Contour! Area={area}, vertices={len(approx_debug)}, AR={ar_debug:.2f}")
-
-            if 50 < area < 10000: # Increased upper limit to support larger markers (e.g. 80x80=6400)
-                peri = cv2.arcLength(c, True)
-                approx = cv2.approxPolyDP(c, 0.04 * peri, True)
-                
-                # Markers are usually squares (4 points) or circles
-                if 4 <= len(approx) <= 8:
-                    (x, y, w, h) = cv2.boundingRect(approx)
-                    aspect_ratio = w / float(h)
-                    
-                    if 0.7 <= aspect_ratio <= 1.3:
-                        # Get center of marker
-                        M = cv2.moments(c)
-                        if M["m00"] != 0:
-                            cX = int(M["m10"] / M["m00"])
-                            cY = int(M["m01"] / M["m00"])
-                            potential_markers.append((cX, cY))
-                            print(f"DEBUG: Candidate at ({cX}, {cY}) | Area={area:.0f} | AR={aspect_ratio:.2f} | Approx={len(approx)}")
-
-        print(f"DEBUG: Found {len(potential_markers)} potential markers")
-        if len(potential_markers) >= 4:
-            # Sort potential markers to find the 4 outermost ones
-            # First by Y to get top/bottom, then by X
-            potential_markers = sorted(potential_markers, key=lambda x: (x[1], x[0]))
-            
-            # This is a bit naive, let's take the 4 corners of the bounding box of markers
-            pts = np.array(potential_markers, dtype="float32")
-            
-            # If we have many markers, we need to pick the 4 that form the largest rectangle
-            # For simplicity, if we have 4, use them.
-            if len(potential_markers) == 4:
-                return pts
+        # Increased upper area limit to support larger markers (e.g. 80x80=6400)
+        centres, areas = self.marker_components(thresh, 50, 10000)
+
+        if len(centres) >= 4:
+            if template is not None:
+                # Pick the candidates that match the template's marker layout; stray blobs are ignored
+                fitted = self.fit_marker_layout(centres, areas, template, (blurred.shape[1], blurred.shape[0]))
+                if fitted is not None:
+                    return fitted, "contours"
             else:
-                # Find 4 corners that form the largest area
-                # (Skipping complex hull logic for now, using a simplified version)
-                rect = self.order_points(pts)
-                return rect
+                # Without a layout to fit, take the 4 outermost candidates
+                pts = np.array(sorted((int(x), int(y)) for x, y in centres), dtype="float32")
+                if len(pts) == 4:
+                    return pts, "contours"
+                return self.order_points(pts), "contours"
 
         # Strategy 2: Look for a single large contour (the form border)
         edged = cv2.Canny(blurred, 75, 200)
-        cnts = cv2.findContours(edged.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        cnts = cv2.findContours(edged, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         cnts = imutils.grab_contours(cnts)
         cnts = sorted(cnts, key=cv2.contourArea, reverse=True)[:5]
         
         for c in cnts:
             peri = cv2.arcLength(c, True)
             approx = cv2.approxPolyDP(c, 0.02 * peri, True)
-            if len(approx) == 4 and cv2.contourArea(c) > (image.shape[0] * image.shape[1] * 0.2):
-                return approx.reshape(4, 2)
+            if len(approx) == 4 and cv2.contourArea(c) > (blurred.shape[0] * blurred.shape[1] * 0.2):
+                return approx.reshape(4, 2).astype("float32"), "border"
         
-        return None
+        return None, "none"
     
     def extract_roi(self, image: np.ndarray, x: int, y: int, width: int, height: int) -> np.ndarray:
         """
@@ -163,6 +517,185 @@ class OMRProcessor:
         """
         return image[y:y+height, x:x+width]
     
+    def get_template(self, template_name: str) -> CompiledTemplate:
+        """
+        Return the compiled geometry for a template
+        """
+        template = self.templates.get(template_name)
+        if template is None:
+            raise ValueError(f"Unknown template: {template_name}")
+        return template
+    
+    def check_template(self, template_name: str) -> None:
+        """Fail fast on an unknown template name; AUTO_TEMPLATE is always accepted"""
+        if template_name != AUTO_TEMPLATE:
+            self.get_template(template_name)
+    
+    def page_ink(
+        self, blurred: np.ndarray, markers: np.ndarray, template: CompiledTemplate, rotation: int = 0
+    ) -> np.ndarray:
+        """
+        The page warped into the template frame at the layout map's resolution, as
+        zero-mean, unit-norm ink darkness (flattened), ready to correlate with layout_map
+        """
+        homography, _ = self.template_homography(markers, template, rotation)
+        scale = np.diag([1.0 / LAYOUT_MAP_SCALE, 1.0 / LAYOUT_MAP_SCALE, 1.0])
+        height, width = template.layout_map.shape
+        warped = cv2.warpPerspective(blurred, scale @ homography, (width, height),
+                                     flags=cv2.INTER_LINEAR, borderValue=255)
+        ink = 255.0 - warped.astype(np.float32).ravel()
+        ink -= ink.mean()
+        norm = float(np.linalg.norm(ink))
+        return ink / norm if norm > 0 else ink
+    
+    def quality_gate(self, gray: np.ndarray, template: CompiledTemplate) -> Dict:
+        """
+        Cheap checks on a 1/QUALITY_GATE_SCALE copy of the page, before any recognition:
+          ink        share of pixels clearly darker than the paper; below blank_max_ink the page is blank
+          sharpness  variance of the Laplacian; below min_sharpness the scan is too blurry to read
+        Returns {"fired": None, "blank" or "blur", "ink": ..., "sharpness": ..., "rotation": 0};
+        the rotation is filled in once markers are found (see page_orientation)
+        """
+        # Plain decimation: an area resize of the full page would cost more than all the checks
+        small = np.ascontiguousarray(gray[::QUALITY_GATE_SCALE, ::QUALITY_GATE_SCALE])
+        # Paper level and ink share from the histogram; no sort of the pixels is needed
+        cumulative = np.cumsum(cv2.calcHist([small], [0], None, [256], [0, 256]).ravel())
+        paper = int(np.searchsorted(cumulative, 0.9 * cumulative[-1]))
+        level = paper - BLANK_INK_CONTRAST
+        ink = float(cumulative[level - 1]) / small.size if level > 0 else 0.0
+        _, deviation = cv2.meanStdDev(cv2.Laplacian(small, cv2.CV_16S))
+        sharpness = float(deviation[0, 0]) ** 2
+        
+        fired = None
+        if ink < template.blank_max_ink:
+            fired = "blank"
+        elif sharpness < template.min_sharpness:
+            fired = "blur"
+        return {"fired": fired, "ink": round(ink, 4), "sharpness": round(sharpness, 2), "rotation": 0}
+    
+    def page_orientation(
+        self, blurred: np.ndarray, markers: np.ndarray, template: CompiledTemplate
+    ) -> Tuple[int, Dict[int, float]]:
+        """
+        Which way round a page was scanned. Four corner markers on a rectangle look the same
+        turned 180 degrees (and fit the layout turned 90 degrees), so the page is correlated
+        with the template's layout map under each of the four marker correspondences instead;
+        the printed regions are not symmetric.
+        Returns (clockwise rotation in degrees, {rotation: score} of the rotations tried)
+        """
+        layout = template.layout_map.ravel()
+        scores: Dict[int, float] = {}
+        for rotation in ROTATIONS:
+            scores[rotation] = float(np.dot(layout, self.page_ink(blurred, markers, template, rotation)))
+            if rotation == 0 and scores[0] >= TEMPLATE_MIN_SCORE:
+                # Upright pages, nearly all of them, cost one low-resolution warp
+                break
+        best = max(scores, key=scores.get)
+        if scores[best] < TEMPLATE_MIN_SCORE:
+            # Nothing matches well enough to overrule the page as scanned
+            best = 0
+        return best, scores
+    
+    def detect_template(
+        self,
+        image: np.ndarray,
+        blurred: np.ndarray
+    ) -> Tuple[Optional[str], Dict, Optional[Tuple[Optional[np.ndarray], str]]]:
+        """
+        Recognise which configured template a page was printed from.
+        Markers are located once per distinct marker layout; the page is then warped
+        into each template's frame at 1/LAYOUT_MAP_SCALE and correlated with the
+        template's layout_map (bubble lattice and region positions). Only when no template
+        matches upright are the other page rotations tried (templates with detect_rotation).
+        Returns (template name or None, {"scores": {...}, "rotation": degrees},
+        (markers, method) of the chosen template)
+        """
+        located: Dict[bytes, Tuple[Optional[np.ndarray], str]] = {}
+        inks: Dict[Tuple, np.ndarray] = {}
+        scores: Dict[str, float] = {}
+        rotations: Dict[str, int] = {}
+        
+        def score(name: str, template: CompiledTemplate, rotation: int) -> None:
+            layout = template.marker_positions.tobytes()
+            if layout not in located:
+                located[layout] = self.locate_markers(image, blurred, template)
+            markers, _ = located[layout]
+            if markers is None:
+                return
+            # Templates with the same markers and frame size share one warped page
+            key = (layout, template.layout_map.shape, rotation)
+            if key not in inks:
+                inks[key] = self.page_ink(blurred, markers, template, rotation)
+            value = float(np.dot(template.layout_map.ravel(), inks[key]))
+            if name not in scores or value > scores[name]:
+                scores[name], rotations[name] = value, rotation
+        
+        for name, template in self.templates.items():
+            score(name, template, 0)
+        if not scores or max(scores.values()) < TEMPLATE_MIN_SCORE:
+            for name, template in self.templates.items():
+                if template.detect_rotation:
+                    for rotation in ROTATIONS[1:]:
+                        score(name, template, rotation)
+        
+        best = max(scores, key=scores.get) if scores else None
+        detection = {"scores": {name: round(value, 4) for name, value in scores.items()}}
+        if best is None or scores[best] < TEMPLATE_MIN_SCORE:
+            logger.debug("No template matched: %s", detection["scores"])
+            return None, detection, None
+        detection["rotation"] = rotations[best]
+        logger.debug("Detected template %s: %s", best, detection)
+        return best, detection, located[self.templates[best].marker_positions.tobytes()]
+    
+    def binarize(self, roi: np.ndarray) -> np.ndarray:
+        """
+        Grayscale, blur and Otsu-threshold a region (ink = 255)
+        """
+        gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY) if len(roi.shape) == 3 else roi
+        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+        # Use Otsu's thresholding for better handling of solid bubbles
+        # This avoids the "hollowing" effect of adaptive thresholding on large solid regions
+        return cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)[1]
+    
+    def score_bubbles(
+        self,
+        thresh: np.ndarray,
+        box_x1: np.ndarray,
+        box_x2: np.ndarray,
+        box_y1: np.ndarray,
+        box_y2: np.ndarray,
+        threshold: float
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score every bubble box of a grid against a thresholded ROI in one pass
+        Returns (filled, fill_ratios) matrices of shape rows x cols
+        """
+        height, width = thresh.shape[:2]
+        
+        # Clip boxes to the ROI (a box may be partly or fully outside it)
+        x1 = np.clip(box_x1, 0, width)
+        x2 = np.clip(box_x2, 0, width)
+        y1 = np.clip(box_y1, 0, height)
+        y2 = np.clip(box_y2, 0, height)
+        
+        # Count ink pixels in every box at once with an integral image
+        integral = cv2.integral(thresh, sdepth=cv2.CV_64F)
+        box_sums = (
+            integral[y2[:, None], x2[None, :]]
+            - integral[y1[:, None], x2[None, :]]
+            - integral[y2[:, None], x1[None, :]]
+            + integral[y1[:, None], x1[None, :]]
+        )
+        filled_pixels = box_sums / 255.0
+        total_pixels = np.maximum(y2 - y1, 0)[:, None] * np.maximum(x2 - x1, 0)[None, :]
+        
+        fill_ratios = np.zeros(total_pixels.shape, dtype=np.float64)
+        np.divide(filled_pixels, total_pixels, out=fill_ratios, where=total_pixels > 0)
+        
+        # Mark as filled if above threshold (empty boxes never count as filled)
+        filled = (fill_ratios >= threshold) & (total_pixels > 0)
+        return filled, fill_ratios
+    
     def detect_bubbles_in_grid(
         self, 
         roi: np.ndarray, 
@@ -172,290 +705,1504 @@ class OMRProcessor:
         row_spacing: int,
         col_spacing: int,
         threshold: float
-    ) -> List[List[bool]]:
+    ) -> Tuple[np.ndarray, np.ndarray]:
         """
         Detect filled bubbles in a grid pattern
-        Returns 2D list of boolean values (True = filled, False = empty)
+        Returns (filled, fill_ratios): a rows x cols boolean matrix (True = filled)
+        and the matching matrix of fill ratios in [0, 1]
         """
-        gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY) if len(roi.shape) == 3 else roi
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-        # Use Otsu's thresholding for better handling of solid bubbles
-        # This avoids the "hollowing" effect of adaptive thresholding on large solid regions
-        thresh = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)[1]
-        
-        results = []
-        
-        for row in range(rows):
-            row_results = []
-            for col in range(cols):
-                # Calculate bubble center
-                cx = col * col_spacing + bubble_radius
-                cy = row * row_spacing + bubble_radius
-                
-                # Extract bubble region
-                x1 = max(0, cx - bubble_radius)
-                y1 = max(0, cy - bubble_radius)
-                x2 = min(thresh.shape[1], cx + bubble_radius)
-                y2 = min(thresh.shape[0], cy + bubble_radius)
-                
-                bubble = thresh[y1:y2, x1:x2]
-                
-                if bubble.size == 0:
-                    row_results.append(False)
-                    continue
-                
-                # Calculate fill percentage
-                # For synthetic/clean images, use a slightly lower threshold or better pre-processing
-                total_pixels = bubble.shape[0] * bubble.shape[1]
-                filled_pixels = cv2.countNonZero(bubble)
-                fill_ratio = filled_pixels / total_pixels if total_pixels > 0 else 0
-                
-                # DEBUG: Print fill ratio for first column to tune threshold
-                if col == 0:
-                    print(f"D: R{row} C{col} V={fill_ratio:.4f}")
-
-                # Mark as filled if above threshold
-                is_filled = fill_ratio >= threshold
-                row_results.append(is_filled)
-            
-            results.append(row_results)
-
-        # DEBUG: Save thresholded ROI for inspection
-        debug_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "debug_thresh.jpg")
-        cv2.imwrite(debug_path, thresh)
+        thresh = self.binarize(roi)
+        _, _, x1, x2, y1, y2 = grid_boxes(rows, cols, bubble_radius, row_spacing, col_spacing)
+        return self.score_bubbles(thresh, x1, x2, y1, y2, threshold)
+    
+    def blur_page(self, image: np.ndarray, template: CompiledTemplate) -> np.ndarray:
+        """
+        Grayscale + Gaussian blur of a whole page, done once per page,
+        into the reused "blurred" work buffer
+        """
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        k = template.blur_kernel
+        return cv2.GaussianBlur(gray, (k, k), 0, dst=self.work_buffer("blurred", gray.shape))
+    
+    def preprocess_page(self, blurred: np.ndarray, template: CompiledTemplate) -> PageBuffers:
+        """
+        Binarise a blurred page once using the template's threshold_method:
+        "otsu" (one global Otsu level), "adaptive" (adaptive_threshold_block_size /
+        adaptive_threshold_c) or "otsu_region" (Otsu per region view)
+        """
+        if template.threshold_method == "adaptive":
+            binary = cv2.adaptiveThreshold(
+                blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV,
+                template.adaptive_block_size, template.adaptive_c, dst=self.work_buffer("thresh", blurred.shape)
+            )
+        elif template.threshold_method == "otsu":
+            binary = self.work_buffer("thresh", blurred.shape)
+            cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU, dst=binary)
+        else:
+            binary = None
+        return PageBuffers(blurred=blurred, binary=binary)
+    
+    def template_homography(
+        self, markers: np.ndarray, template: CompiledTemplate, rotation: int = 0
+    ) -> Tuple[np.ndarray, Tuple[int, int]]:
+        """
+        Homography from detected markers straight into template coordinates
+        (origin at the top-left marker centre, the frame region x/y are measured in).
+        `rotation` is how far the page was turned clockwise on the scanner (0, 90, 180, 270);
+        the marker correspondence is shifted so the page comes out upright.
+        Returns (matrix, (width, height) of the marker frame)
+        """
+        src = self.order_points(np.asarray(markers, dtype=np.float32))
+        # Turned 90 degrees clockwise, the form's top-left marker is the scan's top-right one
+        src = np.roll(src, -(rotation // 90), axis=0)
+        dst = self.order_points(template.marker_positions)
+        dst = dst - dst[0]
+        size = (int(round(dst[:, 0].max())) + 1, int(round(dst[:, 1].max())) + 1)
+        return cv2.getPerspectiveTransform(src, dst), size
+    
+    def preprocess_regions(self, blurred: np.ndarray, homography: np.ndarray, template: CompiledTemplate) -> PageBuffers:
+        """
+        Warp only the regions that are read (student number and answer sections)
+        from the blurred source page into template coordinates, and binarise them.
+        With threshold_method "otsu" the level is computed once on the source page.
+        """
+        otsu_level = None
+        if template.threshold_method == "otsu":
+            # The level only needs the histogram; a decimated view gives the same level far cheaper
+            sample = blurred[::MARKER_PYRAMID_SCALE, ::MARKER_PYRAMID_SCALE]
+            otsu_level = cv2.threshold(sample, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)[0]
         
-        return results
+        grids = [template.student_number] + template.sections
+        # Buffers are looked up here, not on the pool threads; the grayscale regions are kept
+        # next to the binary ones for the re-read of ambiguous rows
+        buffers = {grid.name: self.work_buffer(f"region:{grid.name}", (grid.height, grid.width)) for grid in grids}
+        binaries = {grid.name: self.work_buffer(f"binary:{grid.name}", (grid.height, grid.width)) for grid in grids}
+        
+        def warp_region(grid: CompiledGrid) -> np.ndarray:
+            # Shift the page homography so the region's top-left corner lands on (0, 0)
+            shift = np.array([[1, 0, -grid.x], [0, 1, -grid.y], [0, 0, 1]], dtype=np.float64)
+            region = buffers[grid.name]
+            cv2.warpPerspective(blurred, shift @ homography, (grid.width, grid.height), dst=region)
+            if otsu_level is not None:
+                return cv2.threshold(region, otsu_level, 255, cv2.THRESH_BINARY_INV, dst=binaries[grid.name])[1]
+            if template.threshold_method == "adaptive":
+                return cv2.adaptiveThreshold(
+                    region, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV,
+                    template.adaptive_block_size, template.adaptive_c, dst=binaries[grid.name]
+                )
+            return cv2.threshold(region, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU, dst=binaries[grid.name])[1]
+        
+        regions = dict(zip((grid.name for grid in grids), self.map_grids(warp_region, grids)))
+        return PageBuffers(regions=regions, gray_regions=buffers)
+    
+    def _as_page(self, image, template: CompiledTemplate) -> PageBuffers:
+        """Accept either preprocessed PageBuffers or a raw page image"""
+        if isinstance(image, PageBuffers):
+            return image
+        return self.preprocess_page(self.blur_page(image, template), template)
     
-    def read_student_number(self, image: np.ndarray, template_name: str) -> Tuple[str, float]:
+    def read_grid(
+        self,
+        page: PageBuffers,
+        grid: CompiledGrid,
+        threshold: float,
+        readings: Optional[Dict[str, Dict]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
         """
-        Read student number from the form
-        Returns (student_number, confidence)
+        Detect filled bubbles of a compiled grid on a preprocessed page in template coordinates.
+        If `readings` is given, the grid's filled/fill_ratios/thresh results are
+        recorded in it under the grid name (for overlays and diagnostics).
         """
-        template = self.config['templates'][template_name]
-        region_config = template['regions']['student_number']
-        grid_config = region_config['grid']
-        
-        # Extract ROI
-        roi = self.extract_roi(
-            image,
-            region_config['x'],
-            region_config['y'],
-            region_config['width'],
-            region_config['height']
+        reading = self.grid_reading(page, grid, threshold)
+        if readings is not None:
+            readings[grid.name] = reading
+        return reading["filled"], reading["fill_ratios"]
+    
+    def grid_reading(self, page: PageBuffers, grid: CompiledGrid, threshold: float) -> Dict:
+        """Score one grid: {"filled", "fill_ratios", "thresh"} (safe to run on the read pool)"""
+        thresh = page.region_binary(grid)
+        filled, fill_ratios = self.score_bubbles(
+            thresh, grid.box_x1, grid.box_x2, grid.box_y1, grid.box_y2, threshold
         )
+        return {"filled": filled, "fill_ratios": fill_ratios, "thresh": thresh}
+    
+    def read_student_number(
+        self,
+        image,
+        template_name: str,
+        readings: Optional[Dict[str, Dict]] = None
+    ) -> Tuple[str, float]:
+        """
+        Read student number from the form (a page image or preprocessed PageBuffers)
+        Returns (student_number, confidence)
+        """
+        template = self.get_template(template_name)
+        grid = template.student_number
+        page = self._as_page(image, template)
         
         # Detect bubbles
-        bubble_grid = self.detect_bubbles_in_grid(
-            roi,
-            grid_config['rows'],
-            grid_config['columns'],
-            grid_config['bubble_radius'],
-            grid_config['row_spacing'],
-            grid_config['col_spacing'],
-            template['detection_params']['bubble_fill_threshold']
-        )
-        
+        bubble_grid, _ = self.read_grid(page, grid, template.fill_threshold, readings)
+        return self.decode_student_number(grid, bubble_grid)
+    
+    def decode_student_number(
+        self, grid: CompiledGrid, bubble_grid: np.ndarray, certainty: Optional[np.ndarray] = None
+    ) -> Tuple[str, float]:
+        """
+        Student number and confidence from the filled matrix of the student number grid.
+        With per-column `certainty` (see read_form) a column's confidence is also bounded by it.
+        """
         # Read student number (column-major order)
         student_number = ""
         confidence_scores = []
+        marked_counts = bubble_grid.sum(axis=0)
+        marked_digits = bubble_grid.argmax(axis=0)
         
-        for col in range(grid_config['columns']):
-            marked_count = 0
-            marked_digit = -1
-            
-            for row in range(grid_config['rows']):
-                if bubble_grid[row][col]:
-                    marked_count += 1
-                    marked_digit = row
+        for col in range(grid.columns):
+            marked_count = int(marked_counts[col])
+            marked_digit = int(marked_digits[col])
             
             # Confidence: 1.0 if exactly one marked, lower if multiple or none
             if marked_count == 1:
                 student_number += str(marked_digit)
-                confidence_scores.append(1.0)
+                confidence = 1.0
             elif marked_count == 0:
                 student_number += ""  # EMPTY instead of default 0
-                confidence_scores.append(0.2)
+                confidence = 0.2
             else:
                 # Multiple marks
                 student_number += "?"
-                confidence_scores.append(0.4)
-        
-        avg_confidence = sum(confidence_scores) / len(confidence_scores) if confidence_scores else 0.0
+                confidence = 0.4
+            if certainty is not None:
+                confidence = min(confidence, float(certainty[col]))
+            confidence_scores.append(confidence)
         
         avg_confidence = sum(confidence_scores) / len(confidence_scores) if confidence_scores else 0.0
-        
-        # DEBUG: Visualizing Grid
-        for col in range(grid_config['columns']):
-            for row in range(grid_config['rows']):
-                cx = region_config['x'] + col * grid_config['col_spacing'] + grid_config['bubble_radius']
-                cy = region_config['y'] + row * grid_config['row_spacing'] + grid_config['bubble_radius']
-                color = (0, 255, 0) if bubble_grid[row][col] else (0, 0, 255)
-                cv2.circle(image, (int(cx), int(cy)), grid_config['bubble_radius'], color, 2)
 
         return student_number, avg_confidence
     
-    def read_answers(self, image: np.ndarray, template_name: str) -> Tuple[Dict[str, List[str]], float]:
+    def read_answers(
+        self,
+        image,
+        template_name: str,
+        readings: Optional[Dict[str, Dict]] = None
+    ) -> Tuple[Dict[str, List[str]], float]:
         """
-        Read answers from all subject sections
+        Read answers from all subject sections (a page image or preprocessed PageBuffers)
         Returns (answers_dict, confidence)
         """
-        template = self.config['templates'][template_name]
-        answers_config = template['regions']['answers']
+        template = self.get_template(template_name)
+        page = self._as_page(image, template)
         
         all_answers = {}
         all_confidences = []
         
-        for section in answers_config['sections']:
-            subject = section['subject']
-            grid_config = section['grid']
-            
-            # Extract ROI for this subject
-            roi = self.extract_roi(
-                image,
-                section['x'],
-                section['y'],
-                section['width'],
-                section['height']
-            )
-            
+        for section in template.sections:
             # Detect bubbles
-            bubble_grid = self.detect_bubbles_in_grid(
-                roi,
-                grid_config['rows'],
-                grid_config['columns'],
-                grid_config['bubble_radius'],
-                grid_config['row_spacing'],
-                grid_config['col_spacing'],
-                template['detection_params']['bubble_fill_threshold']
-            )
-            
-            # Read answers for this subject
-            subject_answers = []
-            
-            for row in range(section['question_count']):
-                marked_count = 0
-                marked_option = ""
-                
-                for col in range(len(section['options'])):
-                    if bubble_grid[row][col]:
-                        marked_count += 1
-                        marked_option = section['options'][col]
-                
-                # Determine answer
-                if marked_count == 1:
-                    subject_answers.append(marked_option)
-                    all_confidences.append(1.0)
-                elif marked_count == 0:
-                    subject_answers.append("")  # Empty answer
-                    all_confidences.append(0.8)  # High confidence for intentional empty
-                else:
-                    # Multiple marks - invalid
-                    subject_answers.append("")
-                    all_confidences.append(0.4)
-            
-            all_answers[subject] = subject_answers
-        
-        avg_confidence = sum(all_confidences) / len(all_confidences) if all_confidences else 0.0
+            bubble_grid, _ = self.read_grid(page, section, template.fill_threshold, readings)
+            all_answers[section.name] = self.decode_section(section, bubble_grid, all_confidences)
         
         avg_confidence = sum(all_confidences) / len(all_confidences) if all_confidences else 0.0
-        
-        # DEBUG: Visualizing Grid for Answers
-        for section, (subj, ans) in zip(answers_config['sections'], all_answers.items()):
-            grid_config = section['grid']
-            # Re-detect for visual (not efficient but good for debug)
-            roi = self.extract_roi(image, section['x'], section['y'], section['width'], section['height'])
-            bubble_grid = self.detect_bubbles_in_grid(roi, grid_config['rows'], grid_config['columns'], 
-                                                    grid_config['bubble_radius'], grid_config['row_spacing'], 
-                                                    grid_config['col_spacing'], 
-                                                    template['detection_params']['bubble_fill_threshold'])
-
-            for row in range(section['question_count']):
-                for col in range(len(section['options'])):
-                    cx = section['x'] + col * grid_config['col_spacing'] + grid_config['bubble_radius']
-                    cy = section['y'] + row * grid_config['row_spacing'] + grid_config['bubble_radius']
-                    color = (0, 255, 0) if bubble_grid[row][col] else (0, 0, 255)
-                    cv2.circle(image, (int(cx), int(cy)), grid_config['bubble_radius'], color, 1)
 
         return all_answers, avg_confidence
     
+    def decode_section(
+        self,
+        section: CompiledGrid,
+        bubble_grid: np.ndarray,
+        confidences: List[float],
+        certainty: Optional[np.ndarray] = None
+    ) -> List[str]:
+        """
+        Answers of one subject section from its filled matrix; per-question confidences are
+        appended to `confidences` (bounded by the per-question `certainty`, when given)
+        """
+        subject_answers = []
+        question_grid = bubble_grid[:section.question_count, :len(section.options)]
+        marked_counts = question_grid.sum(axis=1)
+        marked_columns = question_grid.argmax(axis=1)
+        
+        for row in range(section.question_count):
+            marked_count = int(marked_counts[row])
+            marked_option = section.options[marked_columns[row]]
+            
+            # Determine answer
+            if marked_count == 1:
+                subject_answers.append(marked_option)
+                confidence = 1.0
+            elif marked_count == 0:
+                subject_answers.append("")  # Empty answer
+                confidence = 0.8  # High confidence for intentional empty
+            else:
+                # Multiple marks - invalid
+                subject_answers.append("")
+                confidence = 0.4
+            if certainty is not None:
+                confidence = min(confidence, float(certainty[row]))
+            confidences.append(confidence)
+        return subject_answers
+    
+    @staticmethod
+    def grid_lines(grid: CompiledGrid, matrix: np.ndarray) -> np.ndarray:
+        """
+        View of a (rows x columns [x ...]) grid matrix as (lines x bubbles [x ...]), one line per
+        decision: an answer question (a row, within the options) or a student number digit (a column)
+        """
+        if grid.options:
+            return matrix[:grid.question_count, :len(grid.options)]
+        return matrix.swapaxes(0, 1)
+    
+    def reread_lines(self, page: PageBuffers, grid: CompiledGrid, reading: Dict, lines: np.ndarray) -> int:
+        """
+        Cascaded re-read of ambiguous lines of one grid from its blurred grayscale region,
+        each level costlier than the last:
+          local    mean darkness inside each printed ring (a circular mask) against the paper
+                   level of the grid, so shading, faint pencil, the ring itself and
+                   smudged box corners are judged on grey levels rather than one binary cut
+          realign  the same after shifting the line's bubble lattice (up to REALIGN_RADIUS
+                   pixels) onto the printed rings, for locally misregistered rows
+        A line stops at the first level that reads it with at least half of LOCAL_CONFIDENT_MARGIN;
+        otherwise the realigned reading is kept. The line's marks and certainty in `reading`
+        are updated and the level used is recorded in reading["reread"].
+        Returns the number of lines whose marks changed.
+        """
+        inner, ring = ring_offsets(grid.bubble_radius)
+        # A bordered copy of the region, so every offset of a shifted lattice stays inside it
+        # and bubbles can be sampled with flat indices
+        pad = grid.bubble_radius + REALIGN_RADIUS + 3
+        region = page.region_gray(grid)
+        gray = cv2.copyMakeBorder(region, pad, pad, pad, pad, cv2.BORDER_REPLICATE)
+        stride = gray.shape[1]
+        pixels = gray.ravel()
+        inner_flat, ring_flat = inner[0] * stride + inner[1], ring[0] * stride + ring[1]
+        rows = np.clip(grid.centers_y, 0, region.shape[0] - 1) + pad
+        columns = np.clip(grid.centers_x, 0, region.shape[1] - 1) + pad
+        centres = self.grid_lines(grid, rows[:, None] * stride + columns[None, :])
+        filled = self.grid_lines(grid, reading["filled"])
+        # Paper level of the whole region (shading changes little across one grid), as a
+        # grey level -> darkness table
+        sample = np.ascontiguousarray(gray[pad:-pad:MARKER_PYRAMID_SCALE, pad:-pad:MARKER_PYRAMID_SCALE])
+        cumulative = np.cumsum(cv2.calcHist([sample], [0], None, [256], [0, 256]).ravel())
+        paper = max(float(np.searchsorted(cumulative, PAPER_QUANTILE * cumulative[-1])), 1.0)
+        darkness = np.clip(1.0 - np.arange(256, dtype=np.float32) / paper, 0.0, 1.0)
+        # Nearest shifts first, so ties keep the lattice where it is
+        shifts = np.array(sorted(range(-REALIGN_RADIUS, REALIGN_RADIUS + 1), key=abs))[:, None, None]
+        
+        def mean_darkness(centre: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+            # Per bubble (flat centre index) over the given flat pixel offsets
+            return darkness.take(pixels.take(centre[..., None] + offsets)).mean(axis=-1)
+        
+        # All flagged lines at once: (lines x bubbles) flat centres
+        points = centres[lines]
+        marked, margins = line_decisions(mean_darkness(points, inner_flat), LOCAL_INK_THRESHOLD)
+        levels = np.full(len(lines), "local", dtype=object)
+        weak = np.flatnonzero(margins < LOCAL_CONFIDENT_MARGIN / 2)
+        if len(weak):
+            # Move each weak line's lattice onto its printed rings: horizontally, then vertically
+            moved = points[weak]
+            dx = shifts[np.argmax(mean_darkness(moved[None] + shifts, ring_flat).sum(axis=2), axis=0), 0, 0]
+            moved = moved + dx[:, None]
+            dy = shifts[np.argmax(mean_darkness(moved[None] + shifts * stride, ring_flat).sum(axis=2), axis=0), 0, 0]
+            moved = moved + dy[:, None] * stride
+            marked[weak], margins[weak] = line_decisions(mean_darkness(moved, inner_flat), LOCAL_INK_THRESHOLD)
+            levels[weak] = "realign"
+        
+        changed = int((filled[lines] != marked).any(axis=1).sum())
+        filled[lines] = marked
+        reading["certainty"][lines] = np.clip(margins / LOCAL_CONFIDENT_MARGIN, 0.0, 1.0)
+        reading["reread"].update(zip(lines.tolist(), levels.tolist()))
+        return changed
+    
+    def read_form(
+        self,
+        page: PageBuffers,
+        template: CompiledTemplate,
+        readings: Optional[Dict[str, Dict]] = None,
+        end_stage: Optional[Callable[[str], None]] = None
+    ) -> Tuple[str, float, Dict[str, List[str]], float]:
+        """
+        Read the student number and every answer section of a preprocessed page.
+        The grids are scored concurrently when read_threads > 1 and merged in template order.
+        Each line (question or student number digit) gets a certainty from its margin
+        (see line_decisions); lines closer than template.reread_margin to the threshold, with
+        more than one mark or, for digits, none, or whose grey levels disagree with their marks
+        are re-read (reread_lines), and every result is bounded by its line's certainty.
+        `end_stage` is called with "bubbles" after scoring and "reread" after any re-read.
+        Returns (student_number, student_confidence, answers, answers_confidence)
+        """
+        cascade = template.reread_margin > 0
+        
+        def score(grid: CompiledGrid) -> Dict:
+            reading = self.grid_reading(page, grid, template.fill_threshold)
+            if cascade:
+                # Grey level inside every ring, sampled on a sparse lattice, for the flagging below
+                gray = page.region_gray(grid).reshape(-1)
+                reading["lightness"] = gray.take(grid.ring_samples).mean(axis=-1)
+            return reading
+        
+        grids = [template.student_number] + template.sections
+        scored = self.map_grids(score, grids)
+        flagged = []
+        for grid, reading in zip(grids, scored):
+            marked, margins = line_decisions(self.grid_lines(grid, reading["fill_ratios"]), template.fill_threshold)
+            reading["certainty"] = np.clip(margins / CONFIDENT_MARGIN, 0.0, 1.0)
+            reading["reread"] = {}
+            if not cascade:
+                continue
+            counts = marked.sum(axis=1)
+            ambiguous = (margins < template.reread_margin) | (counts > 1)
+            if not grid.options:
+                ambiguous |= counts == 0
+            # A bubble whose grey level disagrees with its mark, compared with the rest of its line:
+            # faint pencil lost by the binary cut, or shading read as ink
+            lightness = self.grid_lines(grid, reading["lightness"])
+            typical = np.median(lightness, axis=1, keepdims=True)
+            contrast = (typical - lightness) / np.maximum(typical, 1e-6)
+            ambiguous |= np.where(marked, contrast < GRAY_CONTRAST, contrast >= GRAY_CONTRAST).any(axis=1)
+            if ambiguous.any():
+                flagged.append((grid, reading, np.flatnonzero(ambiguous)))
+        if readings is not None:
+            readings.update((grid.name, reading) for grid, reading in zip(grids, scored))
+        if end_stage is not None:
+            end_stage("bubbles")
+        
+        if flagged:
+            changed = self.map_grids(lambda item: self.reread_lines(page, *item), flagged)
+            logger.debug("Re-read %d ambiguous lines, %d changed",
+                         sum(len(lines) for _, _, lines in flagged), sum(changed))
+            if end_stage is not None:
+                end_stage("reread")
+        
+        student = scored[0]
+        student_number, student_conf = self.decode_student_number(
+            template.student_number, student["filled"], student["certainty"]
+        )
+        answers = {}
+        confidences: List[float] = []
+        for section, reading in zip(template.sections, scored[1:]):
+            answers[section.name] = self.decode_section(section, reading["filled"], confidences, reading["certainty"])
+        answers_conf = sum(confidences) / len(confidences) if confidences else 0.0
+        return student_number, student_conf, answers, answers_conf
+    
+    def match_roster(
+        self,
+        template: CompiledTemplate,
+        fill_ratios: np.ndarray,
+        student_number: str,
+        confidence: float
+    ) -> Tuple[str, float, Dict]:
+        """
+        Resolve a student number grid against the roster. When one valid number clearly
+        fits the fill ratios, it replaces what was read (filling blank or double-marked
+        columns) and its posterior becomes the confidence.
+        Returns (student_number, confidence, {"read", "match", "candidates"})
+        """
+        resolved = self.roster.resolve(fill_ratios, template.fill_threshold) or {"match": None, "candidates": []}
+        report = {"read": student_number, **resolved}
+        match = resolved["match"]
+        if match is None:
+            return student_number, confidence, report
+        if match["student_number"] != student_number:
+            logger.debug("Roster resolved student number %r to %s (cost %.2f)", student_number, match["student_number"], match["cost"])
+        return match["student_number"], max(confidence, match["score"]), report
+    
+    def draw_overlay(self, image: np.ndarray, template_name: str, readings: Dict[str, Dict]) -> None:
+        """
+        Draw detected (green) and empty (red) bubbles onto the image in place,
+        using the grids already computed by the readers
+        """
+        template = self.get_template(template_name)
+        self.draw_grids(image, template, readings, [template.student_number] + template.sections)
+    
+    def draw_grids(
+        self,
+        image: np.ndarray,
+        template: CompiledTemplate,
+        readings: Dict[str, Dict],
+        grids: List[CompiledGrid],
+        scale: float = 1.0,
+        origin: Tuple[float, float] = (0, 0)
+    ) -> None:
+        """
+        Draw the bubbles of `grids` onto an image whose pixel (0, 0) is the template
+        point `origin` and which is scaled by `scale` relative to template coordinates
+        """
+        for grid in grids:
+            reading = readings.get(grid.name)
+            if reading is None:
+                continue
+            if grid is template.student_number:
+                rows, cols, thickness = grid.rows, grid.columns, 2
+            else:
+                rows, cols, thickness = grid.question_count, len(grid.options), 1
+            centers = grid.page_centers()
+            radius = max(1, int(round(grid.bubble_radius * scale)))
+            filled = reading["filled"]
+            for row in range(rows):
+                for col in range(cols):
+                    cx, cy = centers[row, col]
+                    if scale != 1.0 or origin != (0, 0):
+                        cx, cy = (cx - origin[0]) * scale, (cy - origin[1]) * scale
+                    color = (0, 255, 0) if filled[row, col] else (0, 0, 255)
+                    cv2.circle(image, (int(cx), int(cy)), radius, color, thickness)
+    
+    def render_page(
+        self,
+        image: np.ndarray,
+        homography: Optional[np.ndarray],
+        page_size: Optional[Tuple[int, int]],
+        template: CompiledTemplate,
+        readings: Dict[str, Dict],
+        scale: float = 1.0
+    ) -> np.ndarray:
+        """Annotated page in template coordinates (the original image when markers were not found)"""
+        if scale != 1.0:
+            # Shrink the source first so the thumbnail is area-averaged rather than aliased
+            image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        if homography is not None:
+            if scale != 1.0:
+                zoom = np.diag([scale, scale, 1.0])
+                homography = zoom @ homography @ np.linalg.inv(zoom)
+                page_size = (max(1, int(round(page_size[0] * scale))), max(1, int(round(page_size[1] * scale))))
+            annotated = cv2.warpPerspective(image, homography, page_size)
+        else:
+            annotated = image.copy() if scale == 1.0 and image.ndim == 3 else image
+        if annotated.ndim == 2:
+            # Grayscale pages get their colour channels here, at output size, for the overlay marks
+            annotated = cv2.cvtColor(annotated, cv2.COLOR_GRAY2BGR)
+        self.draw_grids(annotated, template, readings, [template.student_number] + template.sections, scale)
+        return annotated
+    
+    def plan_outputs(
+        self, template: CompiledTemplate, policy: str, output_dir: str, source_name: str
+    ) -> List[Tuple[Optional[CompiledGrid], str]]:
+        """Files an output policy produces, as (region grid or None for the page, path)"""
+        if policy == "none":
+            return []
+        if policy == "roi":
+            return [
+                (grid, os.path.join(output_dir, f"processed_{source_name}_{grid.name}.jpg"))
+                for grid in [template.student_number] + template.sections
+            ]
+        suffix = "_thumb" if policy == "thumbnail" else ""
+        return [(None, os.path.join(output_dir, f"processed_{source_name}{suffix}.jpg"))]
+    
+    def write_outputs(
+        self,
+        outputs: List[Tuple[Optional[CompiledGrid], str]],
+        policy: str,
+        quality: int,
+        image: np.ndarray,
+        homography: Optional[np.ndarray],
+        page_size: Optional[Tuple[int, int]],
+        template: CompiledTemplate,
+        readings: Dict[str, Dict],
+        annotated: Optional[np.ndarray] = None
+    ) -> None:
+        """
+        Render and write the planned outputs; runs on the output writer thread when one is set.
+        `annotated` is a full-page overlay that was already rendered (e.g. for diagnostics).
+        """
+        for grid, path in outputs:
+            if grid is not None:
+                if homography is not None:
+                    shift = np.array([[1, 0, -grid.x], [0, 1, -grid.y], [0, 0, 1]], dtype=np.float64)
+                    crop = cv2.warpPerspective(image, shift @ homography, (grid.width, grid.height))
+                else:
+                    crop = image[grid.roi].copy() if image.ndim == 3 else image[grid.roi]
+                if crop.ndim == 2:
+                    crop = cv2.cvtColor(crop, cv2.COLOR_GRAY2BGR)
+                self.draw_grids(crop, template, readings, [grid], origin=(grid.x, grid.y))
+                write_jpeg(path, crop, quality)
+            elif policy == "thumbnail":
+                width = page_size[0] if page_size is not None else image.shape[1]
+                scale = min(1.0, template.thumbnail_width / width)
+                write_jpeg(path, self.render_page(image, homography, page_size, template, readings, scale), quality)
+            else:
+                if annotated is None:
+                    annotated = self.render_page(image, homography, page_size, template, readings)
+                write_jpeg(path, annotated, quality)
+    
+    def write_diagnostics(
+        self,
+        bundle_dir: str,
+        overlay: np.ndarray,
+        readings: Dict[str, Dict],
+        timings: Dict[str, float],
+        markers: Optional[np.ndarray]
+    ) -> None:
+        """
+        Write a per-form diagnostics bundle: fill ratios, thresholded ROIs,
+        the annotated overlay and stage timings
+        """
+        os.makedirs(bundle_dir, exist_ok=True)
+        for name, reading in readings.items():
+            cv2.imwrite(os.path.join(bundle_dir, f"thresh_{name}.png"), reading["thresh"])
+        cv2.imwrite(os.path.join(bundle_dir, "overlay.jpg"), overlay)
+        
+        report = {
+            "markers": markers.tolist() if markers is not None else None,
+            "timings_ms": {stage: round(ms, 3) for stage, ms in timings.items()},
+            "grids": {
+                name: {
+                    "fill_ratios": np.round(reading["fill_ratios"], 4).tolist(),
+                    "filled": reading["filled"].tolist(),
+                    "certainty": np.round(reading["certainty"], 3).tolist(),
+                    "reread": reading["reread"]
+                }
+                for name, reading in readings.items()
+            }
+        }
+        with open(os.path.join(bundle_dir, "diagnostics.json"), 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    
+    @staticmethod
+    def page_count(image_path: str) -> int:
+        """
+        Number of pages in an image file (TIFF stacks can hold many; other formats hold one)
+        """
+        if image_path.lower().endswith(('.tif', '.tiff')):
+            return max(1, cv2.imcount(image_path))
+        return 1
+    
+    def read_page(self, image_path: str, page_index: int) -> Optional[np.ndarray]:
+        """
+        Decode a single page of a multi-page image without decoding the others
+        """
+        ok, pages = cv2.imreadmulti(image_path, page_index, 1, flags=DECODE_FLAGS)
+        return pages[0] if ok and pages else None
+    
+    def iter_form_pages(
+        self,
+        image_path: str,
+        template_name: str,
+        output_dir: str,
+        source_name: Optional[str] = None,
+        digest: Optional[str] = None,
+        **options
+    ) -> Iterator[Dict]:
+        """
+        Process every page of an image file one at a time (peak memory stays at one page)
+        and yield each page's result with its "page_index"
+        """
+        stem = source_name or Path(image_path).stem
+        if digest is None and self._use_cache(options):
+            digest = file_digest(image_path)
+        for page_index in range(self.page_count(image_path)):
+            yield self.process_page(
+                image_path, page_index, template_name, output_dir,
+                source_name=f"{stem}_p{page_index}", digest=digest, **options
+            )
+    
+    def _multi_page_result(self, pages: List[Dict]) -> Dict:
+        return {
+            "success": any(page.get("success") for page in pages),
+            "page_count": len(pages),
+            "pages": pages
+        }
+    
+    def _use_cache(self, options: Dict) -> bool:
+        # A diagnostics run always goes through the pipeline
+        return self.result_cache is not None and not options.get("diagnostics_dir")
+    
+    def result_key(self, digest: str, template_name: str, output_dir: str, options: Dict,
+                   page_index: Optional[int] = None) -> str:
+        """
+        Result cache key: image content, template, everything in the template that affects
+        recognition, and the output images asked for (where and which), which the result lists
+        """
+        if template_name == AUTO_TEMPLATE:
+            # Any template could be chosen, so any template change invalidates the entry
+            fingerprint = "|".join(template.fingerprint for _, template in sorted(self.templates.items()))
+        else:
+            fingerprint = self.get_template(template_name).fingerprint
+        if self.roster is not None:
+            # Student numbers are resolved against the roster, so a new export changes results
+            fingerprint += f"|roster:{self.roster.fingerprint}"
+        outputs = (os.path.abspath(output_dir), options.get("save_image", True),
+                   options.get("output_policy"), options.get("jpeg_quality"))
+        return ResultCache.make_key(RESULT_CACHE_VERSION, digest, template_name, fingerprint, outputs, page_index)
+    
+    def cached_result(self, key: str, started: float, timings: bool = False) -> Optional[Dict]:
+        """
+        Stored result for `key`, or None. An entry whose output images have been cleaned up
+        since is a miss, so the form is read again and its images written anew.
+        """
+        result = self.result_cache.get(key, valid=lambda stored: all(map(os.path.exists, stored.get("output_files", []))))
+        if result is None:
+            return None
+        result["cached"] = True
+        if timings:
+            ms = round((time.perf_counter() - started) * 1000.0, 3)
+            result["timings"] = {"cache": ms, "total": ms}
+        return result
+    
+    def store_result(self, key: str, result: Dict) -> None:
+        if result.get("success"):
+            self.result_cache.put(key, {k: v for k, v in result.items() if k != "timings"})
+    
+    def process_page(
+        self,
+        image_path: str,
+        page_index: int,
+        template_name: str,
+        output_dir: str,
+        source_name: Optional[str] = None,
+        digest: Optional[str] = None,
+        **options
+    ) -> Dict:
+        """
+        Process one page of a (multi-page) image file
+        `digest` is the file's content hash when the caller already has it (result cache)
+        """
+        self.check_template(template_name)
+        start = time.perf_counter()
+        key = None
+        if self._use_cache(options):
+            key = self.result_key(digest or file_digest(image_path), template_name, output_dir, options, page_index)
+            cached = self.cached_result(key, start, options.get("timings", False))
+            if cached is not None:
+                return cached
+        image = self.read_page(image_path, page_index)
+        stage_ms = {"decode": (time.perf_counter() - start) * 1000.0}
+        if image is None:
+            return {"success": False, "error": "Failed to load image", "page_index": page_index}
+        result = self.process_image(
+            image, template_name, output_dir, source_name or f"{Path(image_path).stem}_p{page_index}",
+            stage_ms=stage_ms, **options
+        )
+        result["page_index"] = page_index
+        if key is not None:
+            self.store_result(key, result)
+        return result
+    
     def process_form(
         self, 
         image_path: str, 
         template_name: str, 
-        output_dir: str
+        output_dir: str,
+        diagnostics_dir: Optional[str] = None,
+        save_image: bool = True,
+        output_policy: Optional[str] = None,
+        jpeg_quality: Optional[int] = None,
+        timings: bool = False
     ) -> Dict:
         """
-        Main processing function
+        Main processing function.
+        If `diagnostics_dir` is given, a per-form diagnostics bundle is written
+        to <diagnostics_dir>/<image stem>/.
+        `output_policy` (none / thumbnail / roi / full) and `jpeg_quality` override the
+        template's output settings; `save_image=False` is the same as policy "none".
+        With `timings=True` the result carries per-stage milliseconds under "timings".
+        A multi-page TIFF is processed page by page; the result then holds
+        "page_count" and a "pages" list of per-page results.
+        When a result cache is set, a scan seen before is answered from it ("cached": true).
         """
+        # Fail fast on unknown templates before any image work
+        self.check_template(template_name)
+        options = {
+            "diagnostics_dir": diagnostics_dir, "save_image": save_image,
+            "output_policy": output_policy, "jpeg_quality": jpeg_quality, "timings": timings
+        }
+        
+        if self.page_count(image_path) > 1:
+            return self._multi_page_result(list(self.iter_form_pages(image_path, template_name, output_dir, **options)))
+        
         # Load image
-        image = cv2.imread(image_path)
+        start = time.perf_counter()
+        if self._use_cache(options):
+            # Hash the bytes before any decoding; on a miss the same buffer is decoded
+            with open(image_path, 'rb') as f:
+                data = f.read()
+            key = self.result_key(content_digest(data), template_name, output_dir, options)
+            cached = self.cached_result(key, start, timings)
+            if cached is not None:
+                return cached
+            image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), DECODE_FLAGS)
+        else:
+            key = None
+            image = cv2.imread(image_path, DECODE_FLAGS)
+        stage_ms = {"decode": (time.perf_counter() - start) * 1000.0}
         if image is None:
             return {
                 "success": False,
                 "error": "Failed to load image"
             }
+        result = self.process_image(image, template_name, output_dir, Path(image_path).stem, stage_ms=stage_ms, **options)
+        if key is not None:
+            self.store_result(key, result)
+        return result
+    
+    def process_bytes(
+        self,
+        data: bytes,
+        template_name: str,
+        output_dir: str,
+        source_name: str = "upload",
+        diagnostics_dir: Optional[str] = None,
+        save_image: bool = True,
+        output_policy: Optional[str] = None,
+        jpeg_quality: Optional[int] = None,
+        timings: bool = False
+    ) -> Dict:
+        """
+        Process an encoded image held in memory (e.g. an upload buffer).
+        Multi-page TIFF buffers are spooled to a temporary file so pages can
+        still be decoded one at a time.
+        """
+        self.check_template(template_name)
+        options = {
+            "diagnostics_dir": diagnostics_dir, "save_image": save_image,
+            "output_policy": output_policy, "jpeg_quality": jpeg_quality, "timings": timings
+        }
+        start = time.perf_counter()
+        digest = content_digest(data) if self._use_cache(options) else None
+        
+        if data[:4] in (b"II*\x00", b"MM\x00*"):
+            fd, tmp_path = tempfile.mkstemp(suffix=".tif")
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                if self.page_count(tmp_path) > 1:
+                    return self._multi_page_result(list(self.iter_form_pages(
+                        tmp_path, template_name, output_dir, source_name=source_name, digest=digest, **options
+                    )))
+            finally:
+                os.remove(tmp_path)
+        
+        key = None
+        if digest is not None:
+            key = self.result_key(digest, template_name, output_dir, options)
+            cached = self.cached_result(key, start, timings)
+            if cached is not None:
+                return cached
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), DECODE_FLAGS)
+        stage_ms = {"decode": (time.perf_counter() - start) * 1000.0}
+        if image is None:
+            return {
+                "success": False,
+                "error": "Failed to decode image"
+            }
+        result = self.process_image(image, template_name, output_dir, source_name, stage_ms=stage_ms, **options)
+        if key is not None:
+            self.store_result(key, result)
+        return result
+    
+    def process_image(
+        self,
+        image: np.ndarray,
+        template_name: str,
+        output_dir: str,
+        source_name: str,
+        diagnostics_dir: Optional[str] = None,
+        save_image: bool = True,
+        output_policy: Optional[str] = None,
+        jpeg_quality: Optional[int] = None,
+        timings: bool = False,
+        stage_ms: Optional[Dict[str, float]] = None,
+        located: Optional[Tuple[np.ndarray, str]] = None
+    ) -> Dict:
+        """
+        Recognise one decoded page: grayscale (DECODE_FLAGS) or BGR, which is converted once.
+        With template_name AUTO_TEMPLATE the template is recognised from the page first
+        (see detect_template); the result then reports "template_name" and "template_detection".
+        `located` is (markers, method) when the caller already knows where the markers are
+        (e.g. tracked across video frames, see omr_video.py); the marker search is then skipped.
+        With AUTO_TEMPLATE it is ignored, as template detection locates markers itself.
+        `source_name` names the output image (processed_<source_name>.jpg) and diagnostics bundle;
+        `stage_ms` collects per-stage milliseconds; stages the caller already measured (e.g. decode) are kept.
+        With `timings=True` they are also returned in the result.
+        Output images are handed to `self.writer` when set, so the result does not wait for them.
+        """
+        stage_ms = {} if stage_ms is None else stage_ms
+        stage_start = time.perf_counter()
+        
+        def end_stage(name: str) -> None:
+            nonlocal stage_start
+            now = time.perf_counter()
+            stage_ms[name] = (now - stage_start) * 1000.0
+            stage_start = now
         
-        # Find alignment markers and apply perspective transform
-        markers = self.find_alignment_markers(image)
+        def finish(result: Dict) -> Dict:
+            if timings:
+                result["timings"] = {stage: round(ms, 3) for stage, ms in stage_ms.items()}
+                result["timings"]["total"] = round(sum(stage_ms.values()), 3)
+            return result
         
+        # Blank and unreadably blurred pages are rejected before any recognition work
+        # (in AUTO mode with the first template's gate settings)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        first_template = next(iter(self.templates.values()))
+        gate = self.quality_gate(gray, first_template if template_name == AUTO_TEMPLATE else self.get_template(template_name))
+        end_stage("quality")
+        if gate["fired"] is not None:
+            return finish({"success": False, "error": QUALITY_GATE_ERRORS[gate["fired"]], "quality_gate": gate})
+        
+        detection = None
+        if template_name == AUTO_TEMPLATE:
+            # Blur with the first template's kernel; kept if the detected template uses the same one
+            blurred = self.blur_page(gray, first_template)
+            end_stage("preprocess")
+            template_name, detection, located = self.detect_template(image, blurred)
+            end_stage("classify")
+            if template_name is None:
+                return finish({
+                    "success": False, "error": "Could not identify the form template",
+                    "template_detection": detection, "quality_gate": gate
+                })
+            template = self.get_template(template_name)
+            if template.blur_kernel != first_template.blur_kernel:
+                blurred = self.blur_page(gray, template)
+                located = None
+        else:
+            template = self.get_template(template_name)
+            # Grayscale + blur once; shared by marker search and bubble reading
+            blurred = self.blur_page(gray, template)
+            end_stage("preprocess")
+        
+        policy = (output_policy or template.output_policy) if save_image else "none"
+        if policy not in OUTPUT_POLICIES:
+            raise ValueError(f"Unknown output policy: {policy}")
+        quality = template.jpeg_quality if jpeg_quality is None else int(jpeg_quality)
+        if not 1 <= quality <= 100:
+            raise ValueError(f"jpeg_quality must be between 1 and 100 (got {quality})")
+        
+        # Find alignment markers (already done by template detection) and apply perspective transform
+        if located is not None:
+            markers, alignment_method = located
+        else:
+            markers, alignment_method = self.locate_markers(image, blurred, template)
+        # Pages fed in sideways or upside down are read upright by turning the marker correspondence
+        if detection is not None:
+            gate["rotation"] = detection.get("rotation", 0)
+        elif markers is not None and template.detect_rotation:
+            gate["rotation"], _ = self.page_orientation(blurred, markers, template)
+        if gate["rotation"]:
+            gate["fired"] = "rotation"
+            logger.info("%s: page is rotated by %d degrees, reading it upright", source_name, gate["rotation"])
+        end_stage("alignment")
+        
+        # Warp straight into template coordinates; only the read regions are remapped
+        homography, page_size = None, None
         if markers is not None:
-            warped = self.four_point_transform(image, markers)
+            homography, page_size = self.template_homography(markers, template, gate["rotation"])
+            page = self.preprocess_regions(blurred, homography, template)
         else:
-            # If markers not found, use original image (may have lower accuracy)
-            warped = image.copy()
+            # If markers not found, read the original image (may have lower accuracy)
+            page = self.preprocess_page(blurred, template)
+        end_stage("warp")
+        
+        readings: Dict[str, Dict] = {}
         
-        # Read student number
-        student_number, student_conf = self.read_student_number(warped, template_name)
+        # Read student number and answers (sections in parallel when read_threads > 1)
+        student_number, student_conf, answers, answers_conf = self.read_form(page, template, readings, end_stage)
+        reread: Dict[str, int] = {}
+        for reading in readings.values():
+            for level in reading["reread"].values():
+                reread[level] = reread.get(level, 0) + 1
         
-        # Read answers
-        answers, answers_conf = self.read_answers(warped, template_name)
+        roster_report = None
+        if self.roster is not None:
+            student_number, student_conf, roster_report = self.match_roster(
+                template, readings[template.student_number.name]["fill_ratios"], student_number, student_conf
+            )
+            end_stage("roster")
         
         # Calculate overall confidence
         overall_confidence = (student_conf + answers_conf) / 2.0
         
-        # Save processed image
-        os.makedirs(output_dir, exist_ok=True)
-        output_filename = f"processed_{Path(image_path).stem}.jpg"
-        output_path = os.path.join(output_dir, output_filename)
-        cv2.imwrite(output_path, warped)
+        # Rendering (warps, overlay, JPEG encode) happens off the result path when a writer is set
+        outputs = self.plan_outputs(template, policy, output_dir, source_name)
+        if outputs or diagnostics_dir:
+            annotated = None
+            if diagnostics_dir:
+                annotated = self.render_page(image, homography, page_size, template, readings)
+            
+            if outputs:
+                os.makedirs(output_dir, exist_ok=True)
+                job = functools.partial(
+                    self.write_outputs, outputs, policy, quality,
+                    image, homography, page_size, template, readings, annotated
+                )
+                if self.writer is not None:
+                    self.writer.submit(job)
+                else:
+                    job()
+            end_stage("output")
+            
+            if diagnostics_dir:
+                bundle_dir = os.path.join(diagnostics_dir, source_name)
+                self.write_diagnostics(bundle_dir, annotated, readings, stage_ms, markers)
+                logger.info("Diagnostics written to %s", bundle_dir)
         
-        return {
+        output_files = [path for _, path in outputs]
+        result = {
             "success": True,
             "student_number_detected": student_number,
             "answers": answers,
             "confidence_score": round(overall_confidence, 3),
             "student_number_confidence": round(student_conf, 3),
             "answers_confidence": round(answers_conf, 3),
-            "image_path": output_path,
-            "alignment_found": markers is not None
+            "image_path": output_files[0] if policy in ("full", "thumbnail") else None,
+            "output_files": output_files,
+            "alignment_found": markers is not None,
+            "alignment_method": alignment_method,
+            "quality_gate": gate
         }
+        if reread:
+            result["reread"] = reread
+        if roster_report is not None:
+            result["student_number_roster"] = roster_report
+        if detection is not None:
+            result["template_name"] = template_name
+            result["template_detection"] = detection
+        return finish(result)
 
 
-def main():
-    """Main entry point"""
-    if len(sys.argv) < 5:
-        print(json.dumps({
-            "success": False,
-            "error": "Usage: python standard_omr.py <image_path> <template_name> <config_path> <output_dir>"
-        }))
-        sys.exit(1)
-    
-    image_path = sys.argv[1]
-    template_name = sys.argv[2]
-    config_path = sys.argv[3]
-    output_dir = sys.argv[4]
-    
+def strip_timings(result: Dict) -> None:
+    """Drop the "timings" of a result (and of each page of a multi-page result)"""
+    result.pop("timings", None)
+    for page in result.get("pages", []):
+        page.pop("timings", None)
+
+
+class OMRWorker:
+    """
+    Long-lived worker that keeps one warm OMRProcessor and answers
+    JSON-lines requests (one request per line, one response per line).
+
+    Requests:
+        {"id": ..., "image_path": ..., "template_name": ..., "output_dir": ..., "diagnostics_dir": ..., "save_image": ...,
+         "output_policy": ..., "jpeg_quality": ..., "timings": ...}
+        {"id": ..., "image_base64": ..., "source_name": ..., "template_name": ..., ...}
+        {"id": ..., "cmd": "health" | "metrics" | "reload" | "flush" | "shutdown"}
+
+    Output images are written by a background thread; "flush" waits until all
+    previously returned image paths exist on disk. "metrics" returns cumulative
+    counters (forms, failures, alignment method) and per-stage latency histograms.
+    """
+
+    # process_form keyword options a request may override
+    FORM_OPTIONS = ("diagnostics_dir", "save_image", "output_policy", "jpeg_quality", "timings")
+
+    def __init__(
+        self,
+        config_path: str,
+        default_output_dir: str,
+        form_options: Optional[Dict] = None,
+        profiler: Optional[Profiler] = None,
+        result_cache_mb: Optional[float] = None,
+        read_threads: int = 1,
+        roster_path: Optional[str] = None
+    ):
+        self.processor = OMRProcessor(
+            config_path, result_cache_mb=result_cache_mb, read_threads=read_threads, roster_path=roster_path
+        )
+        self.metrics = Metrics()
+        self.processor.writer = OutputWriter(observe=functools.partial(self.metrics.observe, "output_write"))
+        self.profiler = profiler or Profiler(None)
+        self.default_output_dir = default_output_dir
+        self.form_options = dict(form_options or {})
+        self.started_at = time.time()
+        self.processed = 0
+        self.failed = 0
+        self.config_reloads = 0
+        self.last_config_error: Optional[str] = None
+
+    def check_config(self) -> None:
+        """Pick up config changes; a broken file keeps the last good config"""
+        try:
+            if self.processor.reload_if_changed():
+                self.config_reloads += 1
+                self.last_config_error = None
+        except (OSError, ValueError) as e:
+            # Remember the bad mtime so the same broken file is not re-parsed on every request
+            self.processor.config_mtime = os.path.getmtime(self.processor.config_path)
+            self.last_config_error = str(e)
+            logger.warning("Config reload failed, keeping previous config: %s", e)
+
+    def health(self) -> Dict:
+        return {
+            "success": True,
+            "status": "ok",
+            "pid": os.getpid(),
+            "uptime_seconds": round(time.time() - self.started_at, 3),
+            "processed": self.processed,
+            "failed": self.failed,
+            "config_path": self.processor.config_path,
+            "config_mtime": self.processor.config_mtime,
+            "config_reloads": self.config_reloads,
+            "config_error": self.last_config_error,
+            "pending_outputs": self.processor.writer.pending,
+            "outputs_written": self.processor.writer.written,
+            "output_errors": self.processor.writer.errors,
+            "result_cache": self.processor.result_cache.stats() if self.processor.result_cache else None,
+            "templates": sorted(self.processor.config.get('templates', {}).keys())
+        }
+
+    def handle(self, request: Dict) -> Dict:
+        """Handle a single decoded request and return the response object"""
+        cmd = request.get("cmd", "process")
+        self.check_config()
+
+        if cmd == "health":
+            return self.health()
+        if cmd == "metrics":
+            return {"success": True, **self.metrics.snapshot()}
+        if cmd == "shutdown":
+            return {"success": True, "status": "shutting_down"}
+        if cmd == "flush":
+            self.processor.writer.flush()
+            return {"success": True, "outputs_written": self.processor.writer.written, "output_errors": self.processor.writer.errors}
+        if cmd == "reload":
+            try:
+                self.processor.load_config()
+                self.config_reloads += 1
+                self.last_config_error = None
+                return {"success": True, "config_mtime": self.processor.config_mtime}
+            except (OSError, ValueError) as e:
+                self.last_config_error = str(e)
+                return {"success": False, "error": f"Config reload failed: {e}"}
+        if cmd != "process":
+            return {"success": False, "error": f"Unknown command: {cmd}"}
+
+        image_path = request.get("image_path")
+        image_base64 = request.get("image_base64")
+        if not image_path and not image_base64:
+            return {"success": False, "error": "Missing 'image_path' or 'image_base64'"}
+        template_name = request.get("template_name", "YKS_STANDARD")
+        output_dir = request.get("output_dir") or self.default_output_dir
+        options = dict(self.form_options)
+        options.update({key: request[key] for key in self.FORM_OPTIONS if key in request})
+        # Timings always feed the metrics; they are only returned when asked for
+        report_timings = options.get("timings", False)
+        options["timings"] = True
+        source_name = Path(image_path).stem if image_path else request.get("source_name") or "upload"
+
+        try:
+            with self.profiler.form(source_name):
+                if image_path:
+                    result = self.processor.process_form(image_path, template_name, output_dir, **options)
+                else:
+                    data = base64.b64decode(image_base64, validate=True)
+                    result = self.processor.process_bytes(data, template_name, output_dir, source_name, **options)
+        except binascii.Error as e:
+            result = {"success": False, "error": f"Invalid 'image_base64': {e}"}
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+
+        self.metrics.record_result(result)
+        if not report_timings:
+            strip_timings(result)
+        if result.get("success"):
+            self.processed += 1
+        else:
+            self.failed += 1
+        return result
+
+    def serve(self, stdin: TextIO, stdout: TextIO) -> None:
+        """Read requests from stdin until EOF or a shutdown command"""
+        try:
+            self._serve(stdin, stdout)
+        finally:
+            # Pending output images are still written before the process exits
+            self.processor.writer.close()
+            self.profiler.close()
+
+    def _serve(self, stdin: TextIO, stdout: TextIO) -> None:
+        for line in stdin:
+            line = line.strip()
+            if not line:
+                continue
+
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("Request must be a JSON object")
+            except ValueError as e:
+                response = {"success": False, "error": f"Invalid request: {e}"}
+                request = {}
+            else:
+                # Anything printed while processing must not end up in the response stream
+                with contextlib.redirect_stdout(sys.stderr):
+                    response = self.handle(request)
+
+            if "id" in request:
+                response["id"] = request["id"]
+            stdout.write(json.dumps(response, ensure_ascii=False) + "\n")
+            stdout.flush()
+
+            if request.get("cmd") == "shutdown":
+                break
+
+
+def _iter_batch_sources(source: str, template_name: str, output_dir: str) -> Iterator[Tuple[str, str, str]]:
+    """Yield (image_path, template_name, output_dir) from a directory of scans or a manifest file"""
+    if os.path.isdir(source):
+        names = sorted(n for n in os.listdir(source) if n.lower().endswith(IMAGE_EXTENSIONS))
+        for name in names:
+            yield os.path.join(source, name), template_name, output_dir
+        return
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    with open(source, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('{'):
+                entry = json.loads(line)
+            else:
+                entry = {"image_path": line}
+            yield (
+                os.path.join(base_dir, entry["image_path"]),
+                entry.get("template_name", template_name),
+                entry.get("output_dir", output_dir)
+            )
+
+
+def iter_batch_items(source: str, template_name: str, output_dir: str) -> Iterator[Dict]:
+    """
+    Yield batch work items from a directory of scans or a manifest file.
+    A manifest has one entry per line: either a plain image path or a JSON object
+    with "image_path" and optional "template_name" / "output_dir".
+    Relative paths in a manifest are resolved against the manifest's directory.
+    Multi-page TIFFs are expanded into one item per page (with "page_index"),
+    so the pages of one stack are spread across the pool.
+    """
+    index = 0
+    for image_path, item_template, item_output in _iter_batch_sources(source, template_name, output_dir):
+        pages = OMRProcessor.page_count(image_path)
+        for page_index in range(pages):
+            item = {
+                "index": index,
+                "image_path": image_path,
+                "template_name": item_template,
+                "output_dir": item_output
+            }
+            if pages > 1:
+                item["page_index"] = page_index
+            index += 1
+            yield item
+
+
+# Per-process state for batch pool workers
+_batch_processor: Optional[OMRProcessor] = None
+_batch_form_options: Dict = {}
+_batch_profiler = Profiler(None)
+
+
+def _init_batch_worker(
+    config_path: str,
+    form_options: Dict,
+    log_level: str,
+    log_file: Optional[str],
+    profile_path: Optional[str] = None,
+    profile_per: str = "run",
+    result_cache_mb: Optional[float] = None,
+    roster_path: Optional[str] = None
+) -> None:
+    """Pool initializer: build one warm processor per worker process"""
+    global _batch_processor, _batch_form_options, _batch_profiler
+    # One OpenCV thread per process; the pool provides the parallelism
+    cv2.setNumThreads(1)
+    # Keep stray prints out of the NDJSON stream written by the parent
+    sys.stdout = sys.stderr
+    configure_logging(log_level, log_file)
+    _batch_processor = OMRProcessor(config_path, result_cache_mb=result_cache_mb, roster_path=roster_path)
+    _batch_processor.writer = OutputWriter()
+    # Pool workers exit without running atexit hooks; drain pending outputs on process exit
+    multiprocessing.util.Finalize(_batch_processor.writer, _batch_processor.writer.close, exitpriority=10)
+    _batch_form_options = form_options
+    if profile_path is not None and profile_per == "run":
+        # One partial profile per pool process; the parent merges them when the pool is done
+        profile_path = f"{profile_path}.part-{os.getpid()}"
+    _batch_profiler = Profiler(profile_path, profile_per)
+    multiprocessing.util.Finalize(_batch_profiler, _batch_profiler.close, exitpriority=10)
+
+
+def _process_batch_item(item: Dict) -> Dict:
+    """Process one batch item inside a pool worker; never raises"""
+    name = Path(item["image_path"]).stem
+    if "page_index" in item:
+        name = f"{name}_p{item['page_index']}"
     try:
-        processor = OMRProcessor(config_path)
-        result = processor.process_form(image_path, template_name, output_dir)
-        print(json.dumps(result, ensure_ascii=False))
+        with _batch_profiler.form(name):
+            if "page_index" in item:
+                result = _batch_processor.process_page(
+                    item["image_path"], item["page_index"], item["template_name"], item["output_dir"],
+                    **_batch_form_options
+                )
+            else:
+                result = _batch_processor.process_form(
+                    item["image_path"], item["template_name"], item["output_dir"], **_batch_form_options
+                )
+    except Exception as e:
+        result = {"success": False, "error": str(e)}
+    result["index"] = item["index"]
+    result["source"] = item["image_path"]
+    return result
+
+
+def run_batch(
+    source: str,
+    config_path: str,
+    template_name: str,
+    output_dir: str,
+    workers: Optional[int],
+    stdout: TextIO,
+    form_options: Optional[Dict] = None,
+    log_level: str = "WARNING",
+    log_file: Optional[str] = None,
+    metrics_path: Optional[str] = None,
+    profile_path: Optional[str] = None,
+    profile_per: str = "run",
+    result_cache_mb: Optional[float] = None,
+    answer_store_path: Optional[str] = None,
+    roster_path: Optional[str] = None
+) -> int:
+    """
+    Process a directory or manifest with a bounded process pool.
+    Results are written as NDJSON in completion order as soon as each form finishes.
+    Cumulative metrics are written to `metrics_path` (JSON) when the batch ends.
+    With `answer_store_path`, decoded answers are appended to
+    <answer_store_path>/<template>/ (see omr_answer_store.py).
+    With `roster_path`, every worker loads the roster once (see omr_roster.py).
+    """
+    workers = workers or os.cpu_count() or 1
+    metrics = Metrics()
+    form_options = dict(form_options or {})
+    # Timings always feed the metrics; they are only emitted when asked for
+    report_timings = form_options.get("timings", False)
+    form_options["timings"] = True
+    # Bound the number of queued items so huge manifests are not materialized at once
+    max_in_flight = workers * 2
+    started = time.time()
+    total = 0
+    failed = 0
+    stores: Dict[str, AnswerStore] = {}
+    templates: Dict[str, CompiledTemplate] = {}
+
+    def store_answers(template_name: str, result: Dict) -> None:
+        # Only the parent writes, so rows are appended without locking
+        if template_name not in stores:
+            if not templates:
+                templates.update(OMRProcessor(config_path).templates)
+            stores[template_name] = AnswerStore(
+                os.path.join(answer_store_path, template_name),
+                template_layout(templates[template_name]), template_name
+            )
+        stores[template_name].append(result, result.get("source"))
+
+    def store_pages(template_name: str, result: Dict) -> None:
+        # With AUTO, each page reports the template it was read with
+        for page in result.get("pages", [result]):
+            if page.get("success"):
+                store_answers(page.get("template_name", template_name), {**page, "source": result.get("source")})
+
+    def emit(result: Dict) -> None:
+        nonlocal total, failed
+        total += 1
+        if not result.get("success"):
+            failed += 1
+        metrics.record_result(result)
+        if not report_timings:
+            strip_timings(result)
+        stdout.write(json.dumps(result, ensure_ascii=False) + "\n")
+        stdout.flush()
+
+    items = iter_batch_items(source, template_name, output_dir)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                             initargs=(config_path, form_options, log_level, log_file,
+                                       profile_path, profile_per, result_cache_mb, roster_path)) as pool:
+        pending = {}
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < max_in_flight:
+                item = next(items, None)
+                if item is None:
+                    exhausted = True
+                    break
+                pending[pool.submit(_process_batch_item, item)] = item
+
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # Worker crashed (e.g. killed); report the form and keep going
+                    result = {"success": False, "error": str(e), "index": item["index"], "source": item["image_path"]}
+                    if "page_index" in item:
+                        result["page_index"] = item["page_index"]
+                if answer_store_path and result.get("success"):
+                    store_pages(item["template_name"], result)
+                emit(result)
+
+    for store in stores.values():
+        if store.skipped:
+            logger.info("Answer store %s: %d sheets already stored, skipped", store.path, store.skipped)
+        store.close()
+    elapsed = time.time() - started
+    logger.info("Batch finished: %d forms, %d failed, %.2fs with %d workers", total, failed, elapsed, workers)
+    snapshot = metrics.snapshot()
+    logger.info("Alignment methods: %s", {
+        name: count for name, count in snapshot["counters"].items() if name.startswith("alignment_")
+    })
+    if metrics_path:
+        with open(metrics_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False, indent=2)
+    if profile_path is not None and profile_per == "run":
+        prefix = os.path.basename(profile_path) + ".part-"
+        profile_dir = os.path.dirname(os.path.abspath(profile_path))
+        parts = [os.path.join(profile_dir, n) for n in os.listdir(profile_dir) if n.startswith(prefix)]
+        merge_profiles(parts, profile_path)
+        for part in parts:
+            os.remove(part)
+    return 0
+
+
+def configure_logging(level: str = "WARNING", log_file: Optional[str] = None) -> None:
+    """Send logs to stderr, or to a file; never to stdout"""
+    handler = logging.FileHandler(log_file, encoding='utf-8') if log_file else logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(process)d %(levelname)s %(name)s: %(message)s"))
+    logger.handlers[:] = [handler]
+    logger.setLevel(level.upper())
+    logger.propagate = False
+
+
+def run_single(
+    image_path: str,
+    template_name: str,
+    config_path: str,
+    output_dir: str,
+    form_options: Optional[Dict] = None,
+    profile_path: Optional[str] = None,
+    profile_per: str = "run",
+    result_cache_mb: Optional[float] = None,
+    read_threads: int = 1,
+    roster_path: Optional[str] = None
+) -> int:
+    """
+    Process one form and print its result as JSON (before its output images are finished)
+    With `profile_path`, cProfile data for the form is written there.
+    """
+    processor = None
+    try:
+        processor = OMRProcessor(
+            config_path, result_cache_mb=result_cache_mb, read_threads=read_threads, roster_path=roster_path
+        )
+        processor.writer = OutputWriter()
+        profiler = Profiler(profile_path, profile_per)
+        with profiler.form(Path(image_path).stem):
+            result = processor.process_form(image_path, template_name, output_dir, **(form_options or {}))
+        profiler.close()
+        print(json.dumps(result, ensure_ascii=False), flush=True)
     except Exception as e:
         print(json.dumps({
             "success": False,
             "error": str(e)
         }))
+        return 1
+    finally:
+        if processor is not None and processor.writer is not None:
+            processor.writer.close()
+    return 0
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description="Standard OMR processing")
+    parser.add_argument("args", nargs="*", help="<image_path> <template_name> <config_path> <output_dir>")
+    parser.add_argument("--serve", action="store_true", help="Run as a long-lived JSON-lines worker on stdin/stdout")
+    parser.add_argument("--batch", metavar="DIR_OR_MANIFEST", help="Process a directory or manifest file, streaming NDJSON results")
+    parser.add_argument("--config", default=DEFAULT_CONFIG_PATH, help="Path to omr_config.json (worker modes)")
+    parser.add_argument("--template", default="YKS_STANDARD",
+                        help=f"Default template name (batch mode); {AUTO_TEMPLATE} recognises each page's template")
+    parser.add_argument("--output", default="./output", help="Default output directory (worker modes)")
+    parser.add_argument("--workers", type=int, default=None, help="Batch pool size (default: CPU count)")
+    parser.add_argument("--read-threads", type=int, default=1,
+                        help="Threads reading the regions of one form (single and --serve; default: 1, sequential)")
+    parser.add_argument("--diagnostics", metavar="DIR", default=None,
+                        help="Write a per-form diagnostics bundle (fill ratios, thresholded ROIs, overlay, timings) under DIR")
+    parser.add_argument("--no-image", action="store_true",
+                        help="Do not write the annotated processed_<name>.jpg (skips the full-page warp)")
+    parser.add_argument("--output-policy", choices=OUTPUT_POLICIES, default=None,
+                        help="Output images to write: none, thumbnail, roi or full (default: per template)")
+    parser.add_argument("--jpeg-quality", type=int, default=None, help="JPEG quality of output images (default: per template)")
+    parser.add_argument("--timings", action="store_true", help="Include per-stage milliseconds in each result")
+    parser.add_argument("--profile", metavar="PATH", default=None,
+                        help="Write cProfile/pstats data: a file (--profile-per run) or a directory of <form>.prof files")
+    parser.add_argument("--profile-per", choices=("run", "form"), default="run",
+                        help="One profile for the whole run (default) or one <form>.prof per form under PATH")
+    parser.add_argument("--cache", action="store_true",
+                        help="Answer scans seen before from the result cache in .omr_cache/results.sqlite")
+    parser.add_argument("--no-cache", action="store_true", help="Do not use the result cache, even with --cache")
+    parser.add_argument("--cache-size-mb", type=float, default=64.0, help="Size cap of the result cache (default: 64)")
+    parser.add_argument("--roster", metavar="FILE", default=None,
+                        help="Student roster export (CSV / JSON) to resolve student numbers against")
+    parser.add_argument("--answer-store", metavar="DIR", default=None,
+                        help="Batch mode: append decoded answers to a memory-mappable store under DIR/<template>/")
+    parser.add_argument("--metrics", metavar="FILE", default=None,
+                        help="Write cumulative counters and stage histograms as JSON when a batch or worker ends")
+    parser.add_argument("--log-level", default="WARNING", help="Log level for stderr / --log-file (default: WARNING)")
+    parser.add_argument("--log-file", default=None, help="Write logs to this file instead of stderr")
+    options = parser.parse_args()
+
+    configure_logging(options.log_level, options.log_file)
+    result_cache_mb = options.cache_size_mb if options.cache and not options.no_cache else None
+    form_options = {
+        "diagnostics_dir": options.diagnostics,
+        "save_image": not options.no_image,
+        "output_policy": options.output_policy,
+        "jpeg_quality": options.jpeg_quality,
+        "timings": options.timings
+    }
+
+    if options.roster:
+        # A broken export fails here, before any worker loads it
+        try:
+            RosterIndex.load(options.roster)
+        except (OSError, ValueError) as e:
+            print(json.dumps({"success": False, "error": f"Invalid roster: {e}"}))
+            sys.exit(1)
+
+    if options.batch:
+        if not os.path.exists(options.batch):
+            print(json.dumps({"success": False, "error": f"Batch source not found: {options.batch}"}))
+            sys.exit(1)
+        sys.exit(run_batch(
+            options.batch, options.config, options.template, options.output, options.workers, sys.stdout,
+            form_options, options.log_level, options.log_file,
+            options.metrics, options.profile, options.profile_per, result_cache_mb, options.answer_store,
+            options.roster
+        ))
+
+    if options.serve:
+        worker = OMRWorker(
+            options.config, options.output, form_options,
+            Profiler(options.profile, options.profile_per), result_cache_mb, options.read_threads, options.roster
+        )
+        worker.serve(sys.stdin, sys.stdout)
+        if options.metrics:
+            with open(options.metrics, 'w', encoding='utf-8') as f:
+                json.dump(worker.metrics.snapshot(), f, ensure_ascii=False, indent=2)
+        return
+
+    if len(options.args) < 4:
+        print(json.dumps({
+            "success": False,
+            "error": "Usage: python standard_omr.py <image_path> <template_name> <config_path> <output_dir>"
+        }))
         sys.exit(1)
 
+    image_path, template_name, config_path, output_dir = options.args[:4]
+    sys.exit(run_single(
+        image_path, template_name, config_path, output_dir, form_options,
+        options.profile, options.profile_per, result_cache_mb, options.read_threads, options.roster
+    ))
+
 
 if __name__ == "__main__":
     main()
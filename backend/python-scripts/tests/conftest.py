@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The OMR modules are flat scripts next to this directory, imported by name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
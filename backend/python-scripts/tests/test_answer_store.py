@@ -0,0 +1,93 @@
+import os
+
+import numpy as np
+import pytest
+
+from omr_answer_store import AnswerStore, item_analysis
+
+
+LAYOUT = [{"name": "MAT", "questions": 3, "options": "ABCDE"}]
+KEY = {"MAT": "ABC"}
+SHEETS = [
+    ["A", "B", "C"],
+    ["A", "B", "D"],
+    ["A", "E", "C"],
+    ["B", "", "C"],
+    ["", "", "AB"],
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = AnswerStore(str(tmp_path / "YKS_STANDARD"), LAYOUT, "YKS_STANDARD")
+    for i, answers in enumerate(SHEETS):
+        store.append({"success": True, "answers": {"MAT": answers}}, source=f"{i}.jpg")
+    yield store
+    store.close()
+
+
+def test_rows_round_trip(store):
+    assert store.rows == len(SHEETS)
+    assert store.matrix("MAT")[3].tolist() == [2, 0, 3]
+
+
+def test_option_blank_and_invalid_rates(store):
+    items = item_analysis(store)["subjects"]["MAT"]["items"]
+    assert items[0]["options"]["A"] == 0.6
+    assert items[0]["options"]["B"] == 0.2
+    assert items[1]["blank_rate"] == 0.4
+    assert items[2]["invalid_rate"] == 0.2
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 2, 65536])
+def test_difficulty_and_point_biserial(store, chunk_rows):
+    items = item_analysis(store, KEY, chunk_rows=chunk_rows)["subjects"]["MAT"]["items"]
+    key = np.array([list("ABC")])
+    correct = (np.array(SHEETS, dtype=object) == key).astype(np.float64)
+    totals = correct.sum(axis=1)
+    for q, item in enumerate(items):
+        rest = totals - correct[:, q]
+        assert item["difficulty"] == pytest.approx(correct[:, q].mean(), abs=1e-4)
+        assert item["discrimination"] == pytest.approx(np.corrcoef(correct[:, q], rest)[0, 1], abs=1e-4)
+
+
+def test_constant_item_has_no_discrimination(tmp_path):
+    store = AnswerStore(str(tmp_path / "store"), LAYOUT)
+    for i, answers in enumerate([["A", "B", "C"], ["A", "", "C"], ["A", "B", ""]]):
+        store.append({"success": True, "answers": {"MAT": answers}}, source=f"{i}.jpg")
+    first = item_analysis(store, KEY)["subjects"]["MAT"]["items"][0]
+    assert first["difficulty"] == 1.0 and first["discrimination"] is None
+
+
+def test_sheet_is_stored_once(store):
+    assert store.append({"success": True, "answers": {"MAT": ["A", "A", "A"]}}, source="0.jpg") == 0
+    assert store.skipped == 1
+    store.close()
+    reopened = AnswerStore(store.path)
+    assert reopened.append({"success": True, "answers": {"MAT": ["A", "A", "A"]}}, source="1.jpg") == 0
+    assert reopened.append({"success": True, "answers": {"MAT": ["A", "A", "A"]}}, source="new.jpg") == 1
+    assert reopened.rows == len(SHEETS) + 1
+    reopened.close()
+
+
+def test_pages_of_one_source_are_separate_sheets(tmp_path):
+    store = AnswerStore(str(tmp_path / "store"), LAYOUT)
+    result = {"success": True, "source": "scan.pdf", "pages": [
+        {"success": True, "page_index": 0, "answers": {"MAT": ["A"]}},
+        {"success": True, "page_index": 1, "answers": {"MAT": ["B"]}},
+    ]}
+    assert store.append(result) == 2
+    assert store.append(result) == 0
+    store.close()
+
+
+def test_interrupted_append_is_cut_off(store):
+    store.close()
+    with open(os.path.join(store.path, "MAT.u8"), "ab") as f:
+        f.write(b"\x01")
+    assert AnswerStore(store.path).rows == len(SHEETS)
+
+
+def test_layout_mismatch_is_an_error(store):
+    with pytest.raises(ValueError):
+        AnswerStore(store.path, [{"name": "MAT", "questions": 4, "options": "ABCDE"}])
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from omr_grading import BLANK, INVALID, encode_answers, encode_key, grade_batch, grade_matrix, percentile_ranks
+
+
+def test_encode_answers_codes_blanks_and_invalid_marks():
+    codes = encode_answers([["A", "", "E", "AB", "F"]], 5)
+    assert codes.tolist() == [[1, BLANK, 5, INVALID, INVALID]]
+
+
+def test_encode_answers_pads_and_truncates():
+    codes = encode_answers([["B"], ["A", "B", "C", "D"]], 3)
+    assert codes.tolist() == [[2, BLANK, BLANK], [1, 2, 3]]
+
+
+def test_encode_key_cancelled_and_invalid_entries():
+    assert encode_key("A.C D").tolist() == [1, BLANK, 3, BLANK, 4]
+    with pytest.raises(ValueError):
+        encode_key("ABX")
+
+
+def test_grade_matrix_counts():
+    key = encode_key("ABCD")
+    answers = encode_answers([["A", "B", "C", "D"], ["A", "C", "", "AB"], ["", "", "", ""]], 4)
+    counts = grade_matrix(answers, key)
+    assert counts["correct"].tolist() == [4, 1, 0]
+    assert counts["wrong"].tolist() == [0, 2, 0]
+    assert counts["empty"].tolist() == [0, 1, 4]
+
+
+def test_cancelled_question_is_not_graded():
+    counts = grade_matrix(encode_answers([["A", "E", ""]], 3), encode_key("A.C"))
+    assert (counts["correct"][0], counts["wrong"][0], counts["empty"][0]) == (1, 0, 1)
+
+
+def test_percentile_ranks_share_ties():
+    standing = percentile_ranks(np.array([10.0, 20.0, 20.0, 30.0]))
+    assert standing["rank"].tolist() == [4, 2, 2, 1]
+    assert standing["percentile"].tolist() == [12.5, 50.0, 50.0, 87.5]
+
+
+def test_grade_batch_scores_and_skips_failures():
+    results = [
+        {"success": True, "image_path": "a.jpg", "answers": {"MAT": ["A", "B", "", "E"], "FEN": ["A", "A"]}},
+        {"success": False, "image_path": "b.jpg", "error": "No markers"},
+        {"success": True, "image_path": "c.jpg", "answers": {"MAT": ["A", "B", "C", "D"], "FEN": ["A", "B"]}},
+    ]
+    graded = grade_batch(results, {"MAT": "ABCD", "FEN": "AB"})
+    first, second = graded["students"]
+    assert first["subjects"]["MAT"] == {
+        "correct": 2, "wrong": 1, "empty": 1, "net": 1.75, "score": 8.75, "rank": 2, "percentile": 25.0
+    }
+    assert first["subjects"]["FEN"]["score"] == 3.75
+    assert second["subjects"]["MAT"]["score"] == 20.0
+    # 1.75 + 0.75 nets at 5 points each
+    assert (first["total_net"], first["score"], first["rank"]) == (2.5, 12.5, 2)
+    assert (second["total_net"], second["score"], second["rank"]) == (6.0, 30.0, 1)
+    assert [skipped["error"] for skipped in graded["skipped"]] == ["No markers"]
+    assert graded["summary"]["graded"] == 2
+    assert graded["summary"]["score"]["mean"] == 21.25
+
+
+def test_grade_batch_flattens_pages():
+    result = {"success": True, "source": "scan.pdf", "pages": [
+        {"success": True, "page_index": 0, "answers": {"MAT": ["A"]}},
+        {"success": True, "page_index": 1, "answers": {"MAT": ["B"]}},
+    ]}
+    graded = grade_batch([result], {"MAT": "A"})
+    assert [(s["source"], s["page_index"], s["score"]) for s in graded["students"]] == [
+        ("scan.pdf", 0, 5.0), ("scan.pdf", 1, -1.25)
+    ]
+
+
+def test_subject_scores_follow_the_marking_rules():
+    results = [{"success": True, "answers": {"MAT": ["A", "C", "C", ""]}}]
+    graded = grade_batch(results, {"MAT": "ABCD"}, wrong_penalty=1 / 3, points_per_net=4.0)
+    subject = graded["students"][0]["subjects"]["MAT"]
+    assert (subject["net"], subject["score"]) == (1.67, 6.67)
+    assert graded["students"][0]["score"] == subject["score"]
@@ -0,0 +1,148 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import omr_queue
+from omr_queue import JobQueue, QueueFull
+
+
+def _dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.sqlite"))
+
+
+def _request(name="a.jpg"):
+    return {"image_path": name, "template": "YKS_STANDARD"}
+
+
+def test_claim_order_is_priority_then_submission(queue):
+    first = queue.submit(_request("1.jpg"))
+    urgent = queue.submit(_request("2.jpg"), priority=omr_queue.PRIORITY_INTERACTIVE)
+    second = queue.submit(_request("3.jpg"))
+    claimed = [queue.claim(1)["id"] for _ in range(3)]
+    assert claimed == [urgent, first, second]
+    assert queue.claim(1) is None
+
+
+def test_submit_rejects_control_and_empty_requests(queue):
+    with pytest.raises(ValueError):
+        queue.submit({"cmd": "stats"})
+    with pytest.raises(ValueError):
+        queue.submit({"template": "YKS_STANDARD"})
+
+
+def test_submit_refuses_beyond_the_cap(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"), max_queued=2)
+    queue.submit(_request())
+    queue.submit(_request())
+    with pytest.raises(QueueFull):
+        queue.submit(_request())
+
+
+def test_complete_is_ignored_for_a_worker_that_lost_the_job(queue):
+    job_id = queue.submit(_request())
+    queue.claim(worker_pid=100)
+    queue.complete(job_id, worker_pid=200, result={"success": True})
+    assert queue.get(job_id)["status"] == "running"
+    queue.complete(job_id, worker_pid=100, result={"success": True})
+    assert queue.get(job_id)["status"] == "done"
+
+
+def test_pipeline_error_is_final(queue):
+    job_id = queue.submit(_request())
+    queue.claim(worker_pid=100)
+    queue.complete(job_id, worker_pid=100, result={"success": False, "error": "No markers"})
+    job = queue.get(job_id)
+    assert job["status"] == "failed" and job["error"] == "No markers"
+
+
+def test_release_backs_off_then_gives_up(queue, monkeypatch):
+    job_id = queue.submit(_request(), max_attempts=2)
+    queue.claim(worker_pid=100)
+    before = time.time()
+    assert queue.release(job_id, "Worker crashed") == "queued"
+    available_at = queue.conn.execute("SELECT available_at FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+    assert available_at >= before + omr_queue.RETRY_BACKOFF_SECONDS
+    # Not claimable until the backoff has passed
+    assert queue.claim(worker_pid=100) is None
+
+    now = time.time()
+    monkeypatch.setattr(omr_queue.time, "time", lambda: now + 60)
+    claimed = queue.claim(worker_pid=100)
+    assert claimed["id"] == job_id and claimed["attempt"] == 2
+    assert queue.release(job_id, "Worker crashed") == "failed"
+    job = queue.get(job_id)
+    assert job["status"] == "failed" and "gave up after 2 attempts" in job["error"]
+
+
+def test_release_for_another_worker_leaves_the_job(queue):
+    job_id = queue.submit(_request())
+    queue.claim(worker_pid=100)
+    assert queue.release(job_id, "Timed out", worker_pid=200) == "missing"
+    assert queue.get(job_id)["status"] == "running"
+    assert queue.release(job_id, "Timed out", worker_pid=100) == "queued"
+
+
+def test_release_expired_skips_live_workers_of_the_service(queue):
+    held = queue.submit(_request("held.jpg"))
+    orphaned = queue.submit(_request("orphaned.jpg"))
+    queue.claim(worker_pid=100, lease_seconds=-1)
+    queue.claim(worker_pid=200, lease_seconds=-1)
+    assert queue.release_expired({100}) == 1
+    assert queue.get(held)["status"] == "running"
+    assert queue.get(orphaned)["status"] == "queued"
+
+
+def test_release_expired_keeps_jobs_within_their_lease(queue):
+    job_id = queue.submit(_request())
+    queue.claim(worker_pid=200, lease_seconds=60)
+    assert queue.release_expired(set()) == 0
+    assert queue.get(job_id)["status"] == "running"
+
+
+def test_recover_releases_jobs_of_dead_workers(queue):
+    dead = queue.submit(_request("dead.jpg"))
+    alive = queue.submit(_request("alive.jpg"))
+    expired = queue.submit(_request("expired.jpg"))
+    queue.claim(worker_pid=_dead_pid())
+    queue.claim(worker_pid=os.getpid())
+    queue.claim(worker_pid=os.getpid(), lease_seconds=-1)
+    assert queue.recover() == 2
+    assert queue.get(dead)["status"] == "queued"
+    assert queue.get(alive)["status"] == "running"
+    assert queue.get(expired)["status"] == "queued"
+
+
+def test_cancel_and_retry(queue):
+    job_id = queue.submit(_request())
+    assert queue.cancel(job_id)
+    assert queue.get(job_id)["status"] == "cancelled"
+    assert queue.retry(job_id)
+    job = queue.get(job_id)
+    assert job["status"] == "queued" and job["attempts"] == 0 and job["position"] == 0
+
+
+def test_get_returns_the_request_without_inline_images(queue):
+    job_id = queue.submit({"image_base64": "aGVsbG8=", "source_name": "upload", "exam_id": 7})
+    assert queue.get(job_id)["request"] == {"source_name": "upload", "exam_id": 7}
+
+
+def test_resolve_replaces_the_result_of_finished_jobs_only(queue):
+    job_id = queue.submit(_request())
+    assert not queue.resolve(job_id, {"success": True})
+    queue.claim(worker_pid=100)
+    assert not queue.resolve(job_id, {"success": True})
+    queue.complete(job_id, worker_pid=100, result={"success": False, "error": "No markers"})
+    assert queue.resolve(job_id, {"success": True, "student_number_detected": "20240001"})
+    job = queue.get(job_id)
+    assert job["status"] == "done" and job["error"] is None
+    assert job["result"]["student_number_detected"] == "20240001"
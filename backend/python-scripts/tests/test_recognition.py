@@ -0,0 +1,95 @@
+import json
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from generate_test_form import generate_corpus
+from standard_omr import DECODE_FLAGS, OMRProcessor
+
+
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG_PATH = os.path.join(SCRIPT_DIR, "omr_config.json")
+TEST_IMAGE = os.path.join(SCRIPT_DIR, "test-image.jpg")
+RESULT_FIELDS = ("success", "student_number_detected", "answers", "confidence_score",
+                 "student_number_confidence", "answers_confidence")
+
+
+def _corpus(directory, augment: str, per_template: int, seed: int):
+    generate_corpus(CONFIG_PATH, str(directory), 2 * per_template, seed=seed, augment=augment, workers=1)
+    with open(os.path.join(str(directory), "truth.json"), 'r', encoding='utf-8') as f:
+        return [{**form, "path": os.path.join(str(directory), form["image"])} for form in json.load(f)["forms"]]
+
+
+@pytest.fixture(scope="module")
+def clean_forms(tmp_path_factory):
+    return _corpus(tmp_path_factory.mktemp("clean"), "clean", 3, seed=11)
+
+
+@pytest.fixture(scope="module")
+def scan_forms(tmp_path_factory):
+    # Scan defects send some lines through the re-read cascade
+    return _corpus(tmp_path_factory.mktemp("scan"), "scan", 2, seed=12)
+
+
+@pytest.fixture(scope="module")
+def processor(tmp_path_factory):
+    return OMRProcessor(CONFIG_PATH, cache_dir=str(tmp_path_factory.mktemp("omr_cache")))
+
+
+@pytest.fixture(scope="module")
+def threaded(tmp_path_factory):
+    return OMRProcessor(CONFIG_PATH, cache_dir=str(tmp_path_factory.mktemp("omr_cache")), read_threads=4)
+
+
+@pytest.fixture(scope="module")
+def no_cascade(tmp_path_factory):
+    with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    for template in config["templates"].values():
+        template["detection_params"]["reread_margin"] = 0
+    path = tmp_path_factory.mktemp("no_cascade") / "omr_config.json"
+    path.write_text(json.dumps(config, ensure_ascii=False), encoding="utf-8")
+    return OMRProcessor(str(path))
+
+
+def _read(processor, path, template_name, output_dir):
+    result = processor.process_image(cv2.imread(path, DECODE_FLAGS), template_name, str(output_dir),
+                                     "form", save_image=False)
+    return {field: result.get(field) for field in RESULT_FIELDS}
+
+
+def test_grid_fill_ratios_match_per_cell_slices(processor):
+    roi = np.random.default_rng(3).integers(0, 256, size=(97, 83), dtype=np.uint8)
+    # The last row and column of boxes are clipped at the region edge
+    rows, cols, radius, row_spacing, col_spacing, threshold = 5, 4, 10, 20, 22, 0.5
+    filled, ratios = processor.detect_bubbles_in_grid(roi, rows, cols, radius, row_spacing, col_spacing, threshold)
+    thresh = processor.binarize(roi)
+    for row in range(rows):
+        for col in range(cols):
+            cx, cy = col * col_spacing + radius, row * row_spacing + radius
+            bubble = thresh[max(0, cy - radius):min(thresh.shape[0], cy + radius),
+                            max(0, cx - radius):min(thresh.shape[1], cx + radius)]
+            expected = cv2.countNonZero(bubble) / bubble.size if bubble.size else 0.0
+            assert ratios[row, col] == expected
+            assert filled[row, col] == (bubble.size > 0 and expected >= threshold)
+
+
+def test_threaded_read_matches_sequential(processor, threaded, scan_forms, tmp_path):
+    sequential = _read(processor, TEST_IMAGE, "YKS_STANDARD", tmp_path)
+    assert sequential["success"] and sequential["student_number_detected"] == "12345678"
+    assert _read(threaded, TEST_IMAGE, "YKS_STANDARD", tmp_path) == sequential
+    for form in scan_forms:
+        sequential = _read(processor, form["path"], form["template"], tmp_path)
+        assert _read(threaded, form["path"], form["template"], tmp_path) == sequential, form["image"]
+
+
+def test_clean_sheets_read_as_drawn(processor, no_cascade, clean_forms, tmp_path):
+    for form in clean_forms:
+        result = _read(processor, form["path"], form["template"], tmp_path)
+        assert result["student_number_detected"] == form["student_number"], form["image"]
+        assert result["answers"] == form["answers"], form["image"]
+        # The cascade leaves clean sheets as the plain bubble scores read them
+        plain = _read(no_cascade, form["path"], form["template"], tmp_path)
+        assert (plain["student_number_detected"], plain["answers"]) == (form["student_number"], form["answers"])
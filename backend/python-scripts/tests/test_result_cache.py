@@ -0,0 +1,111 @@
+import itertools
+import json
+import os
+
+import pytest
+
+import omr_result_cache
+from omr_result_cache import ResultCache
+from standard_omr import OMRProcessor
+
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "omr_config.json")
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    # A strictly increasing clock, so least-recently-used order does not depend on timer resolution
+    clock = itertools.count(1000)
+    monkeypatch.setattr(omr_result_cache.time, "time", lambda: float(next(clock)))
+    return ResultCache(str(tmp_path / "results.sqlite"), max_bytes=1024)
+
+
+def _size(result):
+    return len(json.dumps(result, ensure_ascii=False))
+
+
+def _summed(cache):
+    return cache.conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+
+def test_make_key_covers_every_part():
+    key = ResultCache.make_key(1, "digest", "YKS_STANDARD", None)
+    assert key == ResultCache.make_key(1, "digest", "YKS_STANDARD", None)
+    assert key != ResultCache.make_key(2, "digest", "YKS_STANDARD", None)
+    assert key != ResultCache.make_key(1, "digest", "LGS_STANDARD", None)
+    assert key != ResultCache.make_key(1, "digest", "YKS_STANDARD", 0)
+
+
+def test_get_and_put(cache):
+    assert cache.get("a") is None
+    cache.put("a", {"success": True, "answers": {"MAT": ["A"]}})
+    assert cache.get("a") == {"success": True, "answers": {"MAT": ["A"]}}
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_entry_failing_validation_is_dropped(cache):
+    cache.put("a", {"success": True, "output_files": ["gone.jpg"]})
+    assert cache.get("a", valid=lambda stored: False) is None
+    assert cache.misses == 1
+    assert cache.stats()["entries"] == 0
+    assert cache.total() == 0
+
+
+def test_eviction_drops_least_recently_used(cache):
+    result = {"success": True, "padding": "x" * 300}
+    for key in "abc":
+        cache.put(key, result)
+    # Reading "a" makes "b" the least recently used entry
+    assert cache.get("a") is not None
+    cache.put("d", result)
+    assert cache.get("b") is None
+    for key in "acd":
+        assert cache.get(key) is not None
+    assert cache.total() <= cache.max_bytes
+
+
+def test_total_follows_upsert_delete_and_clear(cache):
+    small, large = {"v": "x"}, {"v": "x" * 100}
+    cache.put("a", small)
+    cache.put("b", large)
+    assert cache.total() == _size(small) + _size(large) == _summed(cache)
+    cache.put("a", large)
+    assert cache.total() == 2 * _size(large) == _summed(cache)
+    cache.delete("b")
+    assert cache.total() == _size(large) == _summed(cache)
+    cache.clear()
+    assert cache.total() == 0
+    assert cache.stats()["bytes"] == 0
+
+
+def test_total_is_seeded_from_an_existing_table(tmp_path):
+    path = str(tmp_path / "results.sqlite")
+    ResultCache(path).put("a", {"v": 1})
+    reopened = ResultCache(path)
+    assert reopened.total() == _size({"v": 1})
+
+
+@pytest.fixture(scope="module")
+def processor(tmp_path_factory):
+    return OMRProcessor(CONFIG_PATH, cache_dir=str(tmp_path_factory.mktemp("omr_cache")), result_cache_mb=1)
+
+
+def test_result_key_depends_on_the_outputs_asked_for(processor, tmp_path):
+    options = {"save_image": True}
+    key = processor.result_key("digest", "YKS_STANDARD", str(tmp_path / "out"), options)
+    assert key == processor.result_key("digest", "YKS_STANDARD", str(tmp_path / "out"), dict(options))
+    assert key != processor.result_key("digest", "YKS_STANDARD", str(tmp_path / "other"), options)
+    assert key != processor.result_key("digest", "YKS_STANDARD", str(tmp_path / "out"), {"save_image": False})
+    assert key != processor.result_key("digest", "YKS_STANDARD", str(tmp_path / "out"), {**options, "jpeg_quality": 70})
+    assert key != processor.result_key("digest", "LGS_STANDARD", str(tmp_path / "out"), options)
+    assert key != processor.result_key("digest", "YKS_STANDARD", str(tmp_path / "out"), options, page_index=0)
+
+
+def test_cached_result_misses_once_outputs_are_gone(processor, tmp_path):
+    output = tmp_path / "form_processed.jpg"
+    output.write_bytes(b"jpeg")
+    key = processor.result_key("digest", "YKS_STANDARD", str(tmp_path), {})
+    processor.result_cache.put(key, {"success": True, "output_files": [str(output)]})
+    assert processor.cached_result(key, started=0.0) is not None
+    output.unlink()
+    assert processor.cached_result(key, started=0.0) is None
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from omr_roster import MAX_COST, RosterIndex, column_costs
+
+
+THRESHOLD = 0.3
+MARKED, EMPTY, FAINT = 0.8, 0.05, 0.32
+
+
+def grid(number: str, blank=(), fill=MARKED) -> np.ndarray:
+    """digits x columns fill ratios with `number` marked; columns in `blank` left empty"""
+    ratios = np.full((10, len(number)), EMPTY)
+    for column, digit in enumerate(number):
+        if column not in blank:
+            ratios[int(digit), column] = fill
+    return ratios
+
+
+def roster(*numbers: str) -> RosterIndex:
+    return RosterIndex([{"student_number": n, "name": f"Student {n}"} for n in numbers])
+
+
+def test_column_costs_favour_the_marked_digit():
+    costs = column_costs(grid("37"), THRESHOLD)
+    assert costs.shape == (2, 10)
+    assert costs[0, 3] == 0 and costs[1, 7] == 0
+    assert (np.delete(costs[0], 3) > MAX_COST).all()
+    # A blank column says nothing about the digit
+    assert np.allclose(column_costs(grid("3", blank=(0,)), THRESHOLD), 0)
+
+
+def test_exact_read_is_matched():
+    resolved = roster("20240001", "20240002", "20240117").resolve(grid("20240002"), THRESHOLD)
+    assert resolved["match"]["student_number"] == "20240002"
+    assert resolved["match"]["name"] == "Student 20240002"
+    assert resolved["candidates"][0]["cost"] == 0
+
+
+def test_blank_column_is_filled_from_the_only_fitting_number():
+    resolved = roster("20240001", "20240117").resolve(grid("20240117", blank=(6,)), THRESHOLD)
+    assert resolved["match"]["student_number"] == "20240117"
+
+
+def test_faint_column_is_corrected():
+    read = grid("20240117")
+    read[:, 5] = EMPTY
+    read[4, 5] = FAINT
+    resolved = roster("20240117", "20249999").resolve(read, THRESHOLD)
+    assert resolved["match"]["student_number"] == "20240117"
+
+
+def test_ambiguous_blank_column_is_not_matched():
+    resolved = roster("20240001", "20240002").resolve(grid("20240001", blank=(7,)), THRESHOLD)
+    assert resolved["match"] is None
+    assert [c["score"] for c in resolved["candidates"]] == [0.5, 0.5]
+
+
+def test_clearly_marked_digit_is_never_overruled():
+    resolved = roster("20240001").resolve(grid("20240009"), THRESHOLD)
+    assert resolved["match"] is None
+    assert resolved["candidates"][0]["cost"] > MAX_COST
+
+
+def test_unknown_length_is_not_resolved():
+    assert roster("1234").resolve(grid("20240001"), THRESHOLD) is None
+
+
+def test_candidates_are_ordered_by_cost():
+    resolved = roster("1111", "1112", "1122", "2222").resolve(grid("1111"), THRESHOLD, top_k=3)
+    assert [c["student_number"] for c in resolved["candidates"]] == ["1111", "1112", "1122"]
+
+
+def test_invalid_entries_are_rejected():
+    with pytest.raises(ValueError):
+        roster("2024A001")
+    with pytest.raises(ValueError):
+        roster("1234", "1234")
+
+
+def test_load_csv_and_ndjson(tmp_path):
+    csv_path = tmp_path / "roster.csv"
+    csv_path.write_text("student_number,student_id,name\n20240001,s1,Ayşe Yılmaz\n", encoding="utf-8")
+    ndjson_path = tmp_path / "roster.ndjson"
+    ndjson_path.write_text('{"student_number": "20240001", "student_id": "s1"}\n', encoding="utf-8")
+    from_csv, from_ndjson = RosterIndex.load(str(csv_path)), RosterIndex.load(str(ndjson_path))
+    assert from_csv.entries[0] == {"student_number": "20240001", "student_id": "s1", "name": "Ayşe Yılmaz"}
+    assert from_ndjson.by_number == {"20240001": 0}
+    assert from_csv.fingerprint != from_ndjson.fingerprint
@@ -1632,9 +1632,10 @@ import {
   validateStudentNumber,
   createExamResultFromOMR,
   createProcessingJob,
-  updateProcessingJob,
+  resolveProcessingJob,
   getProcessingJobStatus,
   processOMRAsync,
+  OMR_PRIORITY_INTERACTIVE,
   type OMRResult
 } from './services/opticalService';
 
@@ -1690,11 +1691,11 @@ router.post(
         return res.status(400).json({ error: 'Sınav ID gereklidir' });
       }
 
-      // Create processing job
-      const jobId = createProcessingJob(parseInt(examId), req.file.path);
+      // Queue the form ahead of batch uploads
+      const jobId = await createProcessingJob(parseInt(examId), req.file.path, formType, OMR_PRIORITY_INTERACTIVE);
 
-      // Start async processing
-      processOMRAsync(jobId, req.file.path, formType, parseInt(examId))
+      // Follow up once the queue has processed it
+      processOMRAsync(jobId, parseInt(examId))
         .catch(err => console.error('OMR processing error:', err));
 
       return res.json({
@@ -1722,7 +1723,7 @@ router.get(
   async (req: AuthenticatedRequest, res: express.Response) => {
     try {
       const jobId = String(req.params.jobId);
-      const job = getProcessingJobStatus(jobId);
+      const job = await getProcessingJobStatus(jobId);
 
       if (!job) {
         return res.status(404).json({ error: 'İşlem bulunamadı' });
@@ -1777,12 +1778,8 @@ router.post(
         validation.studentId!
       );
 
-      // Update job status
-      updateProcessingJob(jobId, {
-        status: 'COMPLETED',
-        studentNumber,
-        confidence: 1.0
-      });
+      // Record the validated reading as the job's result
+      await resolveProcessingJob(jobId, omrData);
 
       return res.json({
         success: true,
@@ -1853,18 +1850,19 @@ router.post(
 
       const formTypeStr = String(formType);
 
-      const jobs = files.map(file => {
-        const jobId = createProcessingJob(parseInt(examId), file.path);
+      const jobs: { jobId: string; filename: string }[] = [];
+      for (const file of files) {
+        const jobId = await createProcessingJob(parseInt(examId), file.path, formTypeStr);
 
-        // Start async processing
-        processOMRAsync(jobId, file.path, formTypeStr, parseInt(examId))
+        // Follow up once the queue has processed it
+        processOMRAsync(jobId, parseInt(examId))
           .catch(err => console.error('Batch OMR processing error:', err));
 
-        return {
+        jobs.push({
           jobId,
           filename: file.originalname
-        };
-      });
+        });
+      }
 
       return res.json({
         success: true,
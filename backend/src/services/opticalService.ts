@@ -1,7 +1,8 @@
-import { exec } from 'child_process';
+import { exec, spawn, type ChildProcessWithoutNullStreams } from 'child_process';
 import { promisify } from 'util';
 import path from 'path';
 import fs from 'fs/promises';
+import readline from 'readline';
 import { prisma } from '../db';
 
 const execAsync = promisify(exec);
@@ -18,9 +19,25 @@ export interface OMRResult {
     answers_confidence?: number;
     image_path?: string;
     alignment_found?: boolean;
+    student_number_roster?: RosterResolution;
     error?: string;
 }
 
+export interface RosterCandidate {
+    student_number: string;
+    student_id: string | null;
+    name: string | null;
+    cost: number;
+    score: number;
+}
+
+// Present when the OMR script runs with a roster export (OMR_ROSTER_PATH)
+export interface RosterResolution {
+    read: string;
+    match: RosterCandidate | null;
+    candidates: RosterCandidate[];
+}
+
 export interface OMRProcessingJob {
     id: string;
     examId: number;
@@ -32,8 +49,96 @@ export interface OMRProcessingJob {
     errorMessage?: string;
 }
 
-// In-memory job storage (in production, use database)
-const processingJobs = new Map<string, OMRProcessingJob>();
+// Job priorities of the OMR queue: a form someone is waiting on goes ahead of batches
+export const OMR_PRIORITY_BATCH = 0;
+export const OMR_PRIORITY_INTERACTIVE = 10;
+
+const QUEUE_STATUS: Record<string, OMRProcessingJob['status']> = {
+    queued: 'PENDING',
+    running: 'PROCESSING',
+    done: 'COMPLETED',
+    failed: 'FAILED',
+    cancelled: 'FAILED'
+};
+
+/**
+ * Client for the durable OMR job queue (python-scripts/omr_queue.py serve).
+ * Jobs are kept in the queue's SQLite file instead of in this process, so they survive
+ * a backend restart, and run on a fixed pool of warm workers. The service is started on
+ * first use and again after it exits; queued jobs wait in the file meanwhile.
+ */
+class OMRQueueClient {
+    private child: ChildProcessWithoutNullStreams | null = null;
+    private nextId = 1;
+    private pending = new Map<number, { resolve: (response: any) => void; reject: (error: Error) => void }>();
+
+    private start(): ChildProcessWithoutNullStreams {
+        const scriptsDir = path.join(__dirname, '../../python-scripts');
+        const args = [
+            path.join(scriptsDir, 'omr_queue.py'), 'serve',
+            '--config', path.join(scriptsDir, 'omr_config.json'),
+            '--output', path.join(__dirname, '../../uploads/omr-processed')
+        ];
+        if (process.env.OMR_QUEUE_WORKERS) {
+            args.push('--workers', process.env.OMR_QUEUE_WORKERS);
+        }
+        // With a roster export, student numbers are resolved against it
+        if (process.env.OMR_ROSTER_PATH) {
+            args.push('--roster', process.env.OMR_ROSTER_PATH);
+        }
+
+        const child = spawn('python', args);
+        readline.createInterface({ input: child.stdout }).on('line', line => {
+            let response: any;
+            try {
+                response = JSON.parse(line);
+            } catch {
+                console.error('OMR queue sent an invalid response:', line);
+                return;
+            }
+            const waiter = this.pending.get(response.id);
+            if (waiter) {
+                this.pending.delete(response.id);
+                waiter.resolve(response);
+            }
+        });
+        child.stderr.on('data', data => console.error('OMR queue:', data.toString().trim()));
+        child.stdin.on('error', error => this.stopped(child, error));
+        child.on('error', error => this.stopped(child, error));
+        child.on('exit', code => this.stopped(child, new Error(`OMR queue service exited with code ${code}`)));
+        this.child = child;
+        return child;
+    }
+
+    private stopped(child: ChildProcessWithoutNullStreams, error: Error): void {
+        if (this.child !== child) {
+            return;
+        }
+        this.child = null;
+        for (const waiter of this.pending.values()) {
+            waiter.reject(error);
+        }
+        this.pending.clear();
+    }
+
+    request(payload: Record<string, unknown>, timeoutMs: number = 30000): Promise<any> {
+        const child = this.child ?? this.start();
+        const id = this.nextId++;
+        return new Promise((resolve, reject) => {
+            const timer = setTimeout(() => {
+                this.pending.delete(id);
+                reject(new Error('OMR queue service did not answer'));
+            }, timeoutMs);
+            this.pending.set(id, {
+                resolve: response => { clearTimeout(timer); resolve(response); },
+                reject: error => { clearTimeout(timer); reject(error); }
+            });
+            child.stdin.write(JSON.stringify({ ...payload, id }) + '\n');
+        });
+    }
+}
+
+const omrQueue = new OMRQueueClient();
 
 /**
  * Process a scanned OMR form using Python script
@@ -57,8 +162,10 @@ export async function processStandardOMR(
             throw new Error('OMR Python script not found');
         }
 
-        // Execute Python script
-        const command = `python "${scriptPath}" "${imagePath}" "${formType}" "${configPath}" "${outputDir}"`;
+        // Execute Python script; with a roster export, student numbers are resolved against it
+        const rosterPath = process.env.OMR_ROSTER_PATH;
+        const rosterArg = rosterPath ? ` --roster "${rosterPath}"` : '';
+        const command = `python "${scriptPath}" "${imagePath}" "${formType}" "${configPath}" "${outputDir}"${rosterArg}`;
 
         const { stdout, stderr } = await execAsync(command, {
             timeout: 30000, // 30 second timeout
@@ -204,86 +311,94 @@ export async function createExamResultFromOMR(
 }
 
 /**
- * Create a processing job and return job ID
+ * Queue a scanned form for processing and return the job ID
  */
-export function createProcessingJob(examId: number, imagePath: string): string {
+export async function createProcessingJob(
+    examId: number,
+    imagePath: string,
+    formType: string = 'YKS_STANDARD',
+    priority: number = OMR_PRIORITY_BATCH
+): Promise<string> {
     const jobId = `omr_${Date.now()}_${Math.random().toString(36).substr(2, 9)}`;
 
-    const job: OMRProcessingJob = {
-        id: jobId,
-        examId,
-        imagePath,
-        status: 'PENDING'
-    };
-
-    processingJobs.set(jobId, job);
+    const response = await omrQueue.request({
+        cmd: 'submit',
+        job_id: jobId,
+        priority,
+        request: { image_path: path.resolve(imagePath), template_name: formType, exam_id: examId }
+    });
+    if (!response.success) {
+        throw new Error(response.error || 'OMR job could not be queued');
+    }
     return jobId;
 }
 
 /**
- * Update processing job status
+ * Replace a finished job's result with a manually validated one
  */
-export function updateProcessingJob(
-    jobId: string,
-    updates: Partial<OMRProcessingJob>
-): void {
-    const job = processingJobs.get(jobId);
-    if (job) {
-        Object.assign(job, updates);
-        processingJobs.set(jobId, job);
+export async function resolveProcessingJob(jobId: string, result: OMRResult): Promise<void> {
+    const response = await omrQueue.request({ cmd: 'resolve', job_id: jobId, result });
+    if (!response.success) {
+        throw new Error(response.error || 'OMR job could not be updated');
     }
 }
 
 /**
  * Get processing job status
  */
-export function getProcessingJobStatus(jobId: string): OMRProcessingJob | undefined {
-    return processingJobs.get(jobId);
+export async function getProcessingJobStatus(jobId: string): Promise<OMRProcessingJob | undefined> {
+    const response = await omrQueue.request({ cmd: 'status', job_id: jobId });
+    if (!response.success) {
+        return undefined;
+    }
+
+    const job = response.job;
+    const result: OMRResult | null = job.result;
+    return {
+        id: job.id,
+        examId: job.request.exam_id,
+        imagePath: job.request.image_path,
+        status: QUEUE_STATUS[job.status],
+        studentNumber: result?.student_number_detected,
+        confidence: result?.confidence_score,
+        rawData: result ?? undefined,
+        errorMessage: job.status === 'cancelled' ? 'Cancelled' : job.error ?? undefined
+    };
 }
 
 /**
- * Process OMR form asynchronously
+ * Wait for a queued job to finish
  */
-export async function processOMRAsync(
-    jobId: string,
-    imagePath: string,
-    formType: string,
-    examId: number
-): Promise<void> {
-    try {
-        updateProcessingJob(jobId, { status: 'PROCESSING' });
-
-        // Process the form
-        const omrResult = await processStandardOMR(imagePath, formType);
-
-        if (!omrResult.success) {
-            updateProcessingJob(jobId, {
-                status: 'FAILED',
-                errorMessage: omrResult.error
-            });
-            return;
-        }
-
-        // Validate student number
-        const validation = await validateStudentNumber(omrResult.student_number_detected || '');
-
-        updateProcessingJob(jobId, {
-            status: 'COMPLETED',
-            studentNumber: omrResult.student_number_detected,
-            confidence: omrResult.confidence_score,
-            rawData: omrResult
-        });
-
-        // If student is valid and confidence is high, auto-create exam result
-        if (validation.valid && omrResult.confidence_score && omrResult.confidence_score > 0.85) {
-            // Auto-create exam result (answer key would need to be fetched)
-            // This can be implemented based on your exam structure
+async function waitForProcessingJob(jobId: string, pollMs: number = 2000): Promise<OMRProcessingJob | undefined> {
+    for (;;) {
+        const job = await getProcessingJobStatus(jobId);
+        if (!job || job.status === 'COMPLETED' || job.status === 'FAILED') {
+            return job;
         }
+        await new Promise(resolve => setTimeout(resolve, pollMs));
+    }
+}
 
-    } catch (error: any) {
-        updateProcessingJob(jobId, {
-            status: 'FAILED',
-            errorMessage: error.message
-        });
+/**
+ * Follow up on a queued form once the queue has processed it
+ */
+export async function processOMRAsync(jobId: string, examId: number): Promise<void> {
+    const job = await waitForProcessingJob(jobId);
+    if (!job || job.status !== 'COMPLETED' || !job.rawData) {
+        return;
+    }
+    const omrResult: OMRResult = job.rawData;
+
+    // Validate student number. A roster match that carries the student's user id needs no
+    // query; without one, the resolved number is looked up like a detected one.
+    const rosterMatch = omrResult.student_number_roster?.match;
+    const validation = rosterMatch?.student_id
+        ? { valid: true, studentId: rosterMatch.student_id, studentName: rosterMatch.name ?? undefined }
+        : await validateStudentNumber(rosterMatch?.student_number || omrResult.student_number_detected || '');
+
+    // If student is valid and confidence is high, auto-create exam result
+    if (validation.valid && omrResult.confidence_score && omrResult.confidence_score > 0.85) {
+        // Auto-create exam result for examId (answer key would need to be fetched)
+        // This can be implemented based on your exam structure
     }
 }